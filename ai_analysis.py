@@ -0,0 +1,273 @@
+import asyncio, datetime, hashlib, json, os
+from abc import ABC, abstractmethod
+from typing import Optional
+import httpx
+import numpy as np
+from sqlalchemy import or_, update
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+import crud, models, results_store, timeseries, progress_bus
+from database import AsyncSessionLocal, SessionLocal
+
+load_dotenv()
+
+# --- Provider configuration ---
+# http: an OpenAI-compatible chat completions endpoint; stub: offline, deterministic report
+AI_API_KEY = os.getenv("AI_API_KEY", "")
+AI_PROVIDER = os.getenv("AI_PROVIDER", "http" if AI_API_KEY else "stub")
+AI_API_URL = os.getenv("AI_API_URL", "https://api.openai.com/v1/chat/completions")
+AI_MODEL = os.getenv("AI_MODEL", "gpt-4o-mini")
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", 60))
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", 10))
+AI_STUB_DELAY = float(os.getenv("AI_STUB_DELAY", 0))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+# A job runs at most this long; an older PENDING/RUNNING claim belongs to a dead process and may be taken over
+AI_JOB_STALE_SECONDS = float(os.getenv("AI_JOB_STALE_SECONDS", max(5 * AI_TIMEOUT_SECONDS, 300)))
+# Bump when the summary or prompt changes so cached analyses are regenerated
+PROMPT_VERSION = "1"
+
+ANALYSIS_KEY = "ai_analysis"
+ERROR_KEY = "ai_analysis_error"
+
+SYSTEM_PROMPT = (
+    "You are a machining process engineer. You receive a statistical summary of a cutting "
+    "simulation (tool temperature, stress and wear over time) and its key metrics. Write a short "
+    "report: overall assessment, notable trends or abrupt changes, risks for tool life, and "
+    "concrete parameter recommendations. Use plain text with short sections."
+)
+
+
+# --- Shared HTTP client (one connection pool for every analysis in this process) ---
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=AI_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=AI_MAX_CONNECTIONS, max_keepalive_connections=AI_MAX_CONNECTIONS),
+        )
+    return _client
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose(); _client = None
+
+
+# --- Providers ---
+
+def build_prompt(summary: dict, metrics: dict) -> str:
+    return (
+        f"Key metrics: {json.dumps(metrics, separators=(',', ':'))}\n"
+        f"Time-series summary (per field: stats, trend segments, change points): {json.dumps(summary, separators=(',', ':'))}"
+    )
+
+class AnalysisProvider(ABC):
+    """Turns a time-series summary and key metrics into report text."""
+    name = "base"
+    model = ""
+
+    @abstractmethod
+    async def analyze(self, summary: dict, metrics: dict) -> str: ...
+
+class HTTPChatProvider(AnalysisProvider):
+    name = "http"
+
+    def __init__(self, url: str = AI_API_URL, api_key: str = AI_API_KEY, model: str = AI_MODEL):
+        self.url, self.api_key, self.model = url, api_key, model
+
+    async def analyze(self, summary: dict, metrics: dict) -> str:
+        response = await get_client().post(
+            self.url,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={
+                "model": self.model,
+                "temperature": 0.2,
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": build_prompt(summary, metrics)},
+                ],
+            },
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+class StubProvider(AnalysisProvider):
+    """Offline provider for development, tests and benchmarks: a templated report from the summary."""
+    name = "stub"
+    model = "stub"
+
+    def __init__(self, delay: float = AI_STUB_DELAY):
+        self.delay = delay
+
+    async def analyze(self, summary: dict, metrics: dict) -> str:
+        if self.delay: await asyncio.sleep(self.delay)
+        lines = [f"Automated summary of {summary['points']} samples.", ""]
+        lines += [f"{k}: {v}" for k, v in metrics.items()]
+        for name, stats in summary["fields"].items():
+            if not stats.get("samples", 1): continue
+            directions = "/".join(s["direction"] for s in stats["trend"])
+            lines.append(f"{name}: {stats['min']} .. {stats['max']} (mean {stats['mean']}), trend {directions}.")
+            for cp in stats["change_points"]:
+                lines.append(f"  abrupt change at t={cp['time']}: {cp['before']} -> {cp['after']}")
+        return "\n".join(lines)
+
+PROVIDERS = {"http": HTTPChatProvider, "stub": StubProvider}
+_provider: Optional[AnalysisProvider] = None
+
+def register_provider(name: str, factory) -> None:
+    PROVIDERS[name] = factory
+
+def get_provider() -> AnalysisProvider:
+    global _provider
+    if _provider is None:
+        if AI_PROVIDER not in PROVIDERS: raise ValueError(f"Unknown AI_PROVIDER '{AI_PROVIDER}' (one of {', '.join(PROVIDERS)}).")
+        _provider = PROVIDERS[AI_PROVIDER]()
+    return _provider
+
+
+# --- Summarization and cache ---
+
+def summarize_columns(columns: dict) -> dict:
+    numeric = {k: np.asarray(v, dtype=np.float64) for k, v in columns.items() if isinstance(v, np.ndarray)}
+    if not numeric: return {"points": 0, "time": {}, "fields": {}}
+    time_field = timeseries.find_time_field(numeric)
+    n = len(next(iter(numeric.values())))
+    x = numeric.pop(time_field) if time_field else np.arange(n, dtype=np.float64)
+    return timeseries.summarize(x, numeric, time_field)
+
+def results_hash(db_simulation, summary: dict) -> str:
+    """
+    Cache identity of a run's results; identical results share analyses. The summary plus the
+    input fingerprint (same inputs, tool and engine image -> same time series) when there is one,
+    else the decoded time-series columns. Never the .npz bytes: zip member timestamps differ
+    between identical runs.
+    """
+    digest = hashlib.sha256()
+    clean = {k: v for k, v in summary.items() if k not in (ANALYSIS_KEY, ERROR_KEY)}
+    digest.update(json.dumps(clean, sort_keys=True).encode("utf-8"))
+    if db_simulation.input_fingerprint:
+        digest.update(f"fingerprint:{db_simulation.input_fingerprint}".encode("ascii"))
+    elif db_simulation.timeseries_path:
+        # Legacy rows carry their time series inside the summary, already hashed above
+        for field, values in sorted(results_store.load_columns(db_simulation).items()):
+            values = np.ascontiguousarray(values)
+            digest.update(f"{field}:{values.dtype.str}:{values.shape}".encode("utf-8"))
+            digest.update(values.tobytes() if values.dtype != object else json.dumps(values.tolist()).encode("utf-8"))
+    return digest.hexdigest()
+
+def cache_key(results_digest: str) -> str:
+    provider = get_provider()
+    return f"ai_analysis:{PROMPT_VERSION}:{provider.name}:{provider.model}:{results_digest}"
+
+async def cache_get(key: str) -> Optional[str]:
+    try: return await progress_bus.get_async_client().get(key)
+    except Exception as e:
+        print(f"AI analysis cache unavailable: {e}"); return None
+
+async def cache_set(key: str, analysis: str) -> None:
+    try: await progress_bus.get_async_client().set(key, analysis, ex=AI_CACHE_TTL_SECONDS)
+    except Exception as e: print(f"AI analysis cache unavailable: {e}")
+
+
+# --- Background jobs ---
+# A job is claimed in the database first (analysis_status PENDING + analysis_started_at), so one
+# simulation is analyzed by one process at a time however many API workers there are; the task
+# itself runs in the claiming process.
+
+IN_FLIGHT_STATUSES = ("PENDING", "RUNNING")
+
+def _stale_before() -> datetime.datetime:
+    return datetime.datetime.now() - datetime.timedelta(seconds=AI_JOB_STALE_SECONDS)
+
+def in_progress(db_simulation) -> bool:
+    """A live claim: PENDING/RUNNING and claimed recently enough that its process may still run it."""
+    started = db_simulation.analysis_started_at
+    return db_simulation.analysis_status in IN_FLIGHT_STATUSES and started is not None and started >= _stale_before()
+
+async def claim(db, simulation_id: int) -> bool:
+    """Marks the analysis PENDING unless a live claim exists (conditional UPDATE). True when the caller should run it."""
+    column, started = models.Simulation.analysis_status, models.Simulation.analysis_started_at
+    result = await db.execute(update(models.Simulation).where(
+        models.Simulation.id == simulation_id,
+        or_(column.is_(None), column.notin_(IN_FLIGHT_STATUSES), started.is_(None), started < _stale_before()),
+    ).values(analysis_status="PENDING", analysis_started_at=datetime.datetime.now()))
+    await db.commit()
+    return result.rowcount == 1
+
+def reset_stale() -> int:
+    """Clears PENDING/RUNNING analyses whose process died (e.g. a restart) so clients can start them again."""
+    db = SessionLocal()
+    try:
+        column, started = models.Simulation.analysis_status, models.Simulation.analysis_started_at
+        count = db.execute(update(models.Simulation).where(
+            column.in_(IN_FLIGHT_STATUSES), or_(started.is_(None), started < _stale_before())
+        ).values(analysis_status=None)).rowcount
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+_jobs: dict[int, asyncio.Task] = {}
+_generations: dict[str, asyncio.Task] = {}
+
+def is_running(simulation_id: int) -> bool:
+    task = _jobs.get(simulation_id)
+    return task is not None and not task.done()
+
+def start(simulation_id: int, key: str) -> None:
+    """Runs the analysis of one simulation in the background (no-op if already running here)."""
+    if is_running(simulation_id): return
+    task = asyncio.create_task(_run_job(simulation_id, key))
+    _jobs[simulation_id] = task
+    task.add_done_callback(lambda _: _jobs.pop(simulation_id, None))
+
+async def _generate(key: str, columns: dict, metrics: dict) -> str:
+    # Simulations with identical results that are analyzed at the same time share one provider call
+    task = _generations.get(key)
+    if task is None:
+        async def generate():
+            summary = await run_in_threadpool(summarize_columns, columns)
+            analysis = await get_provider().analyze(summary, metrics)
+            await cache_set(key, analysis)
+            return analysis
+        task = asyncio.create_task(generate())
+        _generations[key] = task
+        task.add_done_callback(lambda _: _generations.pop(key, None))
+    return await asyncio.shield(task)
+
+async def _run_job(simulation_id: int, key: str) -> None:
+    async with AsyncSessionLocal() as db:
+        db_sim = await crud.get_simulation_async(db, simulation_id, with_results=True)
+        if db_sim is None: return
+        summary = results_store.load_summary(db_sim) or {}
+        try:
+            db_sim.analysis_status = "RUNNING"
+            await db.commit()
+            # Artifact decompression is file I/O + CPU: keep it off the event loop
+            columns = await run_in_threadpool(results_store.load_columns, db_sim, None, summary)
+            if not columns: raise ValueError("No time-series data.")
+            metrics = results_store.stored_metrics(db_sim)
+            if metrics is None:
+                # Row completed before metrics were indexed: compute and backfill them once
+                metrics = results_store.compute_metrics(summary, columns)
+                results_store.apply_metrics(db_sim, metrics)
+            # Bounded so the claim never outlives the job: past AI_JOB_STALE_SECONDS another process may take over
+            summary[ANALYSIS_KEY] = await asyncio.wait_for(_generate(key, columns, metrics), AI_JOB_STALE_SECONDS)
+            summary.pop(ERROR_KEY, None)
+            db_sim.analysis_status = "COMPLETED"
+        except Exception as e:
+            print(f"AI analysis of simulation {simulation_id} failed: {e!r}")
+            summary[ERROR_KEY] = str(e) or type(e).__name__
+            db_sim.analysis_status = "FAILED"
+        db_sim.results = json.dumps(summary)
+        await db.commit()
+
+def store(db_simulation, summary: dict, analysis: str) -> None:
+    """Attaches an analysis (e.g. a cache hit) to the simulation's results; the caller commits."""
+    summary[ANALYSIS_KEY] = analysis
+    summary.pop(ERROR_KEY, None)
+    db_simulation.results = json.dumps(summary)
+    db_simulation.analysis_status = "COMPLETED"
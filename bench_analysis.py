@@ -0,0 +1,49 @@
+"""
+Benchmark for the AI analysis pipeline, fully offline (stub provider, no network).
+
+    python bench_analysis.py [samples ...]      default: 10000 100000 1000000
+
+For each size it reports the prompt size of the raw time series (what used to be sent)
+versus the statistical summary, the summarization time, and the wall time of
+20 concurrent analyses through the stub provider (AI_STUB_DELAY seconds each).
+"""
+import asyncio, json, sys, time
+import numpy as np
+import ai_analysis, results_store
+
+CONCURRENT = 20
+
+
+def synthetic_columns(samples: int) -> dict:
+    t = np.linspace(0, 2.0, samples)
+    rng = np.random.default_rng(0)
+    temp = 20 + 600 * (1 - np.exp(-3 * t)) + rng.normal(0, 2, samples)
+    temp[samples * 2 // 3:] += 80  # an abrupt change the summary should report
+    return {
+        "time_s": t,
+        "max_temperature_C": temp,
+        "max_stress_MPa": 450 + 30 * np.sin(t * 40) + rng.normal(0, 5, samples),
+        "total_accumulated_wear_m": np.cumsum(np.abs(rng.normal(1e-9, 1e-10, samples))),
+    }
+
+async def concurrent_analyses(summary: dict, metrics: dict) -> float:
+    provider = ai_analysis.StubProvider(delay=ai_analysis.AI_STUB_DELAY or 0.2)
+    start = time.perf_counter()
+    await asyncio.gather(*(provider.analyze(summary, metrics) for _ in range(CONCURRENT)))
+    return time.perf_counter() - start
+
+def main(sizes: list[int]) -> None:
+    print(f"{'samples':>10} {'raw prompt KB':>14} {'summary KB':>11} {'summarize ms':>13} {f'{CONCURRENT} analyses s':>16}")
+    for samples in sizes:
+        columns = synthetic_columns(samples)
+        raw = len(json.dumps(results_store.columns_to_records(columns)))
+        start = time.perf_counter()
+        summary = ai_analysis.summarize_columns(columns)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics = results_store.compute_metrics({}, columns)
+        prompt = ai_analysis.build_prompt(summary, metrics)
+        wall = asyncio.run(concurrent_analyses(summary, metrics))
+        print(f"{samples:>10} {raw / 1024:>14.0f} {len(prompt) / 1024:>11.1f} {elapsed_ms:>13.1f} {wall:>16.2f}")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000])
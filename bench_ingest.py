@@ -0,0 +1,66 @@
+"""
+Benchmark for worker result ingest: json.load + results_store.save_results versus
+the streaming results_ingest.save_results_file, on a synthetic output.json.
+
+    python bench_ingest.py [samples ...]      default: 100000 500000 2000000
+
+Each run happens in a fresh subprocess so peak RSS (Unix only) is measured per method.
+Peak RSS of the streaming ingest should stay roughly flat as the file grows.
+"""
+import json, math, os, subprocess, sys, tempfile, time
+
+FIELDS = ("max_temperature_C", "max_stress_MPa", "total_accumulated_wear_m", "max_strain", "chip_thickness_mm")
+
+
+def write_output(path: str, samples: int) -> None:
+    # Written record by record so generating a large file does not need the memory being measured
+    with open(path, "w") as f:
+        f.write('{"tool_life_prediction": {"predicted_hours": 1.25}, "time_series_data": [')
+        for i in range(samples):
+            record = {"time_s": i * 1e-4, "step": i}
+            for j, field in enumerate(FIELDS): record[field] = 100 + j + math.sin(i / (7 + j))
+            f.write(("," if i else "") + json.dumps(record))
+        f.write("]}")
+
+def measure(method: str, path: str) -> dict:
+    """Runs in the child process."""
+    import resource
+    import results_store, results_ingest
+
+    class Row: id = 0
+    row = Row()
+    start = time.perf_counter()
+    if method == "json.load":
+        with open(path, "r") as f:
+            results_store.save_results(row, json.load(f))
+    else:
+        results_ingest.save_results_file(row, path)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"seconds": round(elapsed, 2), "peak_rss_mb": round(peak_kb / 1024, 1), "points": row.timeseries_points}
+
+def main(sizes: list[int]) -> None:
+    work = tempfile.mkdtemp(prefix="bench_ingest_")
+    env = {**os.environ, "RESULTS_DIR": os.path.join(work, "results")}
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'samples':>10} {'file MB':>8} {'method':>10} {'seconds':>8} {'peak RSS MB':>12}")
+    for samples in sizes:
+        path = os.path.join(work, f"output_{samples}.json")
+        write_output(path, samples)
+        size_mb = os.path.getsize(path) / 1e6
+        for method in ("json.load", "streaming"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", method, path],
+                capture_output=True, text=True, env=env, cwd=here
+            )
+            if out.returncode != 0:
+                print(out.stderr, file=sys.stderr); sys.exit(1)
+            r = json.loads(out.stdout)
+            print(f"{samples:>10} {size_mb:>8.1f} {method:>10} {r['seconds']:>8} {r['peak_rss_mb']:>12}")
+        os.remove(path)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+    else:
+        main([int(a) for a in sys.argv[1:]] or [100000, 500000, 2000000])
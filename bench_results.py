@@ -0,0 +1,76 @@
+"""
+Benchmark for GET /simulations/{id} response building: the previous path (results decoded,
+re-encoded into a string, then the model serialized again) versus the byte-level path of
+read_simulation, for both results_format=string and results_format=object.
+
+    python bench_results.py [samples ...]      default: 10000 100000 500000
+
+Reported per method: milliseconds per response (CPU, single thread) and payload size.
+Runs against a throwaway RESULTS_DIR; no database or server is needed.
+"""
+import json, math, os, sys, tempfile, time
+
+os.environ.setdefault("RESULTS_DIR", tempfile.mkdtemp(prefix="bench_results_"))
+import fast_json, results_store, schemas
+
+# Same as main.SIMULATION_DETAIL_FIELDS (importing main would need the database and broker)
+SIMULATION_DETAIL_FIELDS = [f for f in schemas.Simulation.model_fields if f != "results"]
+
+REPEAT = 5
+
+
+class Row:
+    """Stand-in for a models.Simulation row with the columns the response reads."""
+    name, description, status, owner_id, tool_id = "bench", "benchmark run", "COMPLETED", 1, None
+    reused_from_id = material_properties = queue = queued_at = started_at = finished_at = analysis_status = None
+
+    def __init__(self, simulation_id: int):
+        self.id = simulation_id
+
+
+def make_rows(samples: int) -> dict:
+    ts = [{"time_s": i * 1e-4, "step": i, "max_temperature_C": 20 + 600 * (1 - math.exp(-i / samples * 6)),
+           "max_stress_MPa": 450 + 30 * math.sin(i / 50), "total_accumulated_wear_m": i * 1e-10} for i in range(samples)]
+    document = {"tool_life_prediction": {"predicted_hours": 1.25}, "time_series_data": ts}
+    artifact = Row(samples)
+    results_store.save_results(artifact, document)
+    legacy = Row(samples + 1)
+    legacy.results, legacy.timeseries_path, legacy.timeseries_points = json.dumps(document), None, samples
+    for metric in ("life_hours", "max_temp_C", "max_stress_MPa", "wear_microns"): setattr(legacy, metric, getattr(artifact, metric))
+    return {"artifact": artifact, "legacy": legacy}
+
+def previous(row) -> bytes:
+    sim = schemas.Simulation.model_validate(row)
+    if row.timeseries_path: sim.results = json.dumps(results_store.load_results(row))
+    # FastAPI: response_model serialization, then JSONResponse.render
+    return json.dumps(sim.model_dump(mode="json"), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def passthrough(row, results_format: str) -> bytes:
+    results = results_store.results_json(row)
+    if results is not None and results_format == "string": results = fast_json.dumps(results.decode("utf-8"))
+    meta = fast_json.dumps({f: getattr(row, f) for f in SIMULATION_DETAIL_FIELDS})
+    return fast_json.splice(meta, "results", results)
+
+def timed(fn) -> tuple[float, int]:
+    body = fn()
+    start = time.process_time()
+    for _ in range(REPEAT): fn()
+    return (time.process_time() - start) / REPEAT * 1000, len(body)
+
+def main(sizes: list[int]) -> None:
+    encoder = "orjson" if fast_json.orjson is not None else "json (orjson not installed)"
+    print(f"encoder: {encoder}")
+    print(f"{'samples':>10} {'row':>9} {'method':>16} {'ms/response':>12} {'payload KB':>11}")
+    for samples in sizes:
+        for kind, row in make_rows(samples).items():
+            methods = {
+                "previous": lambda: previous(row),
+                "string": lambda: passthrough(row, "string"),
+                "object": lambda: passthrough(row, "object"),
+            }
+            for method, fn in methods.items():
+                ms, size = timed(fn)
+                print(f"{samples:>10} {kind:>9} {method:>16} {ms:>12.1f} {size / 1024:>11.0f}")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10000, 100000, 500000])
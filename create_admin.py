@@ -1,9 +1,9 @@
 from database import SessionLocal, engine
-import models, security
+import models, security, schema_upgrade
 import sys
 
-# Create the database tables if they don't exist
-models.Base.metadata.create_all(bind=engine)
+# Create the database tables if they don't exist, and upgrade an existing database
+schema_upgrade.upgrade(engine)
 
 def create_super_admin():
     db = SessionLocal()
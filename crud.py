@@ -1,18 +1,32 @@
-import json
-from sqlalchemy.orm import Session
-import models, schemas, security
+import json, base64, math, secrets
+from typing import Optional
+from sqlalchemy import and_, or_, select, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload, undefer
+import models, schemas, security, material_library, email_service, email_outbox
+from principal_cache import cache as principal_cache
 import datetime
 
 # --- User CRUD ---
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+# schemas.User nests every simulation with its large columns: one extra SELECT for all of them
+# instead of a lazy load per simulation and deferred column
+_WITH_SIMULATIONS = selectinload(models.User.simulations).undefer_group("large")
+
+def get_user(db: Session, user_id: int, with_simulations: bool = False):
+    query = db.query(models.User).filter(models.User.id == user_id)
+    if with_simulations: query = query.options(_WITH_SIMULATIONS)
+    return query.first()
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
 def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+    return db.query(models.User).options(_WITH_SIMULATIONS).offset(skip).limit(limit).all()
 
 def admin_create_user(db: Session, user: schemas.AdminUserCreate):
     salt = security.get_random_salt() 
@@ -44,6 +58,7 @@ def admin_update_user(db: Session, user_id: int, user_update: schemas.AdminUserU
         setattr(db_user, key, value)
         
     db.commit()
+    principal_cache.invalidate(db_user.email)
     db.refresh(db_user)
     return db_user
 
@@ -59,6 +74,7 @@ def admin_reset_user_password(db: Session, user_id: int, new_password: str):
     db_user.salt = new_salt
     
     db.commit()
+    principal_cache.invalidate(db_user.email)
     return db_user
 
 # --- NEW: Function to delete a user ---
@@ -71,6 +87,7 @@ def delete_user(db: Session, user_id: int):
     # For now, we just delete the user.
     db.delete(db_user)
     db.commit()
+    principal_cache.invalidate(db_user.email)
     return db_user
 # -----------------------------------
 
@@ -107,6 +124,315 @@ def create_user_simulation(db: Session, simulation: schemas.SimulationCreate, us
     db.refresh(db_simulation)
     return db_simulation
 
+async def get_simulation_async(db: AsyncSession, simulation_id: int, with_results: bool = False):
+    """Async lookup; `with_results` loads the deferred results column in the same query."""
+    stmt = select(models.Simulation).where(models.Simulation.id == simulation_id)
+    if with_results: stmt = stmt.options(undefer(models.Simulation.results))
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def get_active_simulations_async(db: AsyncSession, user_id: int, terminal_statuses=("COMPLETED", "FAILED")):
+    result = await db.execute(select(models.Simulation).where(
+        models.Simulation.owner_id == user_id, models.Simulation.status.notin_(terminal_statuses)
+    ))
+    return result.scalars().all()
+
+# --- Simulation listing (keyset pagination + column projection) ---
+SIMULATION_METRIC_FIELDS = ["life_hours", "max_temp_C", "max_stress_MPa", "wear_microns"]
+SIMULATION_LIST_FIELDS = ["id", "name", "description", "status", "owner_id", "tool_id", "timeseries_points", *SIMULATION_METRIC_FIELDS, "results", "material_properties"]
+SIMULATION_ORDER_FIELDS = ["id", *SIMULATION_METRIC_FIELDS]
+# Large text columns are only read when explicitly requested via ?fields=
+SIMULATION_LARGE_FIELDS = {"results", "material_properties"}
+SIMULATION_DEFAULT_FIELDS = [f for f in SIMULATION_LIST_FIELDS if f not in SIMULATION_LARGE_FIELDS]
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def _cursor_value(value, kind) -> bool:
+    # Cursors come from the client: only values the keyset filter can bind (64-bit ints, finite floats)
+    if isinstance(value, bool): return False
+    if kind is str: return isinstance(value, str)
+    if isinstance(value, int): return -2 ** 63 <= value < 2 ** 63
+    return kind is float and isinstance(value, float) and math.isfinite(value)
+
+def decode_cursor(cursor: str, *kinds) -> list:
+    """
+    Decodes a cursor holding one value per type in `kinds` (str, int, or float which also
+    accepts ints). Raises ValueError on a malformed cursor or one of another shape.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != len(kinds) or not all(_cursor_value(v, k) for v, k in zip(values, kinds)):
+        raise ValueError("Invalid cursor.")
+    return values
+
+def get_simulations_page(
+    db: Session, user_id: int, fields: list[str], limit: int = 100, cursor: Optional[str] = None,
+    order_by: str = "id", descending: bool = False, ranges: Optional[dict] = None
+):
+    """
+    Returns (rows, next_cursor) for the user's simulations ordered by `order_by`, then id.
+    Only the requested columns are selected, so unrequested large columns never leave the DB.
+    `ranges` maps a metric column to an inclusive (min, max) pair; either bound may be None.
+    Ordering by a metric only returns rows that have it (i.e. completed runs).
+    """
+    sort_col = getattr(models.Simulation, order_by)
+    id_col = models.Simulation.id
+    columns = [getattr(models.Simulation, f) for f in dict.fromkeys(["id", order_by, *fields])]
+    query = db.query(*columns).filter(models.Simulation.owner_id == user_id)
+    for name, (lo, hi) in (ranges or {}).items():
+        col = getattr(models.Simulation, name)
+        if lo is not None: query = query.filter(col >= lo)
+        if hi is not None: query = query.filter(col <= hi)
+    if order_by != "id":
+        query = query.filter(sort_col.isnot(None))
+
+    if cursor:
+        if order_by == "id":
+            [last_id] = decode_cursor(cursor, int)
+            query = query.filter(id_col < last_id if descending else id_col > last_id)
+        else:
+            last_value, last_id = decode_cursor(cursor, float, int)
+            if descending:
+                query = query.filter(or_(sort_col < last_value, and_(sort_col == last_value, id_col < last_id)))
+            else:
+                query = query.filter(or_(sort_col > last_value, and_(sort_col == last_value, id_col > last_id)))
+
+    ordering = [sort_col.desc(), id_col.desc()] if descending else [sort_col.asc(), id_col.asc()]
+    if order_by == "id": ordering = ordering[:1]
+    rows = [row._asdict() for row in query.order_by(*ordering).limit(limit + 1).all()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last["id"]] if order_by == "id" else [last[order_by], last["id"]])
+    for row in rows:
+        for key in set(row) - set(fields): row.pop(key)
+    return rows, next_cursor
+
+# --- Admin overview (grouped aggregates instead of per-user relationship loads) ---
+# Statuses counted as "running jobs": waiting in a queue or executing
+ACTIVE_STATUSES = ("PENDING", "RUNNING")
+# Subscriptions ending within this many days are reported as "expiring"
+SUBSCRIPTION_EXPIRING_DAYS = 7
+SUBSCRIPTION_STATUSES = ("admin", "unlimited", "active", "expiring", "expired")
+# Users read and updated per statement by bulk_update_subscriptions
+SUBSCRIPTION_UPDATE_PAGE = 1000
+
+def _email_prefix(query, prefix: str):
+    # LIKE 'prefix%' (wildcards in the prefix escaped) is right under any collation; Postgres serves
+    # it from ix_users_email_pattern. SQLite only uses an index for a case-sensitive LIKE, so it also
+    # gets the equivalent range, which is exact under its byte-order collation and uses the email index.
+    query = query.filter(models.User.email.startswith(prefix, autoescape=True))
+    if query.session.get_bind().dialect.name == "sqlite":
+        query = query.filter(models.User.email >= prefix, models.User.email < prefix + "\U0010ffff")
+    return query
+
+def _subscription_filter(query, status: str, now: datetime.datetime):
+    soon = now + datetime.timedelta(days=SUBSCRIPTION_EXPIRING_DAYS)
+    expiry, not_admin = models.User.subscription_expiry, models.User.is_admin.isnot(True)
+    if status == "admin": return query.filter(models.User.is_admin.is_(True))
+    if status == "unlimited": return query.filter(not_admin, expiry.is_(None))
+    if status == "active": return query.filter(not_admin, expiry >= soon)
+    if status == "expiring": return query.filter(not_admin, expiry >= now, expiry < soon)
+    return query.filter(not_admin, expiry < now)
+
+def subscription_status(user, now: datetime.datetime) -> str:
+    if user.is_admin: return "admin"
+    if user.subscription_expiry is None: return "unlimited"
+    if user.subscription_expiry < now: return "expired"
+    if user.subscription_expiry < now + datetime.timedelta(days=SUBSCRIPTION_EXPIRING_DAYS): return "expiring"
+    return "active"
+
+def get_admin_overview(db: Session, email_prefix: Optional[str] = None, subscription: Optional[str] = None,
+                       limit: int = 50, cursor: Optional[str] = None):
+    """
+    Returns (rows, total, next_cursor): one page of users ordered by email with their counts,
+    active jobs, run disk use and subscription status. A constant number of queries per page:
+    the page itself, its total, and one grouped query each for simulations, materials and tools.
+    """
+    now = datetime.datetime.now()
+    query = db.query(models.User.id, models.User.email, models.User.is_admin, models.User.subscription_expiry)
+    if email_prefix: query = _email_prefix(query, email_prefix)
+    if subscription: query = _subscription_filter(query, subscription, now)
+    total = query.order_by(None).count()
+    if cursor: query = query.filter(models.User.email > decode_cursor(cursor, str)[0])
+    users = query.order_by(models.User.email).limit(limit + 1).all()
+    next_cursor = encode_cursor([users[limit - 1].email]) if len(users) > limit else None
+    users = users[:limit]
+    ids = [u.id for u in users]
+
+    sims = {}
+    if ids:
+        rows = db.query(
+            models.Simulation.owner_id, models.Simulation.status, func.count(models.Simulation.id),
+            func.sum(models.Simulation.run_disk_bytes), func.max(models.Simulation.queued_at)
+        ).filter(models.Simulation.owner_id.in_(ids)).group_by(models.Simulation.owner_id, models.Simulation.status).all()
+        for owner_id, status, count, disk, last in rows:
+            entry = sims.setdefault(owner_id, {"by_status": {}, "disk": 0, "last": None})
+            entry["by_status"][status] = count
+            entry["disk"] += int(disk or 0)
+            if last and (entry["last"] is None or last > entry["last"]): entry["last"] = last
+
+    def counts(model):
+        if not ids: return {}
+        return dict(db.query(model.owner_id, func.count(model.id)).filter(model.owner_id.in_(ids)).group_by(model.owner_id).all())
+    materials, tools = counts(models.Material), counts(models.Tool)
+
+    result = []
+    for user in users:
+        entry = sims.get(user.id, {"by_status": {}, "disk": 0, "last": None})
+        result.append({
+            "id": user.id, "email": user.email, "is_admin": bool(user.is_admin),
+            "subscription_expiry": user.subscription_expiry, "subscription_status": subscription_status(user, now),
+            "simulations": sum(entry["by_status"].values()), "simulations_by_status": entry["by_status"],
+            "active_jobs": sum(entry["by_status"].get(s, 0) for s in ACTIVE_STATUSES),
+            "run_disk_bytes": entry["disk"], "last_submitted_at": entry["last"],
+            "materials": materials.get(user.id, 0), "tools": tools.get(user.id, 0),
+        })
+    return result, total, next_cursor
+
+def get_admin_totals(db: Session) -> dict:
+    """Site-wide figures for the dashboard header, from two grouped queries."""
+    now = datetime.datetime.now()
+    soon = now + datetime.timedelta(days=SUBSCRIPTION_EXPIRING_DAYS)
+    expiry = models.User.subscription_expiry
+    bucket = case(
+        (models.User.is_admin.is_(True), "admin"), (expiry.is_(None), "unlimited"), (expiry < now, "expired"),
+        (expiry < soon, "expiring"), else_="active"
+    )
+    users = {status: count for status, count in db.query(bucket, func.count(models.User.id)).group_by(bucket).all()}
+    sims = db.query(models.Simulation.status, func.count(models.Simulation.id), func.sum(models.Simulation.run_disk_bytes)).group_by(models.Simulation.status).all()
+    return {
+        "users": sum(users.values()),
+        "users_by_subscription": {status: users.get(status, 0) for status in SUBSCRIPTION_STATUSES},
+        "simulations": sum(count for _, count, _ in sims),
+        "simulations_by_status": {status: count for status, count, _ in sims},
+        "active_jobs": sum(count for status, count, _ in sims if status in ACTIVE_STATUSES),
+        "run_disk_bytes": sum(int(disk or 0) for _, _, disk in sims),
+    }
+
+# --- Bulk admin operations (one transaction, per-item results) ---
+
+def bulk_approve_access_requests(db: Session, request_ids: list[int], subscription_days: Optional[int] = 30, notify: bool = True) -> list[dict]:
+    """
+    Approves access requests and creates their users in a single transaction. Per request:
+    created (new user with a temporary password), user_exists (approved, account kept),
+    duplicate (same email earlier in the batch), already_approved or not_found.
+    """
+    ids = list(dict.fromkeys(request_ids))
+    requests = {r.id: r for r in db.query(models.AccessRequest).filter(models.AccessRequest.id.in_(ids))} if ids else {}
+    emails = {r.email for r in requests.values()}
+    existing = dict(db.query(models.User.email, models.User.id).filter(models.User.email.in_(emails))) if emails else {}
+    expiry = datetime.datetime.now() + datetime.timedelta(days=subscription_days) if subscription_days is not None else None
+
+    results, created, approved, seen = [], [], [], set()
+    for request_id in ids:
+        db_req = requests.get(request_id)
+        if db_req is None:
+            results.append({"request_id": request_id, "status": "not_found"}); continue
+        item = {"request_id": db_req.id, "email": db_req.email}
+        if db_req.status == "APPROVED":
+            item["status"] = "already_approved"
+        elif db_req.email in existing:
+            item.update(status="user_exists", user_id=existing[db_req.email])
+        elif db_req.email in seen:
+            item["status"] = "duplicate"
+        else:
+            password, salt = secrets.token_urlsafe(12), security.get_random_salt()
+            db_user = models.User(email=db_req.email, hashed_password=security.hash_password(password, salt), salt=salt, is_admin=False, subscription_expiry=expiry)
+            db.add(db_user); created.append((item, db_user))
+            item.update(status="created", temporary_password=password)
+        if item["status"] != "already_approved":
+            db_req.status = "APPROVED"; approved.append(db_req)
+        seen.add(db_req.email)
+        results.append(item)
+
+    db.flush()  # assigns the new user ids; a concurrent signup with the same email fails the whole batch here
+    for item, db_user in created: item["user_id"] = db_user.id
+    if notify:
+        # Outbox rows are part of the same transaction: no email without the approval, and vice versa
+        for db_req in approved: email_service.notify_access_request_status(db, db_req, commit=False)
+    db.commit()
+    if notify: email_outbox.wake()
+    return results
+
+def _add_days(db: Session, column, days: int):
+    if db.get_bind().dialect.name == "sqlite":
+        # Keeps the text format SQLAlchemy stores DateTime in on SQLite
+        return func.strftime("%Y-%m-%d %H:%M:%f000", column, f"{days:+d} days")
+    return column + datetime.timedelta(days=days)
+
+def bulk_update_subscriptions(
+    db: Session, action: str, days: Optional[int] = None, expiry: Optional[datetime.datetime] = None,
+    user_ids: Optional[list[int]] = None, email_prefix: Optional[str] = None, subscription: Optional[str] = None
+) -> dict:
+    """
+    Extends (from the later of now and the current expiry), expires (now) or sets the subscription
+    of every non-admin user matching the filters. Users are handled in id order, one page of
+    SUBSCRIPTION_UPDATE_PAGE per SELECT + UPDATE, so memory does not grow with the number of
+    matches; all pages are one transaction, committed at the end (all users are updated or none).
+    Returns the count per status: updated, skipped_admin, skipped_unlimited (extend leaves users
+    without an expiry alone) and not_found; per-user `results` only for an explicit user_ids list.
+    """
+    now = datetime.datetime.now()
+    column = models.User.subscription_expiry
+    query = db.query(models.User.id, models.User.email, models.User.is_admin, column)
+    if user_ids is not None: query = query.filter(models.User.id.in_(user_ids))
+    if email_prefix: query = _email_prefix(query, email_prefix)
+    if subscription: query = _subscription_filter(query, subscription, now)
+    if action == "extend": value = case((column < now, now + datetime.timedelta(days=days)), else_=_add_days(db, column, days))
+    else: value = now if action == "expire" else expiry
+
+    counts = dict.fromkeys(("updated", "skipped_admin", "skipped_unlimited", "not_found"), 0)
+    results, last_id = ([] if user_ids is not None else None), None
+    while True:
+        # Keyset on id: updated rows may stop matching the filters, so an offset would skip users
+        page_query = query if last_id is None else query.filter(models.User.id > last_id)
+        page = page_query.order_by(models.User.id).limit(SUBSCRIPTION_UPDATE_PAGE).all()
+        if not page: break
+        last_id = page[-1].id
+        changed = [row.id for row in page if not row.is_admin and (action != "extend" or row.subscription_expiry is not None)]
+        after = {}
+        if changed:
+            db.query(models.User).filter(models.User.id.in_(changed)).update({column: value}, synchronize_session=False)
+            if results is not None: after = dict(db.query(models.User.id, column).filter(models.User.id.in_(changed)).all())
+        changed = set(changed)
+        for row in page:
+            status = "skipped_admin" if row.is_admin else "updated" if row.id in changed else "skipped_unlimited"
+            counts[status] += 1
+            if results is None: continue
+            item = {"user_id": row.id, "status": status, "email": row.email, "previous_expiry": row.subscription_expiry}
+            if status == "updated": item["subscription_expiry"] = after.get(row.id)
+            results.append(item)
+
+    if results is not None:
+        found = {item["user_id"] for item in results}
+        for user_id in dict.fromkeys(user_ids):
+            if user_id not in found:
+                results.append({"user_id": user_id, "status": "not_found"})
+                counts["not_found"] += 1
+    db.commit()
+    if counts["updated"]: _invalidate_principals(db, user_ids, email_prefix)
+    return {**counts, "results": results}
+
+def _invalidate_principals(db: Session, user_ids: Optional[list[int]], email_prefix: Optional[str]) -> None:
+    # After the commit, so no request re-caches a principal from before the update. The updated
+    # users are not kept in memory: every non-admin user the id/prefix filters match is dropped
+    # (a subscription filter may not match them any more; dropping extra entries is harmless).
+    query = db.query(models.User.id, models.User.email).filter(models.User.is_admin.isnot(True))
+    if user_ids is not None: query = query.filter(models.User.id.in_(user_ids))
+    if email_prefix: query = _email_prefix(query, email_prefix)
+    last_id = None
+    while True:
+        page = (query if last_id is None else query.filter(models.User.id > last_id)).order_by(models.User.id).limit(SUBSCRIPTION_UPDATE_PAGE).all()
+        if not page: return
+        last_id = page[-1].id
+        for row in page: principal_cache.invalidate(row.email)
+
 # --- NEW: Delete Simulation ---
 def delete_simulation(db: Session, simulation_id: int):
     db_simulation = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
@@ -117,6 +443,28 @@ def delete_simulation(db: Session, simulation_id: int):
     return None
 # ------------------------------
 
+# --- Sweep CRUD ---
+def get_sweep(db: Session, sweep_id: int):
+    return db.query(models.Sweep).filter(models.Sweep.id == sweep_id).first()
+
+def get_sweeps_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+    return db.query(models.Sweep).filter(models.Sweep.owner_id == user_id).order_by(models.Sweep.id.desc()).offset(skip).limit(limit).all()
+
+def get_sweep_status_counts(db: Session, sweep_id: int) -> dict:
+    rows = db.query(models.Simulation.status, func.count(models.Simulation.id)).filter(
+        models.Simulation.sweep_id == sweep_id
+    ).group_by(models.Simulation.status).all()
+    return {status: count for status, count in rows}
+
+def get_sweep_points(db: Session, sweep_id: int, statuses: Optional[list] = None):
+    """Light rows (no results blobs) for every simulation of a sweep."""
+    query = db.query(
+        models.Simulation.id, models.Simulation.status, models.Simulation.sweep_point, models.Simulation.reused_from_id,
+        *[getattr(models.Simulation, f) for f in SIMULATION_METRIC_FIELDS]
+    ).filter(models.Simulation.sweep_id == sweep_id)
+    if statuses: query = query.filter(models.Simulation.status.in_(statuses))
+    return query.order_by(models.Simulation.id).all()
+
 # --- Material CRUD ---
 def get_materials_by_user(db: Session, user_id: int):
     return db.query(models.Material).filter(models.Material.owner_id == user_id).all()
@@ -129,6 +477,7 @@ def create_user_material(db: Session, material: schemas.MaterialCreate, user_id:
         properties=properties_json_string,
         owner_id=user_id
     )
+    material_library.index_material(db_material, material.properties)
     db.add(db_material)
     db.commit()
     db.refresh(db_material)
@@ -138,10 +487,15 @@ def create_user_material(db: Session, material: schemas.MaterialCreate, user_id:
 def get_tools_by_user(db: Session, user_id: int):
     return db.query(models.Tool).filter(models.Tool.owner_id == user_id).all()
 
-def create_user_tool(db: Session, tool: schemas.ToolCreate, file_path: str, user_id: int):
+def create_user_tool(db: Session, tool: schemas.ToolCreate, file_path: str, user_id: int, content_hash: Optional[str] = None, file_size: Optional[int] = None, mesh_info: Optional[dict] = None):
     db_tool = models.Tool(
         **tool.dict(), 
         file_path=file_path, 
+        content_hash=content_hash,
+        file_size=file_size,
+        triangle_count=mesh_info["triangle_count"] if mesh_info else None,
+        is_watertight=mesh_info["is_watertight"] if mesh_info else None,
+        mesh_info=json.dumps(mesh_info) if mesh_info else None,
         owner_id=user_id
     )
     db.add(db_tool)
@@ -149,6 +503,18 @@ def create_user_tool(db: Session, tool: schemas.ToolCreate, file_path: str, user
     db.refresh(db_tool)
     return db_tool
 
+def get_ingested_tool_by_hash(db: Session, content_hash: str):
+    """Any tool with the same file that already went through mesh ingest."""
+    return db.query(models.Tool).filter(models.Tool.content_hash == content_hash, models.Tool.mesh_info.isnot(None)).first()
+
+def count_tools_by_file(db: Session, file_path: str) -> int:
+    """Reference count of a stored tool file (one blob per content hash and extension)."""
+    return db.query(models.Tool).filter(models.Tool.file_path == file_path).count()
+
+def count_tools_by_hash(db: Session, content_hash: str) -> int:
+    """Tools with this content under any extension (they share one mesh preview)."""
+    return db.query(models.Tool).filter(models.Tool.content_hash == content_hash).count()
+
 def delete_tool(db: Session, tool_id: int):
     db_tool = db.query(models.Tool).filter(models.Tool.id == tool_id).first()
     if db_tool:
@@ -0,0 +1,245 @@
+import datetime, os, smtplib, ssl, threading, time, uuid
+from email.message import EmailMessage
+from typing import Optional
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+# --- SMTP settings (MAIL_* as before; the local stub needs MAIL_STARTTLS=false and no credentials) ---
+MAIL_SERVER = os.getenv("MAIL_SERVER")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_FROM = os.getenv("MAIL_FROM") or MAIL_USERNAME or "noreply@localhost"
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() in ("1", "true", "yes")
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "false").lower() in ("1", "true", "yes")
+MAIL_TIMEOUT_SECONDS = float(os.getenv("MAIL_TIMEOUT_SECONDS", 30))
+
+# --- Outbox delivery ---
+# Every API process runs one sender thread (EMAIL_SENDER_ENABLED=false to leave delivery to
+# other processes); rows are claimed with a token, so several senders never send a row twice.
+EMAIL_SENDER_ENABLED = os.getenv("EMAIL_SENDER_ENABLED", "true").lower() in ("1", "true", "yes")
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", 10))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 8))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", 3600))
+# Rows left in SENDING this long (a sender died mid-batch) are claimed again
+EMAIL_CLAIM_TIMEOUT_SECONDS = float(os.getenv("EMAIL_CLAIM_TIMEOUT_SECONDS", 600))
+# The SMTP connection is reused across messages and batches, and reopened after this many
+# messages or this much idle time (servers drop idle sessions)
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+SMTP_MAX_IDLE_SECONDS = float(os.getenv("SMTP_MAX_IDLE_SECONDS", 60))
+
+PENDING, SENDING, SENT, FAILED = "PENDING", "SENDING", "SENT", "FAILED"
+
+
+def enqueue(db: Session, kind: str, recipients, subject: str, html: str, commit: bool = True) -> list:
+    """
+    Stores one outbox row per recipient and wakes the sender. Never talks to the mail server.
+    With commit=False the rows join the caller's transaction; call wake() after committing.
+    """
+    # Header values must be a single line (a CR/LF would make building the message fail)
+    subject = " ".join(str(subject).split())
+    rows = [models.EmailOutbox(kind=kind, recipient=str(r), subject=subject, body=html) for r in recipients]
+    if not rows: return rows
+    db.add_all(rows)
+    if commit:
+        db.commit(); wake()
+    return rows
+
+
+# --- SMTP connection reuse ---
+
+class SMTPConnection:
+    """One SMTP session kept open across messages; reopened on demand."""
+
+    def __init__(self):
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.sent = 0
+        self.last_used = 0.0
+
+    def _open(self) -> smtplib.SMTP:
+        if MAIL_SSL_TLS:
+            smtp = smtplib.SMTP_SSL(MAIL_SERVER, MAIL_PORT, timeout=MAIL_TIMEOUT_SECONDS, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=MAIL_TIMEOUT_SECONDS)
+            if MAIL_STARTTLS: smtp.starttls(context=ssl.create_default_context())
+        if MAIL_USERNAME: smtp.login(MAIL_USERNAME, MAIL_PASSWORD or "")
+        self.sent = 0
+        return smtp
+
+    def get(self) -> smtplib.SMTP:
+        stale = self.sent >= SMTP_MAX_MESSAGES_PER_CONNECTION or time.monotonic() - self.last_used > SMTP_MAX_IDLE_SECONDS
+        if self.smtp is not None and stale: self.close()
+        if self.smtp is None: self.smtp = self._open()
+        return self.smtp
+
+    def send(self, message: EmailMessage) -> None:
+        smtp = self.get()
+        try:
+            smtp.send_message(message)
+            self.sent += 1
+        finally:
+            # A refused message still used (and kept alive) the session
+            self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self.smtp is None: return
+        try: self.smtp.quit()
+        except (smtplib.SMTPException, OSError): pass
+        self.smtp = None
+
+
+def build_message(row) -> EmailMessage:
+    message = EmailMessage()
+    message["From"], message["To"], message["Subject"] = MAIL_FROM, row.recipient, row.subject
+    message["Message-ID"] = f"<outbox-{row.id}-{row.created_at:%Y%m%d%H%M%S}@{MAIL_FROM.rpartition('@')[2] or 'localhost'}>"
+    message.set_content("This message is best viewed in an HTML-capable mail client.")
+    message.add_alternative(row.body, subtype="html")
+    return message
+
+def _permanent(error: Exception) -> bool:
+    # 5xx replies for this message: retrying will not help
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    code = getattr(error, "smtp_code", None)
+    return isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)) and code is not None and code >= 500
+
+def _connection_error(error: Exception) -> bool:
+    # Replies about this one message (any code) leave the session usable; everything else at the
+    # socket/SMTP level (disconnects, timeouts, refused connections, failed login) means reconnecting
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)): return False
+    return isinstance(error, OSError)  # smtplib.SMTPException is an OSError
+
+def retry_delay(attempts: int) -> float:
+    return min(EMAIL_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), EMAIL_RETRY_MAX_SECONDS)
+
+def _record_failure(row, error: Exception, permanent: bool) -> None:
+    row.attempts = (row.attempts or 0) + 1
+    row.last_error = f"{type(error).__name__}: {error}"[:500]
+    row.claim_token = None
+    if permanent or row.attempts >= EMAIL_MAX_ATTEMPTS:
+        row.status = FAILED
+        print(f"Email outbox: giving up on message {row.id} to {row.recipient}: {row.last_error}")
+    else:
+        row.status = PENDING
+        row.next_attempt_at = datetime.datetime.now() + datetime.timedelta(seconds=retry_delay(row.attempts))
+
+
+# --- Batches ---
+
+def claim_batch(db: Session, limit: int = EMAIL_BATCH_SIZE, now: Optional[datetime.datetime] = None) -> list:
+    """Marks up to `limit` due rows as SENDING under a fresh token and returns them."""
+    now = now or datetime.datetime.now()
+    Outbox = models.EmailOutbox
+    due = or_(
+        and_(Outbox.status == PENDING, Outbox.next_attempt_at <= now),
+        and_(Outbox.status == SENDING, Outbox.claimed_at < now - datetime.timedelta(seconds=EMAIL_CLAIM_TIMEOUT_SECONDS)),
+    )
+    ids = select(Outbox.id).where(due).order_by(Outbox.next_attempt_at, Outbox.id).limit(limit)
+    token = uuid.uuid4().hex
+    # `due` is repeated outside the subquery so a concurrent sender's claim is never taken over
+    claimed = db.query(Outbox).filter(Outbox.id.in_(ids), due).update(
+        {"status": SENDING, "claim_token": token, "claimed_at": now}, synchronize_session=False
+    )
+    db.commit()
+    if not claimed: return []
+    return db.query(Outbox).filter(Outbox.claim_token == token).order_by(Outbox.id).all()
+
+def deliver_batch(db: Session, connection: SMTPConnection, limit: int = EMAIL_BATCH_SIZE) -> int:
+    """Sends one batch over `connection`. Returns the number of messages sent."""
+    rows, sent = claim_batch(db, limit), 0
+    for i, row in enumerate(rows):
+        try:
+            message = build_message(row)
+        except Exception as e:
+            # The row itself is broken: building it again will not help, and the batch goes on
+            _record_failure(row, e, permanent=True)
+            db.commit()
+            continue
+        try:
+            connection.send(message)
+        except Exception as e:
+            if _connection_error(e):
+                # Connection-level trouble: hand the rest of the batch back untouched and reconnect later
+                _record_failure(row, e, permanent=False)
+                connection.close()
+                for rest in rows[i + 1:]: rest.status, rest.claim_token = PENDING, None
+                db.commit()
+                return sent
+            # Refused or unsendable message: retried later (or failed for 5xx), the rest still go out
+            _record_failure(row, e, permanent=_permanent(e) or not isinstance(e, OSError))
+        else:
+            row.status, row.sent_at, row.attempts = SENT, datetime.datetime.now(), (row.attempts or 0) + 1
+            row.last_error, row.claim_token = None, None
+            sent += 1
+        db.commit()
+    return sent
+
+def outbox_stats(db: Session) -> dict:
+    rows = db.query(models.EmailOutbox.status, func.count(models.EmailOutbox.id), func.min(models.EmailOutbox.created_at)).group_by(models.EmailOutbox.status).all()
+    stats = {status: {"count": count, "oldest": oldest} for status, count, oldest in rows}
+    return {
+        "by_status": stats,
+        "sender_running": _sender is not None and _sender.is_alive(),
+        "mail_server": f"{MAIL_SERVER}:{MAIL_PORT}" if MAIL_SERVER else None,
+    }
+
+
+# --- Background sender ---
+
+class OutboxSender(threading.Thread):
+    """Delivers the outbox in batches: woken by `enqueue`, and polling for retries that fall due."""
+
+    def __init__(self, session_factory=SessionLocal, poll_seconds: float = EMAIL_POLL_SECONDS):
+        super().__init__(name="email-outbox", daemon=True)
+        self.session_factory, self.poll_seconds = session_factory, poll_seconds
+        self.connection = SMTPConnection()
+        self.wakeup, self.stopping = threading.Event(), threading.Event()
+
+    def run(self) -> None:
+        while not self.stopping.is_set():
+            # Cleared before the pass, so an enqueue during the pass triggers another one
+            self.wakeup.clear()
+            sent = 0
+            db = self.session_factory()
+            try:
+                sent = deliver_batch(db, self.connection)
+            except Exception as e:
+                print(f"Email outbox: delivery pass failed: {e}")
+                db.rollback()
+            finally:
+                db.close()
+            # A fully sent batch means more may be due right away
+            if sent < EMAIL_BATCH_SIZE: self.wakeup.wait(self.poll_seconds)
+        self.connection.close()
+
+    def stop(self, timeout: float = 5) -> None:
+        self.stopping.set(); self.wakeup.set()
+        self.join(timeout)
+
+_sender: Optional[OutboxSender] = None
+
+def start_sender() -> Optional[OutboxSender]:
+    global _sender
+    if not EMAIL_SENDER_ENABLED: return None
+    if not MAIL_SERVER:
+        print("Email outbox: MAIL_SERVER is not set, messages stay queued until a sender with SMTP settings runs.")
+        return None
+    if _sender is None or not _sender.is_alive():
+        _sender = OutboxSender()
+        _sender.start()
+    return _sender
+
+def stop_sender() -> None:
+    global _sender
+    if _sender is not None:
+        _sender.stop(); _sender = None
+
+def wake() -> None:
+    if _sender is not None: _sender.wakeup.set()
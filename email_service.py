@@ -1,47 +1,24 @@
-import os
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+import html, os
 from pydantic import EmailStr
-from typing import List
+from sqlalchemy.orm import Session
 from dotenv import load_dotenv
+import models, email_outbox
 
 load_dotenv()
 
-# Configuration from .env file
-conf = ConnectionConfig(
-    MAIL_USERNAME = os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM = os.getenv("MAIL_FROM"),
-    MAIL_PORT = int(os.getenv("MAIL_PORT", 587)),
-    MAIL_SERVER = os.getenv("MAIL_SERVER"),
-    MAIL_STARTTLS = True,
-    MAIL_SSL_TLS = False,
-    USE_CREDENTIALS = True,
-    VALIDATE_CERTS = True
-)
+# Links in emails point at the frontend
+FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000").rstrip("/")
+# Who hears about new access requests (comma-separated); defaults to every admin account
+ACCESS_REQUEST_NOTIFY = [e.strip() for e in os.getenv("ACCESS_REQUEST_NOTIFY", "").split(",") if e.strip()]
 
-fm = FastMail(conf)
 
-async def send_password_reset_email(recipient_email: EmailStr, reset_token: str):
-    """
-    Sends a password reset email to the user.
-    """
-    
-    # This URL should point to your *frontend's* reset page
-    reset_url = f"http://localhost:3000/reset-password?token={reset_token}"
-
-    html_content = f"""
+def _layout(title: str, content: str) -> str:
+    return f"""
     <html>
     <body style="font-family: Arial, sans-serif; line-height: 1.6;">
         <div style="max-width: 600px; margin: 20px auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px;">
-            <h2 style="color: #333;">Password Reset Request</h2>
-            <p>You are receiving this email because you (or someone else) requested a password reset for your EdgePredict account.</p>
-            <p>Please click the button below to set a new password:</p>
-            <p style="text-align: center; margin: 30px 0;">
-                <a href="{reset_url}" style="background-color: #6366f1; color: #ffffff; padding: 12px 20px; text-decoration: none; border-radius: 5px; font-weight: bold;">
-                    Reset Your Password
-                </a>
-            </p>
-            <p>If you did not request this, please ignore this email. This link will expire in 1 hour.</p>
+            <h2 style="color: #333;">{title}</h2>
+            {content}
             <hr style="border: 0; border-top: 1px solid #eee;">
             <p style="font-size: 0.9em; color: #777;">EdgePredict Simulation Platform</p>
         </div>
@@ -49,17 +26,48 @@ async def send_password_reset_email(recipient_email: EmailStr, reset_token: str)
     </html>
     """
 
-    message = MessageSchema(
-        subject="Your EdgePredict Password Reset Link",
-        recipients=[recipient_email],
-        body=html_content,
-        subtype=MessageType.html
-    )
+def _button(url: str, label: str) -> str:
+    return f"""<p style="text-align: center; margin: 30px 0;">
+                <a href="{url}" style="background-color: #6366f1; color: #ffffff; padding: 12px 20px; text-decoration: none; border-radius: 5px; font-weight: bold;">
+                    {label}
+                </a>
+            </p>"""
+
+def send_password_reset_email(db: Session, recipient_email: EmailStr, reset_token: str) -> models.EmailOutbox:
+    """
+    Queues a password reset email; the outbox sender delivers it in the background.
+    """
+    reset_url = f"{FRONTEND_URL}/reset-password?token={reset_token}"
+    html_content = _layout("Password Reset Request", f"""
+            <p>You are receiving this email because you (or someone else) requested a password reset for your EdgePredict account.</p>
+            <p>Please click the button below to set a new password:</p>
+            {_button(reset_url, "Reset Your Password")}
+            <p>If you did not request this, please ignore this email. This link will expire in 1 hour.</p>""")
+    return email_outbox.enqueue(db, "password_reset", [recipient_email], "Your EdgePredict Password Reset Link", html_content)[0]
+
+def _admin_recipients(db: Session) -> list[str]:
+    if ACCESS_REQUEST_NOTIFY: return ACCESS_REQUEST_NOTIFY
+    return [email for (email,) in db.query(models.User.email).filter(models.User.is_admin.is_(True))]
+
+def _text(value) -> str:
+    # Access request fields come from an unauthenticated form: never let them add markup
+    return html.escape(str(value or ""))
+
+def notify_access_request(db: Session, access_request: models.AccessRequest) -> list:
+    """Tells the admins about a new access request."""
+    html_content = _layout("New Access Request", f"""
+            <p><b>{_text(access_request.name)}</b> ({_text(access_request.email)}) from <b>{_text(access_request.company)}</b> requested access to EdgePredict.</p>
+            {_button(f"{FRONTEND_URL}/admin", "Review Requests")}""")
+    # enqueue flattens the subject to one line
+    return email_outbox.enqueue(db, "access_request", _admin_recipients(db), f"EdgePredict access request from {access_request.name}", html_content)
 
-    try:
-        await fm.send_message(message)
-        print(f"Password reset email sent to {recipient_email}")
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        # In a real app, you'd have more robust error logging here
-        raise RuntimeError("Failed to send password reset email.")
\ No newline at end of file
+def notify_access_request_status(db: Session, access_request: models.AccessRequest, commit: bool = True) -> list:
+    """Tells the requester that their access request was approved or rejected."""
+    if access_request.status == "APPROVED":
+        content = "<p>Your request for access to EdgePredict was approved. You will receive your login details separately.</p>"
+    elif access_request.status == "REJECTED":
+        content = "<p>Thank you for your interest in EdgePredict. Unfortunately we cannot grant access at this time.</p>"
+    else:
+        return []
+    html_content = _layout("Your Access Request", f"<p>Hello {_text(access_request.name)},</p>{content}")
+    return email_outbox.enqueue(db, "access_request_status", [access_request.email], "Your EdgePredict access request", html_content, commit=commit)
@@ -0,0 +1,165 @@
+import logging, os, subprocess, threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Engine stdout/stderr goes to <run_dir>/engine.log, rotated to engine.log.1 .. .N,
+# so one run never uses more than ENGINE_LOG_MAX_BYTES * (ENGINE_LOG_BACKUPS + 1) on disk
+LOG_NAME = "engine.log"
+ENGINE_LOG_MAX_BYTES = int(os.getenv("ENGINE_LOG_MAX_BYTES", 10 * 1024 * 1024))
+ENGINE_LOG_BACKUPS = int(os.getenv("ENGINE_LOG_BACKUPS", 2))
+# Failure records keep only the last lines of each stream
+EXCERPT_LINES = 40
+EXCERPT_MAX_CHARS = 4000
+MAX_LINE_CHARS = 8192
+STDERR_PREFIX = "[stderr] "
+
+
+def log_path(run_dir: str) -> str:
+    return os.path.join(run_dir, LOG_NAME)
+
+def log_files(run_dir: str) -> list[str]:
+    """Existing log files, oldest first."""
+    path = log_path(run_dir)
+    candidates = [f"{path}.{i}" for i in range(ENGINE_LOG_BACKUPS, 0, -1)] + [path]
+    return [p for p in candidates if os.path.exists(p)]
+
+def open_log(run_dir: str) -> RotatingFileHandler:
+    handler = RotatingFileHandler(log_path(run_dir), maxBytes=ENGINE_LOG_MAX_BYTES, backupCount=ENGINE_LOG_BACKUPS, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return handler
+
+def write_line(log: RotatingFileHandler, line: str) -> None:
+    log.handle(logging.makeLogRecord({"msg": line, "levelno": logging.INFO, "levelname": "INFO"}))
+
+def excerpt(lines) -> str:
+    text = "\n".join(lines)
+    return text[-EXCERPT_MAX_CHARS:]
+
+def _pump(stream, log: RotatingFileHandler, prefix: str, tail: deque) -> None:
+    # Copies one pipe into the log line by line; only a short tail stays in memory
+    for line in iter(lambda: stream.readline(MAX_LINE_CHARS), ""):
+        line = line.rstrip("\r\n")
+        write_line(log, prefix + line)
+        tail.append(line)
+    stream.close()
+
+def run_logged(command: list[str], run_dir: str, timeout: float, cwd: Optional[str] = None) -> subprocess.CompletedProcess:
+    """
+    Runs `command`, streaming stdout/stderr into the run's rotating engine.log.
+    The returned stdout/stderr are bounded excerpts (the last lines of each stream).
+    """
+    log = open_log(run_dir)
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd,
+        text=True, encoding="utf-8", errors="ignore"
+    )
+    out_tail, err_tail = deque(maxlen=EXCERPT_LINES), deque(maxlen=EXCERPT_LINES)
+    pumps = [
+        threading.Thread(target=_pump, args=(process.stdout, log, "", out_tail), daemon=True),
+        threading.Thread(target=_pump, args=(process.stderr, log, STDERR_PREFIX, err_tail), daemon=True),
+    ]
+    for pump in pumps: pump.start()
+    try:
+        returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        raise
+    finally:
+        for pump in pumps: pump.join(timeout=5)
+        log.close()
+    return subprocess.CompletedProcess(command, returncode, excerpt(out_tail), excerpt(err_tail))
+
+def append_output(run_dir: str, stdout: str, stderr: str) -> tuple[str, str]:
+    """
+    Logs output an engine returned in one piece (the local line-protocol engine)
+    and returns the (stdout, stderr) excerpts.
+    """
+    out_lines, err_lines = (stdout or "").splitlines(), (stderr or "").splitlines()
+    log = open_log(run_dir)
+    try:
+        for line in out_lines: write_line(log, line)
+        for line in err_lines: write_line(log, STDERR_PREFIX + line)
+    finally:
+        log.close()
+    return excerpt(out_lines[-EXCERPT_LINES:]), excerpt(err_lines[-EXCERPT_LINES:])
+
+def _last_lines(path: str, n: int, block_size: int = 64 * 1024) -> list[bytes]:
+    # Reads backwards from the end of the file until n lines are found
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos > 0: lines = lines[1:]  # first line may be partial
+    return lines[-n:] if end else []
+
+# A read position in the log: (inode of the file, byte offset in it). The inode follows a file
+# through rotation (engine.log -> engine.log.1 -> ...), which its size alone cannot tell apart.
+Position = tuple[Optional[int], int]
+
+def tail(run_dir: str, n: int) -> tuple[str, Position]:
+    """Last `n` log lines across rotated files, plus the position of the current file's end (for read_new)."""
+    lines: list[bytes] = []
+    for path in reversed(log_files(run_dir)):
+        lines = _last_lines(path, n - len(lines)) + lines
+        if len(lines) >= n: break
+    try:
+        st = os.stat(log_path(run_dir))
+        position = (st.st_ino, st.st_size)
+    except OSError:
+        position = (None, 0)
+    text = b"\n".join(lines).decode("utf-8", errors="ignore")
+    return (text + "\n" if text else ""), position
+
+def read_new(run_dir: str, position: Position, limit: int = 1024 * 1024) -> tuple[bytes, Position]:
+    """
+    Up to `limit` bytes written to the log since `position`, and the position to continue from.
+    When the log rotated in between, the rest of the file `position` points into (now
+    engine.log.1 or older) comes first, then every newer file. Only complete lines are returned.
+    """
+    inode, offset = position
+    files = []
+    try:
+        for path in log_files(run_dir):
+            try: files.append(open(path, "rb"))
+            except OSError: pass  # rotated away between listing and opening
+        stats = [os.fstat(f.fileno()) for f in files]
+        inodes = [st.st_ino for st in stats]
+        if inode is None:
+            # Nothing read yet: start at the beginning of the current file
+            if not os.path.exists(log_path(run_dir)) or not files: return b"", position
+            start, offset = len(files) - 1, 0
+        elif inode in inodes:
+            start = inodes.index(inode)
+        else:
+            # The file was rotated past the last backup (or never seen): everything left is newer
+            if not files: return b"", position
+            start, offset = 0, 0
+
+        chunks, remaining, position = [], limit, (inodes[start], offset)
+        for i in range(start, len(files)):
+            size = stats[i].st_size
+            if i > start or size < offset: offset = 0
+            files[i].seek(offset)
+            data = files[i].read(remaining)
+            if i == len(files) - 1 or offset + len(data) < size:
+                # The live file may end mid-line, and `limit` may cut one: keep the partial line for later
+                cut = data.rfind(b"\n") + 1
+                if cut == 0 and len(data) == remaining: cut = len(data)  # one line longer than `limit`
+                data = data[:cut]
+            chunks.append(data)
+            remaining -= len(data)
+            position = (inodes[i], offset + len(data))
+            if offset + len(data) < size or remaining <= 0: break
+        return b"".join(chunks), position
+    finally:
+        for f in files: f.close()
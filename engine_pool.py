@@ -0,0 +1,218 @@
+import json, os, queue, shlex, subprocess, threading, uuid
+from abc import ABC, abstractmethod
+from typing import Optional
+from dotenv import load_dotenv
+import engine_logs, metrics
+
+load_dotenv()
+
+# --- Engine backend configuration ---
+# docker: one `docker run --rm` per job (previous behaviour)
+# pool:   warm, long-lived engine containers; jobs are sent with `docker exec`
+# local:  warm, long-lived local engine processes (ENGINE_LOCAL_COMMAND --serve), e.g. fake_engine.py
+ENGINE_BACKEND = os.getenv("ENGINE_BACKEND", "docker")
+ENGINE_IMAGE = os.getenv("ENGINE_IMAGE", "edgepredict-engine-v3")
+ENGINE_POOL_SIZE = int(os.getenv("ENGINE_POOL_SIZE", 1))
+# Recycle a container/process after this many jobs to bound leaks inside the engine
+ENGINE_POOL_MAX_JOBS = int(os.getenv("ENGINE_POOL_MAX_JOBS", 50))
+ENGINE_LOCAL_COMMAND = os.getenv("ENGINE_LOCAL_COMMAND", "python fake_engine.py")
+RUNS_BASE_DIR = os.getenv("RUNS_DIR", "simulation_runs")
+CONTAINER_RUNS_DIR = "/runs"
+
+_TEXT = dict(text=True, encoding="utf-8", errors="ignore")
+
+
+class EngineSlot(ABC):
+    """One warm engine (container or process) that runs a single job at a time."""
+    jobs = 0
+
+    @abstractmethod
+    def run(self, run_dir: str, timeout: float) -> subprocess.CompletedProcess: ...
+    @abstractmethod
+    def healthy(self) -> bool: ...
+    @abstractmethod
+    def close(self) -> None: ...
+
+
+class DockerSlot(EngineSlot):
+    """A long-lived engine container with the runs directory mounted; jobs run via `docker exec`."""
+
+    def __init__(self, image: str = ENGINE_IMAGE, runs_dir: str = RUNS_BASE_DIR):
+        self.image, self.runs_dir = image, os.path.abspath(runs_dir)
+        self.name = f"edgepredict-engine-{uuid.uuid4().hex[:12]}"
+        self.entrypoint = self._entrypoint()
+        os.makedirs(self.runs_dir, exist_ok=True)
+        subprocess.run([
+            "docker", "run", "-d", "--rm", "--name", self.name,
+            "-v", f"{self.runs_dir}:{CONTAINER_RUNS_DIR}",
+            "--entrypoint", "sleep", self.image, "infinity"
+        ], check=True, capture_output=True, **_TEXT)
+        self._broken = False
+
+    def _entrypoint(self) -> list[str]:
+        out = subprocess.run(
+            ["docker", "image", "inspect", "-f", "{{json .Config.Entrypoint}}", self.image],
+            check=True, capture_output=True, **_TEXT
+        ).stdout.strip()
+        entrypoint = json.loads(out) if out and out != "null" else None
+        if not entrypoint: raise RuntimeError(f"Engine image {self.image} has no entrypoint to exec.")
+        return entrypoint
+
+    def run(self, run_dir: str, timeout: float) -> subprocess.CompletedProcess:
+        rel = os.path.relpath(os.path.abspath(run_dir), self.runs_dir).replace(os.sep, "/")
+        workdir = f"{CONTAINER_RUNS_DIR}/{rel}"
+        self.jobs += 1
+        try:
+            return engine_logs.run_logged(
+                ["docker", "exec", "-w", workdir, self.name, *self.entrypoint, f"{workdir}/input.json"], run_dir, timeout
+            )
+        except subprocess.TimeoutExpired:
+            # The engine keeps running inside the container after the exec client dies
+            self._broken = True
+            raise
+
+    def healthy(self) -> bool:
+        if self._broken: return False
+        result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", self.name], capture_output=True, **_TEXT)
+        return result.returncode == 0 and result.stdout.strip() == "true"
+
+    def close(self) -> None:
+        subprocess.run(["docker", "rm", "-f", self.name], capture_output=True)
+
+
+class LocalProcessSlot(EngineSlot):
+    """
+    A long-lived local engine process speaking a line protocol on stdin/stdout:
+    request  {"input": "<abs path to input.json>", "cwd": "<run dir>"}
+    response {"returncode": int, "stdout": str, "stderr": str}
+    """
+
+    def __init__(self, command: str = ENGINE_LOCAL_COMMAND):
+        self.process = subprocess.Popen(
+            [*shlex.split(command), "--serve"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=1, **_TEXT
+        )
+        self._broken = False
+
+    def run(self, run_dir: str, timeout: float) -> subprocess.CompletedProcess:
+        self.jobs += 1
+        run_dir = os.path.abspath(run_dir)
+        self.process.stdin.write(json.dumps({"input": os.path.join(run_dir, "input.json"), "cwd": run_dir}) + "\n")
+        self.process.stdin.flush()
+
+        reply = {}
+        reader = threading.Thread(target=lambda: reply.setdefault("line", self.process.stdout.readline()), daemon=True)
+        reader.start(); reader.join(timeout)
+        if reader.is_alive():
+            self._broken = True
+            self.process.kill()
+            raise subprocess.TimeoutExpired(self.process.args, timeout)
+        if not reply.get("line"):
+            # EOF: the process is exiting but may not be reaped yet, so poll() alone could still call it healthy
+            self._broken = True
+            try: returncode = self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired: self.process.kill(); returncode = -1
+            return subprocess.CompletedProcess(self.process.args, returncode or -1, "", "Engine process exited.")
+        response = json.loads(reply["line"])
+        stdout, stderr = engine_logs.append_output(run_dir, response.get("stdout", ""), response.get("stderr", ""))
+        return subprocess.CompletedProcess(self.process.args, response["returncode"], stdout, stderr)
+
+    def healthy(self) -> bool:
+        return not self._broken and self.process.poll() is None
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+
+
+class EnginePool:
+    """
+    Fixed-size pool of warm engine slots. Slots are created lazily, checked before
+    each job and replaced when unhealthy or after `max_jobs` jobs.
+    """
+
+    def __init__(self, slot_factory, size: int = ENGINE_POOL_SIZE, max_jobs: int = ENGINE_POOL_MAX_JOBS):
+        self.slot_factory, self.size, self.max_jobs = slot_factory, size, max_jobs
+        self._idle: "queue.Queue[Optional[EngineSlot]]" = queue.Queue()
+        for _ in range(size): self._idle.put(None)  # None = not started yet
+        self._closed = False
+
+    def _checkout(self) -> EngineSlot:
+        slot = self._idle.get()
+        if slot is not None and not slot.healthy():
+            print("Engine pool: replacing unhealthy engine slot.")
+            slot.close(); slot = None
+        if slot is None:
+            try:
+                slot = self.slot_factory()
+            except Exception:
+                self._idle.put(None)
+                raise
+        return slot
+
+    def _checkin(self, slot: EngineSlot) -> None:
+        if self._closed or slot.jobs >= self.max_jobs or not slot.healthy():
+            slot.close(); slot = None
+        self._idle.put(slot)
+
+    def run(self, run_dir: str, timeout: float) -> subprocess.CompletedProcess:
+        # engine_start: health check of a warm slot, or starting a new one
+        with metrics.stage("engine_start"):
+            slot = self._checkout()
+        try:
+            with metrics.stage("engine_run"):
+                return slot.run(run_dir, timeout)
+        finally:
+            self._checkin(slot)
+
+    def shutdown(self) -> None:
+        self._closed = True
+        while True:
+            try: slot = self._idle.get_nowait()
+            except queue.Empty: break
+            if slot is not None: slot.close()
+
+
+def run_docker_once(run_dir: str, timeout: float, image: str = ENGINE_IMAGE) -> subprocess.CompletedProcess:
+    """Cold path: a fresh `docker run --rm` container per job."""
+    docker_command = [
+        "docker", "run", "--rm",
+        "-v", f"{os.path.abspath(run_dir)}:/data",
+        image,
+        "/data/input.json"
+    ]
+    print(f"Running command: {' '.join(docker_command)}")
+    # Container start and engine run cannot be told apart here; both count as engine_run
+    with metrics.stage("engine_run"):
+        return engine_logs.run_logged(docker_command, run_dir, timeout, cwd=os.path.abspath(run_dir))
+
+
+_pool: Optional[EnginePool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> Optional[EnginePool]:
+    global _pool
+    if ENGINE_BACKEND not in ("pool", "local"): return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = EnginePool(DockerSlot if ENGINE_BACKEND == "pool" else LocalProcessSlot)
+        return _pool
+
+def run_engine(run_dir: str, timeout: float) -> subprocess.CompletedProcess:
+    """Runs the engine on `run_dir`/input.json with the configured backend."""
+    pool = get_pool()
+    if pool is None: return run_docker_once(run_dir, timeout)
+    if ENGINE_BACKEND == "pool" and os.path.relpath(os.path.abspath(run_dir), os.path.abspath(RUNS_BASE_DIR)).startswith(".."):
+        # Warm containers only mount RUNS_BASE_DIR
+        return run_docker_once(run_dir, timeout)
+    return pool.run(run_dir, timeout)
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(); _pool = None
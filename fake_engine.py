@@ -0,0 +1,70 @@
+"""
+Stand-in for the C++ engine, for running the worker and the engine pool without Docker.
+
+    python fake_engine.py <input.json>     one job, like the engine container
+    python fake_engine.py --serve          warm mode used by engine_pool.LocalProcessSlot
+
+It writes progress.json while "running" and a synthetic output.json with the same
+layout as the real engine. FAKE_ENGINE_STEPS, FAKE_ENGINE_DELAY (seconds per
+progress update) and FAKE_ENGINE_FAIL=1 control its behaviour.
+"""
+import json, math, os, sys, time
+
+STEPS = int(os.getenv("FAKE_ENGINE_STEPS", 1000))
+DELAY = float(os.getenv("FAKE_ENGINE_DELAY", 0.0))
+FAIL = os.getenv("FAKE_ENGINE_FAIL") == "1"
+
+
+def run_job(input_path: str) -> tuple[int, str]:
+    run_dir = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, "r") as f:
+        config = json.load(f)
+    if FAIL: return 1, "fake engine: failing on request (FAKE_ENGINE_FAIL=1)"
+
+    sim = config.get("simulation_parameters", {})
+    speed = float(sim.get("cutting_speed_m_min", 100) or 100)
+    output_name = config.get("file_paths", {}).get("output_results", "output.json")
+
+    for pct in range(0, 101, 10):
+        with open(os.path.join(run_dir, "progress.json"), "w") as f:
+            json.dump({"status": "RUNNING", "progress_percentage": pct}, f)
+        if DELAY: time.sleep(DELAY)
+
+    series = []
+    for i in range(STEPS):
+        t = i * 1e-3
+        series.append({
+            "time_s": t,
+            "max_temperature_C": 20 + speed * 4 * (1 - math.exp(-t * 5)) + 5 * math.sin(i / 7),
+            "max_stress_MPa": 400 + speed + 30 * math.sin(i / 11),
+            "total_accumulated_wear_m": 1e-7 * i * speed / 100,
+        })
+    output = {
+        "tool_life_prediction": {"predicted_hours": round(200.0 / speed, 3)},
+        "time_series_data": series,
+    }
+    with open(os.path.join(run_dir, output_name), "w") as f:
+        json.dump(output, f)
+    return 0, f"fake engine: {STEPS} steps written to {output_name}"
+
+def serve() -> None:
+    for line in sys.stdin:
+        if not line.strip(): continue
+        request = json.loads(line)
+        try:
+            code, message = run_job(request["input"])
+            response = {"returncode": code, "stdout": message if code == 0 else "", "stderr": "" if code == 0 else message}
+        except Exception as e:
+            response = {"returncode": 1, "stdout": "", "stderr": f"fake engine error: {e}"}
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve()
+    elif len(sys.argv) > 1:
+        code, message = run_job(sys.argv[1])
+        print(message, file=sys.stdout if code == 0 else sys.stderr)
+        sys.exit(code)
+    else:
+        print(__doc__, file=sys.stderr); sys.exit(2)
@@ -0,0 +1,40 @@
+import datetime, json
+from typing import Optional
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)): return obj.isoformat()
+    if isinstance(obj, np.ndarray): return obj.tolist()
+    if isinstance(obj, np.generic): return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj) -> bytes:
+    """Compact JSON bytes; orjson when installed (numpy arrays serialized natively, NaN -> null)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
+
+def splice(document: bytes, key: str, raw: Optional[bytes]) -> bytes:
+    """
+    Adds `key` to a serialized JSON object with `raw` (already-encoded JSON) as its value,
+    without parsing either: b'{"a":1}' + ("b", b'[2]') -> b'{"a":1,"b":[2]}'.
+    """
+    head = document.rstrip()
+    if not head.endswith(b"}"): raise ValueError("Not a JSON object document.")
+    head = head[:-1].rstrip()
+    separator = b"" if head.endswith(b"{") else b","
+    return head + separator + dumps(key) + b":" + (raw if raw is not None else b"null") + b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps` (orjson when available) for large payloads."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
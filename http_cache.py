@@ -0,0 +1,142 @@
+import gzip, hashlib, os
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from fastapi import Request, Response
+from dotenv import load_dotenv
+import fast_json
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip only
+    zstandard = None
+
+load_dotenv()
+
+# --- Response compression ---
+# Complete (non-streaming) bodies of compressible types above COMPRESS_MIN_BYTES are compressed,
+# zstd when the client accepts it and `zstandard` is installed, else gzip. Streams (SSE, log
+# follow, files) pass through untouched.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+# Larger bodies are compressed in the threadpool so the event loop keeps serving other requests
+COMPRESS_THREAD_MIN_BYTES = 256 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/csv", "text/html")
+
+# Cache-Control for content-addressed files: the bytes behind a URL never change
+IMMUTABLE = "private, max-age=31536000, immutable"
+# Clients may keep a copy but must revalidate it (cheap with If-None-Match)
+REVALIDATE = "private, no-cache"
+
+
+def _accepted(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"): continue
+        accepted.add(coding.strip())
+    return accepted
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted(accept_encoding)
+    if zstandard is not None and "zstd" in accepted: return "zstd"
+    if "gzip" in accepted: return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd": return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app, self.minimum_size = app, minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send); return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if message["status"] == 304:
+                    _not_modified_etag(MutableHeaders(raw=message["headers"]), request_headers.get("if-none-match", ""), encoding)
+                    await send(message); return
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                if content_type not in COMPRESSIBLE_TYPES or "content-encoding" in headers:
+                    await send(message); return
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                if encoding is None:
+                    await send(message); return
+                start = message  # held back until we know the body is complete and large enough
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message); return
+
+            body = message.get("body", b"")
+            pending, start = start, None
+            if message.get("more_body") or len(body) < self.minimum_size:
+                # Streamed or small: send as is
+                await send(pending); await send(message); return
+            if len(body) >= COMPRESS_THREAD_MIN_BYTES: body = await run_in_threadpool(compress, body, encoding)
+            else: body = compress(body, encoding)
+            headers = MutableHeaders(raw=pending["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            # A compressed representation needs its own strong validator
+            if headers.get("etag", "").endswith('"'): headers["ETag"] = headers["etag"][:-1] + f'-{encoding}"'
+            await send(pending)
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
+
+def _not_modified_etag(headers: MutableHeaders, if_none_match: str, encoding: Optional[str]) -> None:
+    # A 304 carries the ETag the 200 would have had. The endpoint only knows the uncompressed one;
+    # a client holding a compressed copy (suffixed tag) proves the body is compressible and large
+    # enough, so this request's 200 would be compressed with `encoding` too, or sent as is without one.
+    etag = headers.get("etag", "")
+    if not etag.startswith('"'): return
+    bare = _bare(etag)
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if tag != bare and _bare(tag) == bare:
+            headers["ETag"] = bare[:-1] + f'-{encoding}"' if encoding else bare
+            headers.add_vary_header("Accept-Encoding")
+            return
+
+
+# --- Conditional requests ---
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+def _bare(etag: str) -> str:
+    # Weak comparison (RFC 9110 13.1.2) that also accepts our compressed variants
+    etag = etag.strip()
+    if etag.startswith("W/"): etag = etag[2:]
+    for suffix in ('-gzip"', '-zstd"'):
+        if etag.endswith(suffix): return etag[:-len(suffix)] + '"'
+    return etag
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header: return False
+    if header.strip() == "*": return True
+    return _bare(etag) in {_bare(tag) for tag in header.split(",")}
+
+def not_modified_response(etag: str, cache_control: str = REVALIDATE, headers: Optional[dict] = None) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control, **(headers or {})})
+
+def json_response(request: Request, data, cache_control: str = REVALIDATE) -> Response:
+    """JSON response with a content-hash ETag; 304 when the client already has this content."""
+    body = fast_json.dumps(data)
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    if not_modified(request, etag): return not_modified_response(etag, cache_control)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": cache_control})
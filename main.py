@@ -1,22 +1,62 @@
-import subprocess, json, uuid, os, shutil, asyncio
+import subprocess, json, os, shutil, asyncio, secrets
 from typing import List, Optional
-from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Form, status
+from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Form, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from fastapi.responses import FileResponse
-import crud, models, schemas, security
-from database import SessionLocal, engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, JSONResponse
+import crud, models, schemas, security, results_store, timeseries, progress_bus, principal_cache, tool_storage, mesh_ingest, memoization, sweeps, scheduler, engine_logs, run_lifecycle, ai_analysis, material_library, http_cache, fast_json, email_service, email_outbox, metrics, schema_upgrade
+from principal_cache import Principal
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine
 # --- IMPORT datetime from datetime ---
-from datetime import timedelta, datetime 
-from worker import run_simulation_task
+from datetime import timedelta, datetime, timezone
+from email.utils import format_datetime
+from worker import run_simulation_task, ENGINE_IMAGE
+from engine_pool import RUNS_BASE_DIR
+from celery import group
 from dotenv import load_dotenv
 import httpx
+import numpy as np
 
 load_dotenv()
-models.Base.metadata.create_all(bind=engine)
+# Upper bound on explicitly listed ids per bulk admin call (access request approval, subscription updates)
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 5000))
+# Creates missing tables and adds columns/indexes introduced since the database was created
+schema_upgrade.upgrade(engine)
 app = FastAPI()
 
+@app.on_event("startup")
+def prepare_material_library():
+    # Property index for materials created before it existed, and the optional catalog seed file
+    db = SessionLocal()
+    try:
+        indexed = material_library.backfill_index(db)
+        seeded = material_library.seed_catalog(db)
+        if indexed or seeded: print(f"Material library: indexed {indexed} existing materials, seeded {seeded} catalog entries.")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def reset_stale_analyses():
+    # Analyses left PENDING/RUNNING by a process that died would otherwise never finish
+    reset = ai_analysis.reset_stale()
+    if reset: print(f"AI analysis: reset {reset} stale job(s).")
+
+@app.on_event("startup")
+def start_email_sender():
+    # Emails are queued in the outbox by requests and delivered by this background thread
+    email_outbox.start_sender()
+
+@app.on_event("shutdown")
+async def close_shared_clients():
+    await ai_analysis.close_client()
+    email_outbox.stop_sender()
+
+# Compresses large JSON/text responses (gzip, or zstd when available); see http_cache
+app.add_middleware(http_cache.CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -24,6 +64,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost: per-route latency and query counts for GET /metrics (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
 
 def get_db():
     db = SessionLocal()
@@ -32,14 +76,24 @@ def get_db():
     finally:
         db.close()
 
+# Non-blocking session for `async def` endpoints
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 oauth2_scheme = models.oauth2_scheme
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
     email = security.decode_access_token(token)
     if email is None: raise credentials_exception
-    user = crud.get_user_by_email(db, email=email)
-    if user is None: raise credentials_exception
+    # Cached principal (id, is_admin, subscription_expiry); the DB is only hit on a miss
+    user = principal_cache.cache.get(email)
+    if user is None:
+        db_user = await crud.get_user_by_email_async(db, email=email)
+        if db_user is None: raise credentials_exception
+        user = Principal.from_user(db_user)
+        principal_cache.cache.set(user)
     
     # --- FIX: Use naive datetime ---
     if not user.is_admin and user.subscription_expiry and user.subscription_expiry < datetime.now():
@@ -47,7 +101,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         
     return user
 
-async def get_current_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+async def get_current_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -55,6 +109,15 @@ async def get_current_admin_user(current_user: models.User = Depends(get_current
         )
     return current_user
 
+# --- Metrics (Prometheus text format; see metrics.py) ---
+@app.get("/metrics", include_in_schema=False)
+def read_metrics(request: Request):
+    if metrics.METRICS_TOKEN and not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {metrics.METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token.")
+    body = metrics.render()
+    if body is None: raise HTTPException(status_code=503, detail="Metrics are unavailable: prometheus_client is not installed.")
+    return Response(body, media_type=metrics.CONTENT_TYPE)
+
 # --- Auth Endpoints ---
 
 @app.post("/token", tags=["Authentication"])
@@ -71,21 +134,31 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me/", response_model=schemas.User, tags=["Users"])
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
+def read_users_me(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    db_user = crud.get_user(db, current_user.id, with_simulations=True)
+    if db_user is None: raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
+# Light profile for dashboard polling: no nested simulations/materials/tools
+@app.get("/users/me/profile", response_model=schemas.UserProfile, tags=["Users"])
+async def read_users_me_profile(current_user: Principal = Depends(get_current_user)):
     return current_user
 
 # --- Access Request Endpoints ---
 
 @app.post("/request-access", response_model=schemas.AccessRequest, tags=["Public"])
 def submit_access_request(request: schemas.AccessRequestCreate, db: Session = Depends(get_db)):
-    return crud.create_access_request(db=db, request=request)
+    db_req = crud.create_access_request(db=db, request=request)
+    try: email_service.notify_access_request(db, db_req)
+    except Exception as e: print(f"Failed to queue access request notification: {e}")
+    return db_req
 
 @app.get("/admin/access-requests", response_model=List[schemas.AccessRequest], tags=["Admin"])
 def get_access_requests(
     skip: int = 0, 
     limit: int = 100, 
     db: Session = Depends(get_db), 
-    admin: models.User = Depends(get_current_admin_user)
+    admin: Principal = Depends(get_current_admin_user)
 ):
     return crud.get_access_requests(db, skip=skip, limit=limit)
 
@@ -94,9 +167,27 @@ def update_access_request_status(
     request_id: int,
     status: str, 
     db: Session = Depends(get_db),
-    admin: models.User = Depends(get_current_admin_user)
+    admin: Principal = Depends(get_current_admin_user)
+):
+    db_req = crud.update_access_request_status(db, request_id, status)
+    if db_req:
+        try: email_service.notify_access_request_status(db, db_req)
+        except Exception as e: print(f"Failed to queue access request status email: {e}")
+    return db_req
+
+@app.post("/admin/access-requests/approve", response_model=List[schemas.AccessRequestApprovalResult], tags=["Admin"])
+def bulk_approve_access_requests(
+    approval: schemas.BulkAccessRequestApproval,
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
 ):
-    return crud.update_access_request_status(db, request_id, status)
+    """Approves many access requests and creates their accounts in one transaction."""
+    if len(approval.request_ids) > BULK_MAX_ITEMS: raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} requests per call.")
+    try:
+        return crud.bulk_approve_access_requests(db, approval.request_ids, approval.subscription_days, approval.notify)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="An account for one of these emails was created concurrently; nothing was changed, please retry.")
 
 # --- Admin User Management Endpoints ---
 
@@ -104,7 +195,7 @@ def update_access_request_status(
 def admin_create_user(
     user: schemas.AdminUserCreate,
     db: Session = Depends(get_db),
-    admin: models.User = Depends(get_current_admin_user)
+    admin: Principal = Depends(get_current_admin_user)
 ):
     db_user = crud.get_user_by_email(db, email=user.email)
     if db_user:
@@ -114,16 +205,58 @@ def admin_create_user(
 @app.get("/admin/users/", response_model=List[schemas.User], tags=["Admin"])
 def admin_get_all_users(
     db: Session = Depends(get_db),
-    admin: models.User = Depends(get_current_admin_user)
+    admin: Principal = Depends(get_current_admin_user)
 ):
     return crud.get_users(db)
 
+@app.get("/admin/overview", response_model=schemas.AdminOverview, tags=["Admin"])
+def admin_get_overview(
+    response: Response,
+    email: Optional[str] = None,
+    subscription: Optional[str] = Query(None, pattern="^(admin|unlimited|active|expiring|expired)$"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    """
+    One page of users (ordered by email, ?email= is a prefix search) with aggregate counts
+    instead of nested simulations/materials/tools. The next page's cursor is in X-Next-Cursor.
+    """
+    try:
+        users, total, next_cursor = crud.get_admin_overview(db, email_prefix=email, subscription=subscription, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor: response.headers["X-Next-Cursor"] = next_cursor
+    return {"total": total, "users": users, "totals": None if cursor else crud.get_admin_totals(db)}
+
+@app.post("/admin/users/subscriptions", response_model=schemas.BulkSubscriptionResult, tags=["Admin"])
+def admin_bulk_update_subscriptions(
+    update: schemas.BulkSubscriptionUpdate,
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    """
+    Extends, expires or sets subscriptions for every matching non-admin user in one transaction
+    (a page of users per UPDATE). Returns counts per outcome; the per-user list only when user_ids were given.
+    """
+    if update.user_ids is None and not update.email_prefix and not update.subscription and not update.all_users:
+        raise HTTPException(status_code=400, detail="Give user_ids, email_prefix or subscription, or set all_users.")
+    if update.user_ids is not None and len(update.user_ids) > BULK_MAX_ITEMS: raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} user ids per call.")
+    if update.action == "extend" and not update.days: raise HTTPException(status_code=400, detail="extend needs days.")
+    if update.action == "set" and update.expiry is None: raise HTTPException(status_code=400, detail="set needs expiry.")
+    expiry = update.expiry.astimezone().replace(tzinfo=None) if update.expiry and update.expiry.tzinfo else update.expiry
+    return crud.bulk_update_subscriptions(
+        db, update.action, days=update.days, expiry=expiry,
+        user_ids=update.user_ids, email_prefix=update.email_prefix, subscription=update.subscription
+    )
+
 @app.patch("/admin/users/{user_id}", response_model=schemas.User, tags=["Admin"])
 def admin_update_user_details(
     user_id: int,
     user_update: schemas.AdminUserUpdate,
     db: Session = Depends(get_db),
-    admin: models.User = Depends(get_current_admin_user)
+    admin: Principal = Depends(get_current_admin_user)
 ):
     db_user = crud.admin_update_user(db, user_id=user_id, user_update=user_update)
     if db_user is None:
@@ -135,7 +268,7 @@ def admin_reset_user_password(
     user_id: int,
     password_reset: schemas.AdminUserPasswordReset, # <--- CORRECT
     db: Session = Depends(get_db),
-    admin: models.User = Depends(get_current_admin_user)
+    admin: Principal = Depends(get_current_admin_user)
 ):
     db_user = crud.admin_reset_user_password(db, user_id=user_id, new_password=password_reset.new_password)
     if db_user is None:
@@ -146,7 +279,7 @@ def admin_reset_user_password(
 def admin_delete_user(
     user_id: int,
     db: Session = Depends(get_db),
-    admin: models.User = Depends(get_current_admin_user)
+    admin: Principal = Depends(get_current_admin_user)
 ):
     if admin.id == user_id:
         raise HTTPException(status_code=400, detail="Cannot delete your own account.")
@@ -156,10 +289,97 @@ def admin_delete_user(
         raise HTTPException(status_code=404, detail="User not found")
     return None
 
+@app.get("/admin/queues", response_model=List[schemas.QueueStats], tags=["Admin"])
+def admin_get_queue_stats(
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    return scheduler.queue_stats(db)
+
+@app.get("/admin/email-outbox", tags=["Admin"])
+def admin_get_email_outbox(
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    """Queued, sent and failed emails by status, and whether this process runs a sender."""
+    return email_outbox.outbox_stats(db)
+
+@app.get("/admin/storage", tags=["Admin"])
+def admin_get_storage_stats(
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    """Disk used by run directories and archives, per user and in total."""
+    return run_lifecycle.disk_stats(db)
+
+@app.post("/admin/storage/sweep", tags=["Admin"])
+def admin_sweep_storage(
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    """Runs the run-directory lifecycle policy now instead of waiting for the periodic sweep."""
+    return run_lifecycle.sweep(db)
+
+@app.put("/admin/materials/catalog", tags=["Admin"])
+def admin_upsert_material_catalog(
+    materials: List[schemas.MaterialCreate],
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    """Adds or replaces global catalog materials (matched by name)."""
+    report = material_library.upsert_catalog(db, materials)
+    return {**report, "etag": material_library.get_catalog(db).etag}
+
+@app.delete("/admin/materials/catalog/{material_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Admin"])
+def admin_delete_catalog_material(
+    material_id: int,
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    if not material_library.delete_catalog_material(db, material_id): raise HTTPException(status_code=404, detail="Catalog material not found")
+    return None
+
 # --- Simulation / Tool / Material Endpoints (Existing) ---
 
+def _mark_failed(db: Session, simulation_id: int, owner_id: int, error: str):
+    db.query(models.Simulation).filter(models.Simulation.id == simulation_id).update({"status": "FAILED", "results": json.dumps({"error": error})})
+    db.commit()
+    progress_bus.publish(simulation_id, owner_id, "FAILED")
+    # The row was committed PENDING first, so identical submissions may already have joined it
+    for joined in memoization.fail_joined(db, simulation_id, f"The identical run this simulation was waiting on failed: {error}"):
+        progress_bus.publish(joined.id, joined.owner_id, joined.status)
+
+
+def _build_engine_input(simulation_parameters: dict, physics_parameters: dict, material_properties: dict, cfd_parameters: dict, tool_filename: str) -> dict:
+    cfd_params_dict = dict(cfd_parameters or {})
+    cfd_params_dict["enable_cfd"] = True
+    return {
+        "simulation_parameters": simulation_parameters,
+        "physics_parameters": physics_parameters,
+        "material_properties": material_properties,
+        "cfd_parameters": cfd_params_dict,
+        "file_paths": {"tool_geometry": tool_filename, "output_results": "output.json"}
+    }
+
+def _stage_run_dir(simulation_id: int, tool_path: str, tool_filename: str, engine_input: dict) -> str:
+    """Creates simulation_runs/sim_{id} with the linked tool and input.json; raises RuntimeError."""
+    os.makedirs(RUNS_BASE_DIR, exist_ok=True)
+    run_dir = run_lifecycle.run_dir(simulation_id)
+    if os.path.exists(run_dir): shutil.rmtree(run_dir)
+    os.makedirs(run_dir, exist_ok=True)
+
+    # Hardlink/reflink the stored geometry instead of copying it into every run
+    try: tool_storage.stage(tool_path, os.path.join(run_dir, tool_filename))
+    except Exception as e: shutil.rmtree(run_dir); raise RuntimeError(f"Tool copy failed: {e}")
+
+    try:
+        with open(os.path.join(run_dir, "input.json"), "w") as f:
+            json.dump(engine_input, f, indent=4)
+    except Exception as e: shutil.rmtree(run_dir); raise RuntimeError(f"Input generation failed: {e}")
+    return run_dir
+
 @app.post("/simulations/", response_model=schemas.Simulation, tags=["Simulations"])
-def create_simulation(name: str = Form(...), description: str = Form(...), simulation_parameters: str = Form(...), physics_parameters: str = Form(...), material_properties: str = Form(...), cfd_parameters: str = Form(...), tool_id: Optional[int] = Form(None), tool_file: Optional[UploadFile] = File(None), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_simulation(name: str = Form(...), description: str = Form(...), simulation_parameters: str = Form(...), physics_parameters: str = Form(...), material_properties: str = Form(...), cfd_parameters: str = Form(...), tool_id: Optional[int] = Form(None), tool_file: Optional[UploadFile] = File(None), force_rerun: bool = Form(False), db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if tool_id is None and tool_file is None: raise HTTPException(status_code=400, detail="Tool must be provided.")
     try:
         db_simulation = crud.create_user_simulation(db=db, simulation=schemas.SimulationCreate(name=name, description=description), user_id=current_user.id)
@@ -170,16 +390,23 @@ def create_simulation(name: str = Form(...), description: str = Form(...), simul
     actual_tool_id = tool_id
     tool_filename = None
     if tool_file:
-        upload_dir = "tool_library_files"; os.makedirs(upload_dir, exist_ok=True)
-        safe_filename = f"{uuid.uuid4()}_{tool_file.filename.replace('..', '').replace('/', '').replace('\\', '')}"
-        file_path = os.path.join(upload_dir, safe_filename)
+        file_path = content_hash = None
         try:
-            with open(file_path, "wb") as buffer: shutil.copyfileobj(tool_file.file, buffer)
-            new_db_tool = crud.create_user_tool(db=db, tool=schemas.ToolCreate(name=f"{name} (Uploaded)", tool_type="Other"), file_path=file_path, user_id=current_user.id)
+            # Until the Tool row is committed nothing counts as a reference to the blob: hold off removals
+            with tool_storage.blob_lock():
+                file_path, content_hash, file_size = tool_storage.store_upload(tool_file.file, tool_file.filename)
+                mesh_info = _ingest_tool_file(db, file_path, content_hash, tool_file.filename)
+                new_db_tool = crud.create_user_tool(db=db, tool=schemas.ToolCreate(name=f"{name} (Uploaded)", tool_type="Other"), file_path=file_path, user_id=current_user.id, content_hash=content_hash, file_size=file_size, mesh_info=mesh_info)
             actual_tool_id = new_db_tool.id
+        except mesh_ingest.MeshError as e:
+            db.rollback()
+            _release_tool_file(db, file_path, content_hash)
+            db.query(models.Simulation).filter(models.Simulation.id == db_simulation.id).update({"status": "FAILED"})
+            db.commit()
+            raise HTTPException(status_code=422, detail=f"Invalid tool geometry: {e}")
         except Exception as e:
             db.rollback(); 
-            if os.path.exists(file_path): os.remove(file_path)
+            if file_path: _release_tool_file(db, file_path, content_hash)
             raise HTTPException(status_code=500, detail=f"Failed to process uploaded tool: {e}")
 
     try:
@@ -187,98 +414,416 @@ def create_simulation(name: str = Form(...), description: str = Form(...), simul
         db.commit()
     except Exception as e: db.rollback(); raise HTTPException(status_code=500, detail=f"Failed to link tool: {e}")
 
-    RUNS_BASE_DIR = "simulation_runs"; os.makedirs(RUNS_BASE_DIR, exist_ok=True)
-    run_dir = os.path.join(RUNS_BASE_DIR, f"sim_{db_simulation.id}")
-    if os.path.exists(run_dir): shutil.rmtree(run_dir)
-    os.makedirs(run_dir, exist_ok=True)
-    
     db_tool = db.query(models.Tool).filter(models.Tool.id == actual_tool_id).first()
     if not db_tool or db_tool.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Invalid tool selected.")
     tool_filename = tool_filename or os.path.basename(db_tool.file_path)
-    try: shutil.copy(db_tool.file_path, os.path.join(run_dir, tool_filename))
-    except Exception as e: shutil.rmtree(run_dir); raise HTTPException(status_code=500, detail=f"Tool copy failed: {e}")
-
     try:
         try: cfd_params_dict = json.loads(cfd_parameters)
         except: cfd_params_dict = {}
-        cfd_params_dict["enable_cfd"] = True
-        with open(os.path.join(run_dir, "input.json"), "w") as f:
-            json.dump({
-                "simulation_parameters": json.loads(simulation_parameters),
-                "physics_parameters": json.loads(physics_parameters),
-                "material_properties": json.loads(material_properties),
-                "cfd_parameters": cfd_params_dict,
-                "file_paths": {"tool_geometry": tool_filename, "output_results": "output.json"}
-            }, f, indent=4)
-    except Exception as e: shutil.rmtree(run_dir); raise HTTPException(status_code=500, detail=f"Input generation failed: {e}")
-
-    try: run_simulation_task.delay(db_simulation.id, run_dir)
+        engine_input = _build_engine_input(json.loads(simulation_parameters), json.loads(physics_parameters), json.loads(material_properties), cfd_params_dict, tool_filename)
+    except Exception as e: raise HTTPException(status_code=500, detail=f"Input generation failed: {e}")
+
+    # --- Reuse an identical completed run, or join an identical in-flight one ---
+    db_simulation.input_fingerprint = memoization.input_fingerprint(engine_input, db_tool.content_hash or tool_storage.hash_file(db_tool.file_path), ENGINE_IMAGE)
+    source = None if force_rerun else memoization.find_reusable(db, db_simulation.input_fingerprint, current_user.id, exclude_id=db_simulation.id)
+    if source is not None:
+        memoization.adopt(db_simulation, source)
+    db.commit()
+    if source is not None:
+        db.refresh(db_simulation); return db_simulation
+
+    # Failures from here on mark the row FAILED so later submissions never join a run that will not start
+    try: run_dir = _stage_run_dir(db_simulation.id, db_tool.file_path, tool_filename, engine_input)
+    except RuntimeError as e: _mark_failed(db, db_simulation.id, current_user.id, str(e)); raise HTTPException(status_code=500, detail=str(e))
+
+    # Interactive (or admin) queue, with a fair-share priority level among this user's waiting runs
+    queue = scheduler.choose_queue(current_user.is_admin)
+    [priority] = scheduler.fair_share_priorities(db, current_user.id, queue)
+    scheduler.mark_queued(db_simulation, queue, priority)
+    db.commit()
+    try: run_simulation_task.apply_async((db_simulation.id, run_dir), queue=queue, priority=priority)
     except Exception as e:
          shutil.rmtree(run_dir)
-         db.query(models.Simulation).filter(models.Simulation.id == db_simulation.id).update({"status": "FAILED"})
-         db.commit()
+         _mark_failed(db, db_simulation.id, current_user.id, f"Celery task failed: {e}")
          raise HTTPException(status_code=500, detail=f"Celery task failed: {e}")
 
     db.refresh(db_simulation); return db_simulation
 
+# --- Progress streaming (Server-Sent Events fed by the worker through Redis pub/sub) ---
+
+async def _progress_snapshot(db: AsyncSession, db_sim: models.Simulation) -> dict:
+    if db_sim.status in progress_bus.TERMINAL_STATUSES:
+        return {"simulation_id": db_sim.id, "status": db_sim.status, "progress_percentage": 100 if db_sim.status == "COMPLETED" else 0}
+    # A run that joined an identical in-flight simulation reports that run's progress
+    snapshot = await progress_bus.get_snapshot_async(await memoization.run_source_id_async(db, db_sim))
+    if snapshot: return {**snapshot, "simulation_id": db_sim.id}
+    return {"simulation_id": db_sim.id, "status": db_sim.status, "progress_percentage": 0}
+
+@app.get("/simulations/events", tags=["Simulations"])
+async def stream_user_simulation_events(request: Request, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    """One stream multiplexing progress and status events for all of the user's runs."""
+    active = await crud.get_active_simulations_async(db, current_user.id, progress_bus.TERMINAL_STATUSES)
+    initial = [await _progress_snapshot(db, s) for s in active]
+    channels = [progress_bus.user_channel(current_user.id)]
+    return StreamingResponse(
+        progress_bus.stream_events(channels, initial, request.is_disconnected),
+        media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/simulations/{simulation_id}/events", tags=["Simulations"])
+async def stream_simulation_events(simulation_id: int, request: Request, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    """Progress and status events for one run; the stream ends once the run completes or fails."""
+    db_sim = await crud.get_simulation_async(db, simulation_id)
+    if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+    channels = [progress_bus.simulation_channel(simulation_id)]
+    source_id = await memoization.run_source_id_async(db, db_sim)
+    if source_id != simulation_id: channels.append(progress_bus.simulation_channel(source_id))
+    return StreamingResponse(
+        progress_bus.stream_events(channels, [await _progress_snapshot(db, db_sim)], request.is_disconnected, stop_after=simulation_id),
+        media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/simulations/{simulation_id}/progress", tags=["Simulations"])
-def get_simulation_progress(simulation_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_simulation_progress(simulation_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     db_sim = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
     if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
     if db_sim.status in ["COMPLETED", "FAILED"]: return {"status": db_sim.status, "progress_percentage": 100 if db_sim.status == "COMPLETED" else 0}
-    progress_file = os.path.join("simulation_runs", f"sim_{simulation_id}", "progress.json")
+    source_id = memoization.run_source_id(db, db_sim)
+    snapshot = progress_bus.get_snapshot(source_id)
+    if snapshot: return {**snapshot, "simulation_id": simulation_id}
+    position = scheduler.queue_position(db, db_sim)
+    if position: return {"status": "STARTING", "progress_percentage": 0, **position}
+    progress_file = os.path.join(run_lifecycle.run_dir(source_id), "progress.json")
     if os.path.exists(progress_file):
         try:
-            with open(progress_file, 'r') as f: return json.load(f)
+            with open(progress_file, 'r') as f: progress = json.load(f)
         except: return {"status": "RUNNING", "progress_percentage": 0}
+        # As in progress_bus.ProgressWatcher: the run is RUNNING until the worker has stored its results
+        if "status" in progress: progress["engine_status"] = progress.pop("status")
+        return {**progress, "status": "RUNNING"}
     return {"status": "STARTING", "progress_percentage": 0}
 
-@app.get("/simulations/", response_model=List[schemas.Simulation], tags=["Simulations"])
-def read_simulations(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return db.query(models.Simulation).filter(models.Simulation.owner_id == current_user.id).all()
+@app.get("/simulations/{simulation_id}/queue", response_model=schemas.QueuePosition, tags=["Simulations"])
+def get_simulation_queue_position(simulation_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """Queue position and estimated start time of a run that has not started yet."""
+    db_sim = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
+    if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+    position = scheduler.queue_position(db, db_sim)
+    if position is None: raise HTTPException(status_code=409, detail=f"Simulation is not queued (status: {db_sim.status}).")
+    return position
 
-@app.get("/simulations/{simulation_id}", response_model=schemas.Simulation, tags=["Simulations"])
-def read_simulation(simulation_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+# --- Engine logs (written by the worker to <run_dir>/engine.log, see engine_logs) ---
+
+LOG_FOLLOW_POLL_SECONDS = 1.0
+
+async def _follow_log(run_dir: str, simulation_id: int, position: engine_logs.Position, is_disconnected):
+    # Sends appended log lines until the run reaches a terminal status and the log is drained
+    while not await is_disconnected():
+        data, position = await run_in_threadpool(engine_logs.read_new, run_dir, position)
+        if data:
+            yield data; continue
+        async with AsyncSessionLocal() as db:
+            db_sim = await crud.get_simulation_async(db, simulation_id)
+        if db_sim is None or db_sim.status in progress_bus.TERMINAL_STATUSES:
+            while True:
+                data, position = await run_in_threadpool(engine_logs.read_new, run_dir, position)
+                if not data: return
+                yield data
+        await asyncio.sleep(LOG_FOLLOW_POLL_SECONDS)
+
+@app.get("/simulations/{simulation_id}/logs", tags=["Simulations"])
+async def read_simulation_logs(
+    simulation_id: int,
+    request: Request,
+    tail: int = Query(200, ge=1, le=10000),
+    follow: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Last `tail` lines of the engine output; with follow=true the response stays open and streams new lines."""
+    db_sim = await crud.get_simulation_async(db, simulation_id)
+    if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+    # A run that joined an identical in-flight simulation shows that run's log
+    source_id = await memoization.run_source_id_async(db, db_sim)
+    run_dir = run_lifecycle.run_dir(source_id)
+    text, position = await run_in_threadpool(engine_logs.tail, run_dir, tail)
+    if not follow:
+        if not text and not os.path.exists(engine_logs.log_path(run_dir)): raise HTTPException(status_code=404, detail="No engine log for this simulation.")
+        return PlainTextResponse(text)
+
+    async def body():
+        if text: yield text.encode("utf-8")
+        async for chunk in _follow_log(run_dir, source_id, position, request.is_disconnected):
+            yield chunk
+    return StreamingResponse(body(), media_type="text/plain; charset=utf-8", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Run artifacts (live run directory, or its archive once run_lifecycle packed it) ---
+
+@app.get("/simulations/{simulation_id}/artifacts", tags=["Simulations"])
+def list_simulation_artifacts(simulation_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     db_sim = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
     if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
-    return db_sim
+    files = run_lifecycle.list_artifacts(memoization.run_source_id(db, db_sim))
+    if files is None: raise HTTPException(status_code=404, detail="Run files are no longer available.")
+    return files
 
-@app.post("/simulations/{simulation_id}/analyze", tags=["Simulations"])
-async def analyze_simulation(simulation_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+@app.get("/simulations/{simulation_id}/artifacts/{name:path}", tags=["Simulations"])
+def get_simulation_artifact(simulation_id: int, name: str, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     db_sim = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
     if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
-    if not db_sim.results: raise HTTPException(status_code=404, detail="Results not ready.")
+    source_id = memoization.run_source_id(db, db_sim)
+    path = run_lifecycle.artifact_file(source_id, name)
+    if path: return FileResponse(path, filename=os.path.basename(name))
+    chunks = run_lifecycle.archived_artifact(source_id, name)
+    if chunks is None: raise HTTPException(status_code=404, detail="Artifact not found.")
+    return StreamingResponse(chunks, media_type="application/octet-stream", headers={"Content-Disposition": f'attachment; filename="{os.path.basename(name)}"'})
+
+@app.get("/simulations/", response_model=List[schemas.SimulationListItem], response_model_exclude_unset=True, response_class=fast_json.FastJSONResponse, tags=["Simulations"])
+def read_simulations(
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    order_by: str = "id",
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    # ?fields=id,name,status selects columns; results/material_properties are only sent when listed.
+    # ?order_by=max_temp_C (or -max_temp_C for descending) sorts on an indexed metric column, and
+    # min_<metric>/max_<metric> filter on it, e.g. ?min_life_hours=2&max_max_temp_C=800.
+    # The cursor for the next page is returned in the X-Next-Cursor header.
+    selected = crud.SIMULATION_DEFAULT_FIELDS
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in crud.SIMULATION_LIST_FIELDS]
+        if unknown: raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    descending = order_by.startswith("-")
+    order_field = order_by.lstrip("-")
+    if order_field not in crud.SIMULATION_ORDER_FIELDS:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of: {', '.join(crud.SIMULATION_ORDER_FIELDS)}")
+
+    ranges = {}
+    for metric in crud.SIMULATION_METRIC_FIELDS:
+        try:
+            bounds = [request.query_params.get(f"{prefix}_{metric}") for prefix in ("min", "max")]
+            bounds = [None if b is None else float(b) for b in bounds]
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid range for {metric}.")
+        if bounds != [None, None]: ranges[metric] = tuple(bounds)
 
     try:
-        results = json.loads(db_sim.results)
-        if results.get("ai_analysis"): return {"analysis": results["ai_analysis"]}
+        rows, next_cursor = crud.get_simulations_page(
+            db, user_id=current_user.id, fields=selected, limit=limit, cursor=cursor,
+            order_by=order_field, descending=descending, ranges=ranges
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor: response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+# Upper bound on runs per comparison (each one is decompressed and resampled)
+COMPARE_MAX_RUNS = 10
+
+@app.get("/simulations/compare", response_class=fast_json.FastJSONResponse, tags=["Simulations"])
+def compare_simulations(
+    ids: str,
+    fields: Optional[str] = None,
+    points: int = Query(500, ge=2, le=20000),
+    grid: str = Query("overlap", pattern="^(overlap|union)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Aligns several completed runs on one time grid. Deltas and delta stats are relative to the
+    first id (the baseline). grid=overlap covers the time range all runs share, grid=union the
+    full range (values outside a run's own range are null).
+    """
+    try: sim_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError: raise HTTPException(status_code=400, detail="ids must be a comma-separated list of simulation ids.")
+    if not 2 <= len(sim_ids) <= COMPARE_MAX_RUNS: raise HTTPException(status_code=400, detail=f"Compare between 2 and {COMPARE_MAX_RUNS} simulations.")
+    sims = {s.id: s for s in db.query(models.Simulation).filter(models.Simulation.id.in_(sim_ids))}
+    for sim_id in sim_ids:
+        db_sim = sims.get(sim_id)
+        if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+        if db_sim.status != "COMPLETED": raise HTTPException(status_code=404, detail=f"Results of simulation {sim_id} not ready.")
+
+    available = {sim_id: results_store.timeseries_fields(sims[sim_id]) for sim_id in sim_ids}
+    missing = [sim_id for sim_id, names in available.items() if not names]
+    if missing: raise HTTPException(status_code=404, detail=f"No time-series data for simulation(s) {', '.join(map(str, missing))}.")
+    time_fields = {sim_id: timeseries.find_time_field(names) for sim_id, names in available.items()}
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
 
-        ts = results.get("time_series_data", [])
-        if not ts: raise HTTPException(status_code=404, detail="No time-series data.")
+    # Only the compared columns (plus each run's time axis) are decompressed
+    axes, numeric = [], []
+    for sim_id in sim_ids:
+        time_field = time_fields[sim_id]
+        wanted = [*(requested or available[sim_id]), *([time_field] if time_field else [])]
+        columns = results_store.load_columns(sims[sim_id], fields=wanted)
+        run = {k: np.asarray(v, dtype=np.float64) for k, v in columns.items() if isinstance(v, np.ndarray)}
+        n = len(next(iter(run.values()))) if run else 0
+        axes.append(run.pop(time_field) if time_field in run else np.arange(n, dtype=np.float64))
+        numeric.append(run)
+    if requested is None:
+        # Default: every numeric field the runs have in common
+        requested = [f for f in numeric[0] if all(f in run for run in numeric[1:])]
+    unknown = [f for f in requested if not all(f in run for run in numeric)]
+    if unknown: raise HTTPException(status_code=400, detail=f"Unknown or non-numeric fields (in at least one run): {', '.join(unknown)}")
+    if not requested: raise HTTPException(status_code=400, detail="The simulations have no numeric fields in common.")
 
-        metrics = {
-            "life_hours": results.get("tool_life_prediction", {}).get("predicted_hours", 0),
-            "max_temp_C": max((s.get("max_temperature_C", 0) or 0) for s in ts),
-            "max_stress_MPa": max((s.get("max_stress_MPa", 0) or 0) for s in ts),
-            "wear_microns": max((s.get("total_accumulated_wear_m", 0) or 0) for s in ts) * 1e6
+    time_grid = timeseries.common_grid(axes, points, grid)
+    if not len(time_grid): raise HTTPException(status_code=400, detail="The simulations' time ranges do not overlap; use grid=union.")
+    keys = [str(sim_id) for sim_id in sim_ids]
+    result = {}
+    for field in requested:
+        matrix = np.vstack([timeseries.resample(x, run[field], time_grid) for x, run in zip(axes, numeric)])
+        compared = timeseries.compare_stats(matrix)
+        result[field] = {
+            "values": {key: results_store.to_list(row) for key, row in zip(keys, matrix)},
+            "deltas": {key: results_store.to_list(row) for key, row in zip(keys[1:], compared["deltas"][1:])},
+            "stats": dict(zip(keys, compared["stats"])),
+            "delta_stats": dict(zip(keys[1:], compared["delta_stats"][1:])),
         }
-        
-        analysis = await get_ai_analysis(json.dumps(ts), metrics)
-        
-        if not analysis.startswith("Error:"):
-            results["ai_analysis"] = analysis
-            db_sim.results = json.dumps(results)
-            db.commit()
-        return {"analysis": analysis}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Report generation failed: {e}")
+
+    return {
+        "simulation_ids": sim_ids,
+        "baseline_id": sim_ids[0],
+        "time_fields": {str(sim_id): time_field for sim_id, time_field in time_fields.items()},
+        "grid": grid,
+        "points": len(time_grid),
+        "time": results_store.to_list(time_grid),
+        "fields": result,
+    }
+
+def _simulation_etag(db_sim: models.Simulation, results_format: str) -> str:
+    # updated_at plus the state columns, so rows written before updated_at existed still change validator
+    return http_cache.make_etag(
+        "simulation", db_sim.id, db_sim.updated_at, db_sim.status, db_sim.analysis_status,
+        db_sim.timeseries_path, db_sim.timeseries_points, db_sim.finished_at, results_format
+    )
+
+# Everything in the detail response except `results`, read straight from the row
+SIMULATION_DETAIL_FIELDS = [f for f in schemas.Simulation.model_fields if f != "results"]
+
+@app.get("/simulations/{simulation_id}", response_model=schemas.Simulation, tags=["Simulations"])
+def read_simulation(
+    simulation_id: int,
+    request: Request,
+    results_format: str = Query("string", pattern="^(string|object)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    results_format=string (default) sends `results` as a JSON-encoded string, as before;
+    results_format=object inlines the stored document as a JSON object so clients parse it once.
+    """
+    db_sim = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
+    if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+    # Validators come from the row version: a 304 never loads the results blob or artifact
+    headers = {"ETag": _simulation_etag(db_sim, results_format), "Cache-Control": http_cache.REVALIDATE}
+    if db_sim.updated_at: headers["Last-Modified"] = format_datetime(db_sim.updated_at.astimezone(timezone.utc), usegmt=True)
+    if http_cache.not_modified(request, headers["ETag"]): return Response(status_code=304, headers=headers)
+
+    # The body is assembled as bytes: the stored results are spliced in, never parsed and re-encoded
+    results = results_store.results_json(db_sim)
+    if results is not None and results_format == "string": results = fast_json.dumps(results.decode("utf-8"))
+    meta = fast_json.dumps({f: getattr(db_sim, f) for f in SIMULATION_DETAIL_FIELDS})
+    return Response(content=fast_json.splice(meta, "results", results), media_type="application/json", headers=headers)
+
+@app.get("/simulations/{simulation_id}/timeseries", response_class=fast_json.FastJSONResponse, tags=["Simulations"])
+def read_simulation_timeseries(
+    simulation_id: int,
+    fields: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    max_points: int = Query(2000, ge=10, le=100000),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    db_sim = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
+    if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+    if db_sim.status != "COMPLETED": raise HTTPException(status_code=404, detail="Results not ready.")
+
+    available = results_store.timeseries_fields(db_sim)
+    if not available: raise HTTPException(status_code=404, detail="No time-series data.")
+    time_field = timeseries.find_time_field(available)
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else [f for f in available if f != time_field]
+
+    # Only the requested columns (plus the time axis) are decompressed
+    columns = results_store.load_columns(db_sim, fields=[*requested, *([time_field] if time_field else [])])
+    numeric = {k: np.asarray(v, dtype=np.float64) for k, v in columns.items() if isinstance(v, np.ndarray)}
+    if not fields: requested = [f for f in requested if f in numeric]
+    unknown = [f for f in requested if f not in numeric]
+    if unknown: raise HTTPException(status_code=400, detail=f"Unknown or non-numeric fields: {', '.join(unknown)}")
+    if not requested and time_field not in numeric: raise HTTPException(status_code=404, detail="No time-series data.")
+
+    n = len(next(iter(numeric.values())))
+    x = numeric[time_field] if time_field else np.arange(n, dtype=np.float64)
+    window = timeseries.window(x, start, end)
+    x = x[window]
+    selected = {f: numeric[f][window] for f in requested}
+    idx = timeseries.downsample(x, selected, max_points, method)
+
+    return {
+        "simulation_id": simulation_id,
+        "time_field": time_field,
+        "method": method,
+        "total_points": n,
+        "window_points": len(x),
+        "returned_points": len(idx),
+        "time": results_store.to_list(x[idx]),
+        "fields": {f: results_store.to_list(y[idx]) for f, y in selected.items()},
+    }
+
+def _analysis_state(db_sim: models.Simulation, summary: dict) -> dict:
+    return {
+        "simulation_id": db_sim.id,
+        "status": db_sim.analysis_status or ("COMPLETED" if summary.get(ai_analysis.ANALYSIS_KEY) else "NONE"),
+        "analysis": summary.get(ai_analysis.ANALYSIS_KEY),
+        "error": summary.get(ai_analysis.ERROR_KEY),
+    }
+
+@app.post("/simulations/{simulation_id}/analyze", tags=["Simulations"])
+async def analyze_simulation(simulation_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    """
+    Returns the AI analysis when it exists (or is cached for identical results), otherwise
+    starts it in the background and answers 202; poll GET /simulations/{id}/analysis.
+    """
+    db_sim = await crud.get_simulation_async(db, simulation_id, with_results=True)
+    if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+    if db_sim.status != "COMPLETED" or not db_sim.results: raise HTTPException(status_code=404, detail="Results not ready.")
+
+    summary = results_store.load_summary(db_sim)
+    if summary.get(ai_analysis.ANALYSIS_KEY): return _analysis_state(db_sim, summary)
+    if ai_analysis.in_progress(db_sim): return JSONResponse(status_code=202, content=_analysis_state(db_sim, summary))
+
+    try: key = ai_analysis.cache_key(await run_in_threadpool(ai_analysis.results_hash, db_sim, summary))
+    except ValueError as e: raise HTTPException(status_code=500, detail=str(e))
+    cached = await ai_analysis.cache_get(key)
+    if cached:
+        ai_analysis.store(db_sim, summary, cached)
+        await db.commit()
+        return _analysis_state(db_sim, summary)
+
+    # Another API worker may have claimed it since the check above; then that worker runs it
+    if await ai_analysis.claim(db, simulation_id): ai_analysis.start(simulation_id, key)
+    await db.refresh(db_sim)
+    return JSONResponse(status_code=202, content=_analysis_state(db_sim, summary))
+
+@app.get("/simulations/{simulation_id}/analysis", tags=["Simulations"])
+async def read_simulation_analysis(simulation_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    db_sim = await crud.get_simulation_async(db, simulation_id, with_results=True)
+    if not db_sim or db_sim.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Not authorized")
+    return _analysis_state(db_sim, results_store.load_summary(db_sim) or {})
     
 # --- NEW: Delete Simulation Endpoint ---
 @app.delete("/simulations/{simulation_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Simulations"])
 def delete_simulation(
     simulation_id: int, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # 1. Check existence
     db_sim = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
@@ -289,51 +834,227 @@ def delete_simulation(
     if not current_user.is_admin and db_sim.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this simulation")
 
-    # 3. Delete files from disk
-    run_dir = os.path.join("simulation_runs", f"sim_{simulation_id}")
-    if os.path.exists(run_dir):
-        try:
-            shutil.rmtree(run_dir) # Recursively delete folder
-        except Exception as e:
-            print(f"Error deleting simulation files: {e}")
+    # 3. Delete files from disk (run directory or its archive)
+    try:
+        run_lifecycle.delete_run_files(simulation_id)
+    except Exception as e:
+        print(f"Error deleting simulation files: {e}")
+
+    results_store.delete_results(simulation_id)
+    for joined in memoization.fail_joined(db, simulation_id, "The identical run this simulation was waiting on was deleted."):
+        progress_bus.publish(joined.id, joined.owner_id, joined.status)
+    # Copies own hard-linked results; they must not keep pointing at the deleted run (FK on Postgres)
+    memoization.detach_copies(db, simulation_id)
 
     # 4. Delete from DB
     crud.delete_simulation(db=db, simulation_id=simulation_id)
     return None
 # ---------------------------------------    
 
+# --- Parameter Sweep Endpoints ---
+
+def _sweep_status(db: Session, db_sweep: models.Sweep) -> schemas.SweepStatus:
+    counts = crud.get_sweep_status_counts(db, db_sweep.id)
+    done = counts.get("COMPLETED", 0) + counts.get("FAILED", 0)
+    running = [row.id for row in crud.get_sweep_points(db, db_sweep.id, statuses=["RUNNING"])]
+    partial = sum(s.get("progress_percentage", 0) or 0 for s in progress_bus.get_snapshots(running).values())
+    progress = (done * 100 + partial) / db_sweep.total_points if db_sweep.total_points else 100.0
+    return schemas.SweepStatus(**schemas.Sweep.model_validate(db_sweep).model_dump(), status_counts=counts, progress_percentage=round(progress, 2))
+
+@app.post("/sweeps/", response_model=schemas.SweepStatus, tags=["Sweeps"])
+def create_sweep(sweep: schemas.SweepCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """
+    Expands a base configuration over a parameter grid, creates every Simulation row
+    in one transaction and enqueues all runs as a single Celery group.
+    """
+    try: total = sweeps.validate_grid(sweep.grid)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+
+    db_tool = db.query(models.Tool).filter(models.Tool.id == sweep.tool_id).first()
+    if not db_tool or db_tool.owner_id != current_user.id: raise HTTPException(status_code=403, detail="Invalid tool selected.")
+    tool_filename = os.path.basename(db_tool.file_path)
+    # The shared tool is hashed once for all points' fingerprints
+    tool_hash = db_tool.content_hash or tool_storage.hash_file(db_tool.file_path)
+    base = {section: getattr(sweep, section) for section in sweeps.SWEEP_SECTIONS}
+
+    to_run = []
+    try:
+        db_sweep = models.Sweep(
+            name=sweep.name, description=sweep.description, base_config=json.dumps(base), grid=json.dumps(sweep.grid),
+            total_points=total, owner_id=current_user.id, tool_id=db_tool.id
+        )
+        db.add(db_sweep); db.flush()
+        for i, (point, config) in enumerate(sweeps.expand(base, sweep.grid)):
+            engine_input = _build_engine_input(*(config[section] for section in sweeps.SWEEP_SECTIONS), tool_filename)
+            db_sim = models.Simulation(
+                name=f"{sweep.name} [{i + 1}/{total}]", description=sweep.description, owner_id=current_user.id,
+                tool_id=db_tool.id, sweep_id=db_sweep.id, sweep_point=json.dumps(point),
+                material_properties=json.dumps(config["material_properties"]),
+                input_fingerprint=memoization.input_fingerprint(engine_input, tool_hash, ENGINE_IMAGE)
+            )
+            db.add(db_sim); db.flush()
+            # Identical points (within this sweep or earlier runs) reuse or join instead of running again
+            source = None if sweep.force_rerun else memoization.find_reusable(db, db_sim.input_fingerprint, current_user.id, exclude_id=db_sim.id)
+            if source is not None: memoization.adopt(db_sim, source)
+            else: to_run.append((db_sim.id, engine_input))
+        db.commit()
+    except Exception as e:
+        db.rollback(); raise HTTPException(status_code=500, detail=f"Failed to create sweep: {e}")
+
+    # Sweeps go to the batch queue; fair-share levels keep them from starving other users' runs
+    queue = scheduler.choose_queue(current_user.is_admin, batch=True)
+    priorities = iter(scheduler.fair_share_priorities(db, current_user.id, queue, count=len(to_run)))
+    queued, staged = {}, {}
+    tasks, failed = [], {}
+    for simulation_id, engine_input in to_run:
+        try: staged[simulation_id] = run_dir = _stage_run_dir(simulation_id, db_tool.file_path, tool_filename, engine_input)
+        except RuntimeError as e:
+            print(f"Sweep {db_sweep.id}: could not stage simulation {simulation_id}: {e}")
+            failed[simulation_id] = str(e); continue
+        queued[simulation_id] = priority = next(priorities)
+        tasks.append(run_simulation_task.s(simulation_id, run_dir).set(queue=queue, priority=priority))
+    for db_sim in db.query(models.Simulation).filter(models.Simulation.id.in_(list(queued))):
+        scheduler.mark_queued(db_sim, queue, queued[db_sim.id])
+    db.commit()
+    if tasks:
+        try: group(tasks).apply_async()
+        except Exception as e:
+            print(f"Sweep {db_sweep.id}: Celery group enqueue failed: {e}")
+            for simulation_id, run_dir in staged.items():
+                shutil.rmtree(run_dir, ignore_errors=True)
+                failed[simulation_id] = f"Celery task failed: {e}"
+    # Identical points of this sweep (and later submissions) may have joined a run that will not start
+    for simulation_id, error in failed.items(): _mark_failed(db, simulation_id, current_user.id, error)
+    return _sweep_status(db, db_sweep)
+
+@app.get("/sweeps/", response_model=List[schemas.Sweep], tags=["Sweeps"])
+def read_sweeps(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    return crud.get_sweeps_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
+
+@app.get("/sweeps/{sweep_id}", response_model=schemas.SweepStatus, tags=["Sweeps"])
+def read_sweep(sweep_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    db_sweep = crud.get_sweep(db, sweep_id)
+    if not db_sweep or db_sweep.owner_id != current_user.id: raise HTTPException(status_code=404, detail="Sweep not found.")
+    return _sweep_status(db, db_sweep)
+
+@app.get("/sweeps/{sweep_id}/results", response_model=List[schemas.SweepPoint], response_class=fast_json.FastJSONResponse, tags=["Sweeps"])
+def read_sweep_results(sweep_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """One row per grid point: its parameter values, status and indexed result metrics."""
+    db_sweep = crud.get_sweep(db, sweep_id)
+    if not db_sweep or db_sweep.owner_id != current_user.id: raise HTTPException(status_code=404, detail="Sweep not found.")
+    return [
+        schemas.SweepPoint(
+            simulation_id=row.id, status=row.status, params=json.loads(row.sweep_point or "{}"), reused_from_id=row.reused_from_id,
+            **{f: getattr(row, f) for f in crud.SIMULATION_METRIC_FIELDS}
+        )
+        for row in crud.get_sweep_points(db, sweep_id)
+    ]
+
 @app.get("/materials/", response_model=List[schemas.Material], tags=["Materials"])
-def read_materials(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return crud.get_materials_by_user(db=db, user_id=current_user.id)
+def read_materials(
+    request: Request,
+    scope: str = Query("mine", pattern="^(mine|global|all)$"),
+    q: Optional[str] = None,
+    filter_specs: List[str] = Query([], alias="filter"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    # ?filter=density:7000..8000 (repeatable, open-ended ranges allowed); nested properties use dotted paths
+    try: filters = [material_library.parse_filter(spec) for spec in filter_specs]
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+    materials = material_library.query_materials(db, current_user.id, scope, q, filters, limit, offset)
+    return http_cache.json_response(request, [schemas.Material.model_validate(m).model_dump(mode="json") for m in materials])
+
+@app.get("/materials/catalog", response_model=List[schemas.Material], tags=["Materials"])
+def read_material_catalog(request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """The shared global catalog, served from the in-process cache; revalidate with If-None-Match."""
+    catalog = material_library.get_catalog(db)
+    headers = {"ETag": catalog.etag, "Cache-Control": http_cache.REVALIDATE}
+    if http_cache.not_modified(request, catalog.etag): return Response(status_code=304, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+@app.get("/materials/properties", tags=["Materials"])
+def read_material_properties(
+    scope: str = Query("all", pattern="^(mine|global|all)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Filterable property names with their value ranges."""
+    return material_library.property_stats(db, current_user.id, scope)
 
 @app.post("/materials/", response_model=schemas.Material, tags=["Materials"])
-def create_material(material: schemas.MaterialCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_material(material: schemas.MaterialCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     return crud.create_user_material(db=db, material=material, user_id=current_user.id)
 
+def _release_tool_file(db: Session, file_path: str, content_hash: Optional[str]):
+    # A stored tool file ({hash}{extension}) is shared by every Tool row with that file_path, its
+    # preview ({hash}.preview.bin) by every extension of the content: each goes with its last reference.
+    # Never call this inside tool_storage.blob_lock(): it takes the lock exclusively.
+    with tool_storage.blob_lock(exclusive=True):
+        if crud.count_tools_by_file(db, file_path) == 0: tool_storage.remove_blob(file_path)
+        if content_hash is None or crud.count_tools_by_hash(db, content_hash) == 0:
+            tool_storage.remove_blob(mesh_ingest.preview_path(file_path))
+
+def _ingest_tool_file(db: Session, file_path: str, content_hash: str, filename: str) -> Optional[dict]:
+    # Parse and check STL geometry once per distinct file; raises mesh_ingest.MeshError
+    if not mesh_ingest.is_mesh_file(filename): return None
+    existing = crud.get_ingested_tool_by_hash(db, content_hash)
+    if existing and os.path.exists(mesh_ingest.preview_path(file_path)):
+        return json.loads(existing.mesh_info)
+    return mesh_ingest.ingest(file_path)
+
 @app.get("/tools/", response_model=List[schemas.Tool], tags=["Tools"])
-def read_tools(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return crud.get_tools_by_user(db=db, user_id=current_user.id)
+def read_tools(request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    tools = crud.get_tools_by_user(db=db, user_id=current_user.id)
+    return http_cache.json_response(request, [schemas.Tool.model_validate(t).model_dump(mode="json") for t in tools])
 
 @app.post("/tools/", response_model=schemas.Tool, tags=["Tools"])
-def create_tool(name: str = Form(...), tool_type: Optional[str] = Form("Other"), file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    upload_dir = "tool_library_files"; os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, f"{uuid.uuid4()}_{file.filename}")
+def create_tool(name: str = Form(...), tool_type: Optional[str] = Form("Other"), file: UploadFile = File(...), db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    file_path = content_hash = None
     try:
-        with open(file_path, "wb") as f: shutil.copyfileobj(file.file, f)
-        return crud.create_user_tool(db=db, tool=schemas.ToolCreate(name=name, tool_type=tool_type), file_path=file_path, user_id=current_user.id)
+        # Until the Tool row is committed nothing counts as a reference to the blob: hold off removals
+        with tool_storage.blob_lock():
+            file_path, content_hash, file_size = tool_storage.store_upload(file.file, file.filename)
+            mesh_info = _ingest_tool_file(db, file_path, content_hash, file.filename)
+            return crud.create_user_tool(db=db, tool=schemas.ToolCreate(name=name, tool_type=tool_type), file_path=file_path, user_id=current_user.id, content_hash=content_hash, file_size=file_size, mesh_info=mesh_info)
+    except mesh_ingest.MeshError as e:
+        _release_tool_file(db, file_path, content_hash)
+        raise HTTPException(status_code=422, detail=f"Invalid tool geometry: {e}")
     except:
-        if os.path.exists(file_path): os.remove(file_path)
+        db.rollback()
+        if file_path: _release_tool_file(db, file_path, content_hash)
         raise HTTPException(status_code=500, detail="Tool upload failed.")
 
+def _content_addressed_file(request: Request, db_tool: models.Tool, path: str, media_type: Optional[str] = None, variant: str = "file"):
+    # Stored tool files are named by their content hash and never rewritten: the hash is a strong
+    # validator and clients may cache them indefinitely. Legacy rows keep Starlette's stat-based ETag.
+    if not db_tool.content_hash: return FileResponse(path, media_type=media_type)
+    etag = f'"{db_tool.content_hash}-{variant}"' if variant != "file" else f'"{db_tool.content_hash}"'
+    if http_cache.not_modified(request, etag): return http_cache.not_modified_response(etag, http_cache.IMMUTABLE)
+    return FileResponse(path, media_type=media_type, headers={"ETag": etag, "Cache-Control": http_cache.IMMUTABLE})
+
 @app.get("/tool-file/{tool_id}", tags=["Tools"])
-def get_tool_file(tool_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_tool_file(tool_id: int, request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     db_tool = db.query(models.Tool).filter(models.Tool.id == tool_id).first()
     if not db_tool or not os.path.exists(db_tool.file_path) or db_tool.owner_id != current_user.id: raise HTTPException(status_code=404, detail="Tool file not found.")
-    return FileResponse(db_tool.file_path)
+    return _content_addressed_file(request, db_tool, db_tool.file_path)
+
+@app.get("/tools/{tool_id}/preview", tags=["Tools"])
+def get_tool_preview(tool_id: int, request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """Compact binary mesh for the viewer (format documented in mesh_ingest.write_preview)."""
+    db_tool = db.query(models.Tool).filter(models.Tool.id == tool_id).first()
+    if not db_tool or db_tool.owner_id != current_user.id: raise HTTPException(status_code=404, detail="Tool not found.")
+    path = mesh_ingest.preview_path(db_tool.file_path)
+    if not db_tool.mesh_info or not os.path.exists(path): raise HTTPException(status_code=404, detail="No preview for this tool.")
+    return _content_addressed_file(request, db_tool, path, media_type="application/octet-stream", variant="preview")
 
 @app.delete("/tools/{tool_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Tools"])
-def delete_tool(tool_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_tool(tool_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     db_tool = db.query(models.Tool).filter(models.Tool.id == tool_id).first()
     if not db_tool or db_tool.owner_id != current_user.id: raise HTTPException(status_code=404, detail="Tool not found.")
-    if os.path.exists(db_tool.file_path): os.remove(db_tool.file_path)
-    crud.delete_tool(db=db, tool_id=tool_id); return None
+    file_path, content_hash = db_tool.file_path, db_tool.content_hash
+    crud.delete_tool(db=db, tool_id=tool_id)
+    _release_tool_file(db, file_path, content_hash)
+    return None
@@ -0,0 +1,172 @@
+import hashlib, json, math, os, threading, time
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+import models, schemas, fast_json
+
+load_dotenv()
+
+# --- Global catalog ---
+# Materials with owner_id NULL form one read-only catalog shared by every user (managed by admins),
+# so standard alloys are stored once instead of being re-created per account.
+# The serialized catalog is cached per process; MATERIAL_CATALOG_TTL bounds how long another
+# process's edits can go unnoticed, after that one aggregate query decides whether to rebuild.
+MATERIAL_CATALOG_TTL = float(os.getenv("MATERIAL_CATALOG_TTL", 5))
+# Optional JSON file ([{"name": ..., "properties": {...}}, ...]) loaded into an empty catalog at startup
+MATERIAL_CATALOG_FILE = os.getenv("MATERIAL_CATALOG_FILE")
+
+SCOPES = ("mine", "global", "all")
+
+
+# --- Property index ---
+
+def flatten_properties(properties, prefix: str = "") -> dict[str, float]:
+    """Numeric leaves of a properties document keyed by dotted path, e.g. {"thermal.conductivity": 45.0}."""
+    flat = {}
+    if not isinstance(properties, dict): return flat
+    for key, value in properties.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_properties(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            flat[path] = float(value)
+    return flat
+
+def property_rows(properties) -> list:
+    return [models.MaterialProperty(name=name, value=value) for name, value in flatten_properties(properties).items()]
+
+def index_material(db_material, properties=None) -> None:
+    """(Re)builds the property rows of one material from its JSON properties; the caller commits."""
+    if properties is None:
+        try: properties = json.loads(db_material.properties or "{}")
+        except ValueError: properties = {}
+    db_material.indexed_properties = property_rows(properties)
+
+def backfill_index(db: Session) -> int:
+    """Indexes materials created before the property index existed. Returns how many were indexed."""
+    indexed = select(models.MaterialProperty.material_id)
+    pending = db.query(models.Material).filter(models.Material.id.not_in(indexed)).all()
+    count = 0
+    for db_material in pending:
+        index_material(db_material)
+        if db_material.indexed_properties: count += 1
+    db.commit()
+    return count
+
+
+# --- Queries ---
+
+def parse_filter(spec: str) -> tuple[str, Optional[float], Optional[float]]:
+    """'density:7000..8000', 'density:..8000' or 'density:7000..' -> (name, min, max)."""
+    name, sep, bounds = spec.rpartition(":")
+    low, dots, high = bounds.partition("..")
+    if not sep or not name or not dots or not (low or high): raise ValueError(f"Invalid filter '{spec}', expected name:min..max")
+    return name, float(low) if low else None, float(high) if high else None
+
+def _scoped(query, owner_id: int, scope: str):
+    if scope == "mine": return query.filter(models.Material.owner_id == owner_id)
+    if scope == "global": return query.filter(models.Material.owner_id.is_(None))
+    return query.filter(or_(models.Material.owner_id == owner_id, models.Material.owner_id.is_(None)))
+
+def query_materials(db: Session, owner_id: int, scope: str = "mine", q: Optional[str] = None, filters: Optional[list] = None,
+                    limit: Optional[int] = None, offset: int = 0) -> list:
+    """
+    Materials visible in `scope`, optionally matching a name substring and property ranges.
+    Each range is one semi-join on the (name, value) index, so filtering stays on the server.
+    """
+    query = _scoped(db.query(models.Material), owner_id, scope)
+    if q: query = query.filter(models.Material.name.ilike(f"%{q}%"))
+    for name, low, high in filters or []:
+        matching = select(models.MaterialProperty.material_id).where(models.MaterialProperty.name == name)
+        if low is not None: matching = matching.where(models.MaterialProperty.value >= low)
+        if high is not None: matching = matching.where(models.MaterialProperty.value <= high)
+        query = query.filter(models.Material.id.in_(matching))
+    query = query.order_by(models.Material.name, models.Material.id).offset(offset)
+    if limit is not None: query = query.limit(limit)
+    return query.all()
+
+def property_stats(db: Session, owner_id: int, scope: str = "all") -> list[dict]:
+    """Indexed property names with count and value range, e.g. to build filter controls."""
+    query = db.query(
+        models.MaterialProperty.name, func.count(models.MaterialProperty.id),
+        func.min(models.MaterialProperty.value), func.max(models.MaterialProperty.value)
+    ).join(models.Material, models.Material.id == models.MaterialProperty.material_id)
+    rows = _scoped(query, owner_id, scope).group_by(models.MaterialProperty.name).order_by(models.MaterialProperty.name).all()
+    return [{"name": name, "count": count, "min": low, "max": high} for name, count, low, high in rows]
+
+
+# --- Catalog cache ---
+
+@dataclass(frozen=True)
+class Catalog:
+    version: tuple
+    etag: str
+    body: bytes
+    count: int
+
+_catalog: Optional[Catalog] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+def _catalog_version(db: Session) -> tuple:
+    # Any insert, update or delete changes at least one of these
+    count, max_id, updated = db.query(
+        func.count(models.Material.id), func.max(models.Material.id), func.max(models.Material.updated_at)
+    ).filter(models.Material.owner_id.is_(None)).one()
+    return count, max_id, updated.isoformat() if updated else None
+
+def _build_catalog(db: Session, version: tuple) -> Catalog:
+    rows = db.query(models.Material).filter(models.Material.owner_id.is_(None)).order_by(models.Material.name, models.Material.id).all()
+    items = [schemas.Material.model_validate(row).model_dump() for row in rows]
+    body = fast_json.dumps(items)
+    return Catalog(version=version, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"', body=body, count=len(items))
+
+def get_catalog(db: Session) -> Catalog:
+    """The serialized global catalog, rebuilt only when its version changed."""
+    global _catalog, _checked_at
+    with _lock:
+        if _catalog is not None and time.monotonic() - _checked_at < MATERIAL_CATALOG_TTL: return _catalog
+        version = _catalog_version(db)
+        if _catalog is None or _catalog.version != version: _catalog = _build_catalog(db, version)
+        _checked_at = time.monotonic()
+        return _catalog
+
+def invalidate_catalog() -> None:
+    global _catalog
+    with _lock: _catalog = None
+
+def upsert_catalog(db: Session, materials: list) -> dict:
+    """Adds or replaces global catalog entries, matched by name, in one transaction."""
+    existing = {m.name: m for m in db.query(models.Material).filter(models.Material.owner_id.is_(None))}
+    report = {"created": 0, "updated": 0}
+    for material in materials:
+        db_material = existing.get(material.name)
+        if db_material is None:
+            db_material = models.Material(name=material.name, owner_id=None)
+            db.add(db_material); existing[material.name] = db_material
+            report["created"] += 1
+        else:
+            report["updated"] += 1
+        db_material.properties = json.dumps(material.properties)
+        index_material(db_material, material.properties)
+    db.commit()
+    invalidate_catalog()
+    return report
+
+def delete_catalog_material(db: Session, material_id: int) -> bool:
+    db_material = db.query(models.Material).filter(models.Material.id == material_id, models.Material.owner_id.is_(None)).first()
+    if db_material is None: return False
+    db.delete(db_material)
+    db.commit()
+    invalidate_catalog()
+    return True
+
+def seed_catalog(db: Session, path: Optional[str] = MATERIAL_CATALOG_FILE) -> int:
+    """Loads MATERIAL_CATALOG_FILE into the catalog if the catalog is still empty."""
+    if not path or not os.path.exists(path): return 0
+    if db.query(models.Material.id).filter(models.Material.owner_id.is_(None)).first(): return 0
+    with open(path, "r") as f:
+        materials = [schemas.MaterialCreate(**item) for item in json.load(f)]
+    return upsert_catalog(db, materials)["created"]
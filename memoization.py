@@ -0,0 +1,102 @@
+import hashlib, json, os
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import models, results_store
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+IN_FLIGHT_STATUSES = ("PENDING", "RUNNING")
+
+
+def input_fingerprint(engine_input: dict, tool_hash: str, engine: str) -> str:
+    """
+    Canonical hash of everything that determines an engine run: the generated
+    input parameters (minus file names), the tool file's content hash and the engine image.
+    """
+    params = {k: v for k, v in engine_input.items() if k != "file_paths"}
+    canonical = json.dumps({"input": params, "tool_sha256": tool_hash, "engine": engine}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def find_reusable(db: Session, fingerprint: str, owner_id: int, exclude_id: Optional[int] = None) -> Optional[models.Simulation]:
+    """
+    Latest completed run of this user with the same fingerprint whose results are
+    still on disk, otherwise an identical run that is still queued or running.
+    """
+    query = db.query(models.Simulation).filter(
+        models.Simulation.input_fingerprint == fingerprint,
+        models.Simulation.owner_id == owner_id,
+    )
+    if exclude_id is not None: query = query.filter(models.Simulation.id != exclude_id)
+
+    for candidate in query.filter(models.Simulation.status == "COMPLETED").order_by(models.Simulation.id.desc()).limit(5):
+        if not candidate.timeseries_path or os.path.exists(candidate.timeseries_path):
+            return candidate
+    # Only join runs that actually execute (not other joined copies)
+    return query.filter(
+        models.Simulation.status.in_(IN_FLIGHT_STATUSES), models.Simulation.reused_from_id.is_(None)
+    ).order_by(models.Simulation.id.desc()).first()
+
+def adopt(db_simulation, source) -> None:
+    """Points `db_simulation` at `source`: copies finished results, or joins the in-flight run."""
+    db_simulation.reused_from_id = source.id
+    if source.status == "COMPLETED":
+        results_store.copy_results(source, db_simulation)
+        db_simulation.status = "COMPLETED"
+    else:
+        db_simulation.status = source.status
+
+def finish_joined(db: Session, source) -> list:
+    """
+    Called by the worker once `source` reached a terminal status: settles every
+    simulation that joined it. Returns the updated simulations.
+    """
+    if source.status not in TERMINAL_STATUSES: return []
+    joined = db.query(models.Simulation).filter(
+        models.Simulation.reused_from_id == source.id,
+        models.Simulation.status.notin_(TERMINAL_STATUSES)
+    ).all()
+    for sim in joined:
+        if source.status == "COMPLETED":
+            results_store.copy_results(source, sim)
+        else:
+            sim.results = source.results
+        sim.status = source.status
+    db.commit()
+    return joined
+
+def _source_matches(db_sim, fingerprint: Optional[str]) -> bool:
+    # Same inputs: guards against an id that now belongs to another run (SQLite reuses rowids)
+    return fingerprint is not None and fingerprint == db_sim.input_fingerprint
+
+def run_source_id(db: Session, db_sim) -> int:
+    """Id whose run directory, log and progress `db_sim` shows: the run it reused while that still exists, else its own."""
+    if not db_sim.reused_from_id: return db_sim.id
+    fingerprint = db.query(models.Simulation.input_fingerprint).filter(models.Simulation.id == db_sim.reused_from_id).scalar()
+    return db_sim.reused_from_id if _source_matches(db_sim, fingerprint) else db_sim.id
+
+async def run_source_id_async(db: AsyncSession, db_sim) -> int:
+    if not db_sim.reused_from_id: return db_sim.id
+    fingerprint = (await db.execute(select(models.Simulation.input_fingerprint).where(models.Simulation.id == db_sim.reused_from_id))).scalar()
+    return db_sim.reused_from_id if _source_matches(db_sim, fingerprint) else db_sim.id
+
+def detach_copies(db: Session, source_id: int) -> int:
+    """
+    Clears reused_from_id on every simulation that reused `source_id`, before it is deleted.
+    Completed copies keep their own (hard-linked) results and fall back to their own id.
+    """
+    count = db.execute(update(models.Simulation).where(models.Simulation.reused_from_id == source_id).values(reused_from_id=None)).rowcount
+    db.commit()
+    return count
+
+def fail_joined(db: Session, source_id: int, error: str) -> list:
+    """Fails in-flight simulations joined to `source_id` (e.g. because it was deleted)."""
+    joined = db.query(models.Simulation).filter(
+        models.Simulation.reused_from_id == source_id,
+        models.Simulation.status.notin_(TERMINAL_STATUSES)
+    ).all()
+    for sim in joined:
+        sim.status = "FAILED"
+        sim.results = json.dumps({"error": error})
+    db.commit()
+    return joined
@@ -0,0 +1,123 @@
+import mmap, os, re, struct
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Reject open (non-watertight) STL meshes at upload time; the engine needs closed solids
+MESH_REQUIRE_WATERTIGHT = os.getenv("MESH_REQUIRE_WATERTIGHT", "true").lower() in ("1", "true", "yes")
+MESH_MAX_TRIANGLES = int(os.getenv("MESH_MAX_TRIANGLES", 20_000_000))
+MESH_EXTENSIONS = (".stl",)
+PREVIEW_SUFFIX = ".preview.bin"
+PREVIEW_MAGIC = b"EPM1"
+
+# Binary STL: 80-byte header, uint32 count, then 50-byte records
+_STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+_ASCII_VERTEX = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+
+
+class MeshError(ValueError):
+    """The uploaded geometry cannot be used by the engine."""
+
+
+def is_mesh_file(filename: str) -> bool:
+    return os.path.splitext(filename or "")[1].lower() in MESH_EXTENSIONS
+
+def preview_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + PREVIEW_SUFFIX
+
+def read_stl(path: str) -> np.ndarray:
+    """Returns the triangles of a binary or ASCII STL as a float32 array of shape (n, 3, 3)."""
+    size = os.path.getsize(path)
+    if size < 84: raise MeshError("File is too small to be an STL mesh.")
+    with open(path, "rb") as f:
+        header = f.read(84)
+    (count,) = struct.unpack("<I", header[80:84])
+    if size == 84 + count * _STL_RECORD.itemsize:
+        if count > MESH_MAX_TRIANGLES: raise MeshError(f"Mesh has {count} triangles (limit {MESH_MAX_TRIANGLES}).")
+        if count == 0: raise MeshError("Mesh contains no triangles.")
+        records = np.memmap(path, dtype=_STL_RECORD, mode="r", offset=84, shape=(count,))
+        try:
+            return np.array(records["vertices"], dtype=np.float32)
+        finally:
+            del records  # release the mapping so the file can be removed (Windows)
+
+    if not header.lstrip().lower().startswith(b"solid"):
+        raise MeshError("Not a valid binary or ASCII STL file.")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        coords = _ASCII_VERTEX.findall(buf)
+    if not coords or len(coords) % 3: raise MeshError("ASCII STL has no complete facets.")
+    if len(coords) // 3 > MESH_MAX_TRIANGLES: raise MeshError(f"Mesh exceeds {MESH_MAX_TRIANGLES} triangles.")
+    try:
+        return np.array(coords, dtype="S").astype(np.float32).reshape(-1, 3, 3)
+    except ValueError:
+        raise MeshError("ASCII STL contains non-numeric vertex coordinates.")
+
+def analyze(triangles: np.ndarray) -> tuple[dict, np.ndarray, np.ndarray]:
+    """
+    Vectorized mesh checks. Returns (info, unique vertices, triangle vertex indices).
+    Watertight means every edge is shared by exactly two triangles.
+    """
+    if not np.isfinite(triangles).all(): raise MeshError("Mesh contains NaN or infinite coordinates.")
+    n = len(triangles)
+    # Adding +0.0 turns -0.0 (common in exported STLs) into 0.0, so equal coordinates have equal bytes
+    flat = np.ascontiguousarray(triangles.reshape(-1, 3)) + np.float32(0.0)
+    # Weld identical vertices by comparing their raw 12-byte representation
+    keys = flat.view(np.dtype((np.void, flat.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    vertices = flat[first]
+    faces = inverse.reshape(n, 3).astype(np.uint32)
+
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1).astype(np.int64)
+    _, edge_counts = np.unique(edges[:, 0] * len(vertices) + edges[:, 1], return_counts=True)
+
+    v0, v1, v2 = triangles[:, 0].astype(np.float64), triangles[:, 1].astype(np.float64), triangles[:, 2].astype(np.float64)
+    cross = np.cross(v1 - v0, v2 - v0)
+    areas = 0.5 * np.linalg.norm(cross, axis=1)
+    watertight = bool((edge_counts == 2).all())
+    info = {
+        "triangle_count": int(n),
+        "vertex_count": int(len(vertices)),
+        "bbox_min": vertices.min(axis=0).astype(float).tolist(),
+        "bbox_max": vertices.max(axis=0).astype(float).tolist(),
+        "surface_area": float(areas.sum()),
+        "degenerate_triangles": int((areas <= 0).sum()),
+        "open_edges": int((edge_counts == 1).sum()),
+        "non_manifold_edges": int((edge_counts > 2).sum()),
+        "is_watertight": watertight,
+        # Enclosed volume via the divergence theorem; only meaningful for closed meshes
+        "volume": float(abs(np.einsum("ij,ij->i", v0, np.cross(v1, v2)).sum()) / 6.0) if watertight else None,
+    }
+    return info, vertices, faces
+
+def write_preview(path: str, vertices: np.ndarray, faces: np.ndarray, info: dict) -> None:
+    """
+    Compact little-endian preview for the viewer:
+    b"EPM1", uint32 vertex_count, uint32 triangle_count, float32[6] bbox (min xyz, max xyz),
+    uint16[vertex_count*3] positions quantized to the bbox, uint32[triangle_count*3] indices.
+    """
+    lo = np.asarray(info["bbox_min"], dtype=np.float64)
+    span = np.asarray(info["bbox_max"], dtype=np.float64) - lo
+    span[span == 0] = 1.0
+    quantized = np.round((vertices - lo) / span * 65535).astype("<u2")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREVIEW_MAGIC)
+        f.write(struct.pack("<II", len(vertices), len(faces)))
+        f.write(np.asarray(info["bbox_min"] + info["bbox_max"], dtype="<f4").tobytes())
+        f.write(quantized.tobytes())
+        f.write(faces.astype("<u4").tobytes())
+    os.replace(tmp_path, path)
+
+def ingest(path: str) -> dict:
+    """
+    Parses and checks a stored STL once and writes its preview next to it.
+    Raises MeshError for geometry the engine cannot use.
+    """
+    info, vertices, faces = analyze(read_stl(path))
+    if info["degenerate_triangles"] == info["triangle_count"]:
+        raise MeshError("All triangles are degenerate (zero area).")
+    if MESH_REQUIRE_WATERTIGHT and not info["is_watertight"]:
+        raise MeshError(f"Mesh is not watertight ({info['open_edges']} open, {info['non_manifold_edges']} non-manifold edges).")
+    write_preview(preview_path(path), vertices, faces, info)
+    return info
@@ -0,0 +1,196 @@
+import os, socket, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import redis
+from sqlalchemy import event
+from dotenv import load_dotenv
+import progress_bus, scheduler
+
+load_dotenv()
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # optional: nothing is recorded and GET /metrics answers 503
+    prometheus_client = None
+
+# --- Settings ---
+# Several processes (uvicorn workers, Celery worker processes) on one host: point them all at the
+# same empty directory with PROMETHEUS_MULTIPROC_DIR (must be set before start and wiped on deploy)
+# and the API's /metrics reports the sum over all of them, worker metrics included.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+# Workers on other hosts push their metrics here after every task instead (host:port)
+METRICS_PUSHGATEWAY = os.getenv("METRICS_PUSHGATEWAY")
+# When set, /metrics requires `Authorization: Bearer <METRICS_TOKEN>`
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST if prometheus_client else "text/plain; charset=utf-8"
+
+# Requests last milliseconds to seconds; worker stages up to the one-hour engine timeout
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+class _Noop:
+    """Stands in for every metric when prometheus_client is not installed."""
+    def labels(self, *args, **kwargs): return self
+    def observe(self, value): pass
+    def inc(self, amount=1): pass
+
+
+# --- Metrics ---
+if prometheus_client is not None:
+    # API
+    HTTP_REQUEST_DURATION = Histogram("edgepredict_http_request_duration_seconds",
+        "Time from request start to the last response byte, by route template.", ["method", "route", "status"], buckets=HTTP_BUCKETS)
+    HTTP_REQUEST_QUERIES = Histogram("edgepredict_http_request_db_queries",
+        "Database queries executed while handling one request.", ["method", "route"], buckets=QUERY_COUNT_BUCKETS)
+    # Database, API and worker (the histogram's _count is the query count)
+    DB_QUERY_DURATION = Histogram("edgepredict_db_query_duration_seconds",
+        "Database statement execution time.", ["component", "operation"], buckets=DB_BUCKETS)
+    # Worker
+    WORKER_STAGE_DURATION = Histogram("edgepredict_worker_stage_duration_seconds",
+        "Time spent in each stage of run_simulation_task.", ["stage"], buckets=STAGE_BUCKETS)
+    WORKER_QUEUE_WAIT = Histogram("edgepredict_worker_queue_wait_seconds",
+        "Time a simulation waited in its queue before a worker started it.", ["queue"], buckets=STAGE_BUCKETS)
+    WORKER_TASKS = Counter("edgepredict_worker_tasks_total", "Finished simulation tasks by final status.", ["status"])
+else:
+    HTTP_REQUEST_DURATION = HTTP_REQUEST_QUERIES = DB_QUERY_DURATION = _Noop()
+    WORKER_STAGE_DURATION = WORKER_QUEUE_WAIT = WORKER_TASKS = _Noop()
+
+
+# --- Database hooks ---
+
+# Query counter of the request being handled ([count]; a list so threadpool copies of the context share it)
+_request_queries: ContextVar[Optional[list]] = ContextVar("request_queries", default=None)
+
+_OPERATIONS = {"select", "insert", "update", "delete"}
+# Which process type the database metrics come from; the Celery worker switches it to "worker"
+_component = "api"
+
+def set_component(name: str) -> None:
+    global _component
+    _component = name
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip()[:8].split(None, 1)
+    op = word[0].lower() if word else ""
+    if op == "with": return "select"
+    return op if op in _OPERATIONS else "other"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None: context._metrics_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None: return
+    DB_QUERY_DURATION.labels(_component, _operation(statement)).observe(time.perf_counter() - start)
+    counter = _request_queries.get()
+    if counter is not None: counter[0] += 1
+
+def instrument_engine(engine) -> None:
+    """Times every statement run on `engine` (a sync Engine, or AsyncEngine.sync_engine). Idempotent."""
+    if prometheus_client is None or event.contains(engine, "before_cursor_execute", _before_cursor_execute): return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- API middleware ---
+
+class MetricsMiddleware:
+    """Records latency and query count per route template (`/simulations/{simulation_id}`, not the raw path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or prometheus_client is None:
+            await self.app(scope, receive, send); return
+        counter, status = [0], 500
+        token = _request_queries.set(counter)
+        start = time.perf_counter()
+
+        async def send_tracked(message):
+            nonlocal status
+            if message["type"] == "http.response.start": status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_tracked)
+        finally:
+            _request_queries.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot blow up the series count
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, template, str(status)).observe(time.perf_counter() - start)
+            HTTP_REQUEST_QUERIES.labels(method, template).observe(counter[0])
+
+
+# --- Worker ---
+
+@contextmanager
+def stage(name: str):
+    """Times a block of the worker task: `with metrics.stage("engine_run"): ...`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        WORKER_STAGE_DURATION.labels(name).observe(time.perf_counter() - start)
+
+def push_worker_metrics() -> None:
+    """Pushes this worker process's metrics to METRICS_PUSHGATEWAY, when configured."""
+    if prometheus_client is None or not METRICS_PUSHGATEWAY or MULTIPROC_DIR: return
+    try:
+        prometheus_client.pushadd_to_gateway(
+            METRICS_PUSHGATEWAY, job="edgepredict-worker",
+            grouping_key={"instance": f"{socket.gethostname()}:{os.getpid()}"}, registry=prometheus_client.REGISTRY,
+        )
+    except Exception as e:
+        print(f"Metrics: push to {METRICS_PUSHGATEWAY} failed: {e}")
+
+
+# --- Scrape ---
+
+class QueueDepthCollector:
+    """Celery queue lengths, read from the Redis broker at scrape time."""
+
+    def __init__(self, queues, priority_levels: int):
+        self.queues, self.priority_levels = queues, priority_levels
+
+    def collect(self):
+        gauge = GaugeMetricFamily("edgepredict_celery_queue_depth", "Messages waiting in each Celery queue.", labels=["queue"])
+        try:
+            # The broker keeps one list per priority level: `queue` for 0, `queue:N` above (see worker.py)
+            pipe = progress_bus.get_client().pipeline(transaction=False)
+            for queue in self.queues:
+                for level in range(self.priority_levels): pipe.llen(queue if level == 0 else f"{queue}:{level}")
+            lengths = pipe.execute()
+        except redis.RedisError as e:
+            print(f"Metrics: could not read queue depth: {e}")
+            return
+        for i, queue in enumerate(self.queues):
+            gauge.add_metric([queue], sum(lengths[i * self.priority_levels:(i + 1) * self.priority_levels]))
+        yield gauge
+
+_registry = None
+
+def _scrape_registry():
+    global _registry
+    if _registry is None:
+        if MULTIPROC_DIR:
+            _registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(_registry)
+        else:
+            _registry = prometheus_client.REGISTRY
+        _registry.register(QueueDepthCollector(scheduler.QUEUES, scheduler.PRIORITY_LEVELS))
+    return _registry
+
+def render() -> Optional[bytes]:
+    """The exposition text for GET /metrics, or None without prometheus_client."""
+    if prometheus_client is None: return None
+    return prometheus_client.generate_latest(_scrape_registry())
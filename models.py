@@ -1,5 +1,5 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float, Index
+from sqlalchemy.orm import relationship, deferred
 from database import Base
 import datetime
 from fastapi.security import OAuth2PasswordBearer
@@ -21,6 +21,10 @@ class User(Base):
     materials = relationship("Material", back_populates="owner")
     tools = relationship("Tool", back_populates="owner")
 
+    # Prefix search (email LIKE 'x%') under Postgres' default, locale-aware collation needs a
+    # pattern-ops index; SQLite uses the unique index with its byte-order (BINARY) collation
+    __table_args__ = (Index("ix_users_email_pattern", "email", postgresql_ops={"email": "text_pattern_ops"}).ddl_if(dialect="postgresql"),)
+
 class AccessRequest(Base):
     __tablename__ = "access_requests"
 
@@ -39,24 +43,115 @@ class Simulation(Base):
     name = Column(String, index=True)
     description = Column(String)
     status = Column(String, default="PENDING")
-    results = Column(String, nullable=True)
-    material_properties = Column(String, nullable=True)
+    # Large text columns are deferred: loaded on first attribute access, not with every row.
+    # Both are in group "large" so a query that needs them loads them together (undefer_group).
+    results = deferred(Column(String, nullable=True), group="large")
+    # Columnar time-series artifact written by results_store (None for legacy rows)
+    timeseries_path = Column(String, nullable=True)
+    timeseries_points = Column(Integer, nullable=True)
+    # Key metrics computed once by the worker on completion (see results_store.compute_metrics)
+    life_hours = Column(Float, nullable=True, index=True)
+    max_temp_C = Column(Float, nullable=True, index=True)
+    max_stress_MPa = Column(Float, nullable=True, index=True)
+    wear_microns = Column(Float, nullable=True, index=True)
+    material_properties = deferred(Column(String, nullable=True), group="large")
+    # Canonical hash of the engine input + tool content (see memoization.input_fingerprint)
+    input_fingerprint = Column(String(64), nullable=True, index=True)
+    # Set when results were reused from (or the run joined) an identical simulation
+    reused_from_id = Column(Integer, ForeignKey("simulations.id", ondelete="SET NULL"), nullable=True, index=True)
     
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
     tool_id = Column(Integer, ForeignKey("tools.id"), nullable=True)
 
+    # Parameter sweep this run belongs to, and its grid assignment (JSON)
+    sweep_id = Column(Integer, ForeignKey("sweeps.id"), nullable=True, index=True)
+    sweep_point = Column(String, nullable=True)
+
+    # Scheduling (see scheduler.py): Celery queue, fair-share priority level and timestamps
+    queue = Column(String, nullable=True, index=True)
+    queue_priority = Column(Integer, nullable=True)
+    queued_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Run directory lifecycle (see run_lifecycle.py): zip archive once archived, and the bytes
+    # the run directory or archive currently takes (0 once removed, None if not measured yet)
+    run_archive_path = Column(String, nullable=True)
+    run_disk_bytes = Column(Integer, nullable=True)
+    # Background AI analysis (see ai_analysis.py): None, PENDING, RUNNING, COMPLETED or FAILED
+    analysis_status = Column(String, nullable=True)
+    # When the current analysis was claimed; a PENDING/RUNNING claim older than AI_JOB_STALE_SECONDS is dead
+    analysis_started_at = Column(DateTime, nullable=True)
+    # Row version for HTTP validators (ETag / Last-Modified); bumped by every ORM update
+    updated_at = Column(DateTime, nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
     owner = relationship("User", back_populates="simulations")
     tool = relationship("Tool")
 
+    # Listings filter on owner_id and keyset-page on (metric, id): one index per sortable metric
+    __table_args__ = tuple(
+        Index(f"ix_simulations_owner_{metric.lower()}_id", "owner_id", metric, "id")
+        for metric in ("life_hours", "max_temp_C", "max_stress_MPa", "wear_microns")
+    )
+
+class Sweep(Base):
+    __tablename__ = "sweeps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, index=True)
+    description = Column(String, nullable=True)
+    base_config = Column(String)
+    grid = Column(String)
+    total_points = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    tool_id = Column(Integer, ForeignKey("tools.id"), nullable=True)
+
+class EmailOutbox(Base):
+    """Queued outgoing email, delivered in the background by email_outbox.OutboxSender."""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # password_reset, access_request, access_request_status
+    kind = Column(String)
+    recipient = Column(String, index=True)
+    subject = Column(String)
+    body = Column(String)
+    # PENDING, SENDING, SENT or FAILED
+    status = Column(String, default="PENDING")
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.now)
+    claim_token = Column(String(32), nullable=True, index=True)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),)
+
 class Material(Base):
     __tablename__ = "materials"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     properties = Column(String)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    # None for entries of the shared, read-only global catalog (see material_library.py)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    updated_at = Column(DateTime, nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
 
     owner = relationship("User", back_populates="materials")
+    indexed_properties = relationship("MaterialProperty", cascade="all, delete-orphan")
+
+class MaterialProperty(Base):
+    """One numeric leaf of Material.properties, keyed by its dotted JSON path, for range queries."""
+    __tablename__ = "material_properties"
+
+    id = Column(Integer, primary_key=True)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), index=True)
+    name = Column(String)
+    value = Column(Float)
+
+    __table_args__ = (Index("ix_material_properties_name_value", "name", "value"),)
 
 class Tool(Base):
     __tablename__ = "tools"
@@ -64,7 +159,14 @@ class Tool(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     tool_type = Column(String)
-    file_path = Column(String, unique=True)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    # Content-addressed path shared by every Tool with the same file (see tool_storage)
+    file_path = Column(String, index=True)
+    content_hash = Column(String(64), nullable=True, index=True)
+    file_size = Column(Integer, nullable=True)
+    # Geometry metadata from mesh_ingest at upload time (STL only)
+    triangle_count = Column(Integer, nullable=True)
+    is_watertight = Column(Boolean, nullable=True)
+    mesh_info = Column(String, nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
 
     owner = relationship("User", back_populates="tools")
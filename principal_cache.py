@@ -0,0 +1,111 @@
+import json, os, threading, time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# In-process tier: short TTL bounds how long a revoked/changed user stays cached in
+# other worker processes (invalidation only reaches this process and the Redis tier).
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+# Optional shared tier, e.g. redis://localhost:6379/1. Disabled when unset.
+PRINCIPAL_CACHE_REDIS_URL = os.getenv("PRINCIPAL_CACHE_REDIS_URL")
+PRINCIPAL_CACHE_REDIS_TTL = int(os.getenv("PRINCIPAL_CACHE_REDIS_TTL", 300))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The fields of a User that authentication and authorization need."""
+    id: int
+    email: str
+    is_admin: bool
+    subscription_expiry: Optional[datetime] = None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, email=user.email, is_admin=bool(user.is_admin), subscription_expiry=user.subscription_expiry)
+
+    def to_json(self) -> str:
+        expiry = self.subscription_expiry.isoformat() if self.subscription_expiry else None
+        return json.dumps({"id": self.id, "email": self.email, "is_admin": self.is_admin, "subscription_expiry": expiry})
+
+    @classmethod
+    def from_json(cls, payload: str) -> "Principal":
+        data = json.loads(payload)
+        if data.get("subscription_expiry"):
+            data["subscription_expiry"] = datetime.fromisoformat(data["subscription_expiry"])
+        return cls(**data)
+
+
+class PrincipalCache:
+    """TTL + LRU cache of principals keyed by email (the JWT subject), with an optional Redis tier."""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, maxsize: int = PRINCIPAL_CACHE_SIZE,
+                 redis_url: Optional[str] = PRINCIPAL_CACHE_REDIS_URL, redis_ttl: int = PRINCIPAL_CACHE_REDIS_TTL):
+        self.ttl, self.maxsize, self.redis_ttl = ttl, maxsize, redis_ttl
+        self._entries: "OrderedDict[str, tuple[float, Principal]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+
+    @staticmethod
+    def _redis_key(email: str) -> str:
+        return f"edgepredict:principal:{email}"
+
+    def get(self, email: str) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(email)
+                    return entry[1]
+                del self._entries[email]
+
+        if self._redis is not None:
+            try:
+                payload = self._redis.get(self._redis_key(email))
+            except Exception as e:
+                print(f"Principal cache: Redis get failed: {e}")
+                payload = None
+            if payload:
+                principal = Principal.from_json(payload)
+                self._store_local(principal)
+                return principal
+        return None
+
+    def set(self, principal: Principal) -> None:
+        self._store_local(principal)
+        if self._redis is not None:
+            try:
+                self._redis.set(self._redis_key(principal.email), principal.to_json(), ex=self.redis_ttl)
+            except Exception as e:
+                print(f"Principal cache: Redis set failed: {e}")
+
+    def _store_local(self, principal: Principal) -> None:
+        with self._lock:
+            self._entries[principal.email] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.email)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email: str) -> None:
+        with self._lock:
+            self._entries.pop(email, None)
+        if self._redis is not None:
+            try:
+                self._redis.delete(self._redis_key(email))
+            except Exception as e:
+                print(f"Principal cache: Redis delete failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+cache = PrincipalCache()
@@ -0,0 +1,157 @@
+import json, os, threading
+from typing import AsyncIterator, Optional
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Same Redis instance that Celery uses as its broker
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# How long the latest progress snapshot of a run is kept for late subscribers / polls
+SNAPSHOT_TTL_SECONDS = int(os.getenv("PROGRESS_SNAPSHOT_TTL", 24 * 3600))
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+_client = None
+_async_client = None
+
+
+def simulation_channel(simulation_id: int) -> str:
+    return f"edgepredict:sim:{simulation_id}:events"
+
+def user_channel(user_id: int) -> str:
+    return f"edgepredict:user:{user_id}:events"
+
+def snapshot_key(simulation_id: int) -> str:
+    return f"edgepredict:sim:{simulation_id}:progress"
+
+def get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+def get_async_client() -> aioredis.Redis:
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _async_client
+
+# --- Publishing (worker side) ---
+
+def publish(simulation_id: int, owner_id: int, status: str, progress: Optional[dict] = None) -> None:
+    """
+    Publishes a progress/status event to the run's channel and its owner's channel,
+    and keeps it as the run's latest snapshot. Never raises: progress is best-effort.
+    """
+    event = dict(progress or {})
+    event.update({"simulation_id": simulation_id, "status": status})
+    if status == "COMPLETED": event["progress_percentage"] = 100
+    event.setdefault("progress_percentage", 0)
+    payload = json.dumps(event)
+    try:
+        pipe = get_client().pipeline()
+        pipe.set(snapshot_key(simulation_id), payload, ex=SNAPSHOT_TTL_SECONDS)
+        pipe.publish(simulation_channel(simulation_id), payload)
+        pipe.publish(user_channel(owner_id), payload)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Failed to publish progress for simulation {simulation_id}: {e}")
+
+def get_snapshot(simulation_id: int) -> Optional[dict]:
+    try:
+        payload = get_client().get(snapshot_key(simulation_id))
+    except redis.RedisError:
+        return None
+    return json.loads(payload) if payload else None
+
+def get_snapshots(simulation_ids: list[int]) -> dict:
+    """Latest snapshots for many runs in one round trip: {simulation_id: event}."""
+    if not simulation_ids: return {}
+    try:
+        payloads = get_client().mget([snapshot_key(i) for i in simulation_ids])
+    except redis.RedisError:
+        return {}
+    return {i: json.loads(p) for i, p in zip(simulation_ids, payloads) if p}
+
+async def get_snapshot_async(simulation_id: int) -> Optional[dict]:
+    try:
+        payload = await get_async_client().get(snapshot_key(simulation_id))
+    except redis.RedisError:
+        return None
+    return json.loads(payload) if payload else None
+
+class ProgressWatcher(threading.Thread):
+    """
+    Watches the engine's progress.json while the container runs and publishes
+    each new version of it. Use as a context manager around the engine call.
+    """
+    def __init__(self, simulation_id: int, owner_id: int, progress_file: str, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.simulation_id, self.owner_id = simulation_id, owner_id
+        self.progress_file, self.interval = progress_file, interval
+        self._stop_event = threading.Event()
+        self._last_mtime = None
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        try:
+            mtime = os.stat(self.progress_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._last_mtime: return
+        try:
+            with open(self.progress_file, "r") as f: progress = json.load(f)
+        except (OSError, ValueError):
+            return  # Engine is mid-write; pick it up on the next tick
+        self._last_mtime = mtime
+        # Always RUNNING: only the worker may announce COMPLETED/FAILED (that ends the SSE streams),
+        # once results are stored and committed. The engine's own status travels in the payload.
+        progress = dict(progress)
+        if "status" in progress: progress["engine_status"] = progress.pop("status")
+        publish(self.simulation_id, self.owner_id, "RUNNING", progress)
+
+    def __enter__(self):
+        self.start(); return self
+
+    def __exit__(self, *exc):
+        self._stop_event.set(); self.join(timeout=5)
+        self.poll()
+
+# --- Subscribing (API side) ---
+
+def format_sse(event: dict, event_type: str = "progress") -> str:
+    return f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+
+def _is_final(event: dict, stop_after: Optional[int]) -> bool:
+    return stop_after is not None and event.get("simulation_id") == stop_after and event.get("status") in TERMINAL_STATUSES
+
+async def stream_events(
+    channels: list[str], initial_events: list[dict], is_disconnected, stop_after: Optional[int] = None,
+    keepalive_seconds: float = 15.0
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events generator. Subscribes first, then replays `initial_events`
+    so no update published in between is lost. With `stop_after` set to a simulation
+    id, the stream ends after that simulation's COMPLETED/FAILED event.
+    """
+    pubsub = get_async_client().pubsub()
+    await pubsub.subscribe(*channels)
+    try:
+        for event in initial_events:
+            yield format_sse(event)
+            if _is_final(event, stop_after): return
+        while not await is_disconnected():
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=keepalive_seconds)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            event = json.loads(message["data"])
+            yield format_sse(event)
+            if _is_final(event, stop_after): return
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
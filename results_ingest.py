@@ -0,0 +1,165 @@
+import json, os, shutil, tempfile
+from typing import Optional
+import ijson
+import numpy as np
+import results_store
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Records buffered before they are split into columns and appended to the spill files
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", 8192))
+_TS_ITEM = results_store.TIMESERIES_KEY + ".item"
+_CONTAINER_EVENTS = ("start_map", "start_array", "map_key")
+
+
+class _ColumnSink:
+    """
+    One time-series field, appended chunk by chunk to a raw spill file.
+    Mirrors results_store.to_columns: int64 while every value is an int, float64
+    (missing -> NaN) while every value is a number, otherwise a plain list.
+    """
+
+    def __init__(self, path: str, leading_missing: int = 0):
+        self.path, self.dtype = path, np.int64
+        self.count = 0
+        self.maximum = 0.0 if leading_missing else None
+        self.extra: Optional[list] = None
+        self.file = open(path, "wb")
+        if leading_missing:
+            # The field first shows up after `leading_missing` records
+            self.dtype = np.float64
+            for start in range(0, leading_missing, INGEST_CHUNK_ROWS):
+                self._write(np.full(min(INGEST_CHUNK_ROWS, leading_missing - start), np.nan))
+
+    def _write(self, array: np.ndarray) -> None:
+        self.file.write(array.astype(self.dtype, copy=False).tobytes())
+        self.count += len(array)
+
+    def _read_blocks(self, dtype):
+        self.file.close()
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(INGEST_CHUNK_ROWS * 8)
+                if not block: return
+                yield np.frombuffer(block, dtype=dtype)
+
+    def _to_float(self) -> None:
+        if self.dtype == np.float64: return
+        # One-off rewrite of the int64 values written so far
+        tmp_path = self.path + ".f8"
+        with open(tmp_path, "wb") as out:
+            for block in self._read_blocks(np.int64): out.write(block.astype(np.float64).tobytes())
+        os.replace(tmp_path, self.path)
+        self.dtype = np.float64
+        self.file = open(self.path, "ab")
+
+    def _to_extra(self) -> None:
+        # Non-numeric values: the column is kept as a list, like to_columns' `extra`
+        values = []
+        for block in self._read_blocks(self.dtype): values.extend(results_store.to_list(block))
+        self.extra, self.maximum = values, None
+
+    def append(self, values: list) -> None:
+        if self.extra is None:
+            present = [v for v in values if v is not None]
+            if not all(results_store._is_number(v) for v in present):
+                self._to_extra()
+            else:
+                if len(present) != len(values) or not all(results_store._is_int(v) for v in present): self._to_float()
+                array = np.asarray([np.nan if v is None else v for v in values], dtype=self.dtype)
+                self._write(array)
+                chunk_max = results_store.column_max(array)
+                self.maximum = chunk_max if self.maximum is None else max(self.maximum, chunk_max)
+                return
+        self.extra.extend(values)
+
+    def finish(self):
+        """Returns the column as an np.memmap, or the value list for non-numeric fields."""
+        if self.extra is not None: return self.extra
+        self.file.close()
+        return np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.count,))
+
+
+class _TimeSeriesWriter:
+    def __init__(self, spill_dir: str):
+        self.spill_dir = spill_dir
+        self.fields: list[str] = []
+        self.sinks: dict[str, _ColumnSink] = {}
+        self.rows: list[dict] = []
+        self.count = 0
+
+    def add(self, record: dict) -> None:
+        self.rows.append(record)
+        if len(self.rows) >= INGEST_CHUNK_ROWS: self.flush()
+
+    def flush(self) -> None:
+        if not self.rows: return
+        for record in self.rows:
+            for field in record:
+                if field not in self.sinks:
+                    self.sinks[field] = _ColumnSink(os.path.join(self.spill_dir, f"c{len(self.fields)}"), leading_missing=self.count)
+                    self.fields.append(field)
+        for field in self.fields:
+            self.sinks[field].append([record.get(field) for record in self.rows])
+        self.count += len(self.rows)
+        self.rows = []
+
+
+def parse_output(f, on_record) -> dict:
+    """
+    Incrementally parses an engine output document from the binary file `f`.
+    Each time-series record is passed to `on_record` as soon as it is complete;
+    the returned summary holds every other top-level key.
+    """
+    summary, key, builder = {}, None, None
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if prefix == "":
+            if event == "map_key": key = value
+            continue
+        if key == results_store.TIMESERIES_KEY:
+            if prefix == results_store.TIMESERIES_KEY: continue  # the array itself
+            if builder is None: builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if prefix == _TS_ITEM and event not in _CONTAINER_EVENTS:
+                if isinstance(builder.value, dict): on_record(builder.value)
+                builder = None
+        else:
+            if builder is None: builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if prefix == key and event not in _CONTAINER_EVENTS:
+                summary[key] = builder.value
+                builder = None
+    return summary
+
+def save_results_file(db_simulation, output_path: str) -> None:
+    """
+    Streaming counterpart of results_store.save_results for an output.json on disk.
+    Memory stays bounded by INGEST_CHUNK_ROWS records: columns are spilled to
+    temporary files and compressed into the artifact straight from memory maps.
+    The caller is responsible for committing.
+    """
+    os.makedirs(results_store.RESULTS_BASE_DIR, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix=f"ingest_{db_simulation.id}_", dir=results_store.RESULTS_BASE_DIR)
+    try:
+        writer = _TimeSeriesWriter(spill_dir)
+        with open(output_path, "rb") as f:
+            summary = parse_output(f, writer.add)
+        writer.flush()
+
+        columns, extra, maxima = {}, {}, {}
+        for field in writer.fields:
+            sink = writer.sinks[field]
+            values = sink.finish()
+            if sink.extra is not None:
+                extra[field] = values
+            else:
+                columns[field] = values
+                maxima[field] = sink.maximum
+        results_store.apply_metrics(db_simulation, results_store.compute_metrics(summary, maxima=maxima))
+        db_simulation.timeseries_path = results_store.write_columns(db_simulation.id, writer.fields, columns, extra) if writer.count else None
+        db_simulation.timeseries_points = writer.count
+        db_simulation.results = json.dumps(summary)
+        del columns  # drop the memory maps before the spill files are removed
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
@@ -0,0 +1,235 @@
+import json, os, shutil, zipfile
+from typing import Iterable, Optional
+import numpy as np
+import tool_storage, fast_json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Time-series artifacts live outside simulation_runs/ so they survive run-directory cleanup.
+RESULTS_BASE_DIR = os.getenv("RESULTS_DIR", "simulation_results")
+TIMESERIES_KEY = "time_series_data"
+TIMESERIES_FILENAME = "timeseries.npz"
+
+# Reserved members of the .npz archive. Columns are stored as c0, c1, ... so that
+# arbitrary engine field names never have to be valid archive member names.
+_FIELDS_MEMBER = "__fields__"
+_EXTRA_MEMBER = "__extra__"
+
+
+def _is_int(v) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def _field_order(ts: Iterable[dict]) -> list[str]:
+    fields, seen = [], set()
+    for sample in ts:
+        for key in sample:
+            if key not in seen:
+                seen.add(key); fields.append(key)
+    return fields
+
+def to_columns(ts: list[dict]):
+    """
+    Splits a list of per-step records into one array per field.
+    Returns (fields, columns, extra): numeric fields become int64/float64 arrays
+    (missing values -> NaN), anything non-numeric is kept as a plain list in `extra`.
+    """
+    fields = _field_order(ts)
+    columns, extra = {}, {}
+    for field in fields:
+        values = [s.get(field) for s in ts]
+        present = [v for v in values if v is not None]
+        if present and len(present) == len(values) and all(_is_int(v) for v in present):
+            columns[field] = np.asarray(values, dtype=np.int64)
+        elif all(_is_number(v) for v in present):
+            columns[field] = np.asarray([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            extra[field] = values
+    return fields, columns, extra
+
+def artifact_path(simulation_id: int) -> str:
+    return os.path.join(RESULTS_BASE_DIR, f"sim_{simulation_id}", TIMESERIES_FILENAME)
+
+def write_timeseries(simulation_id: int, ts: list[dict]) -> str:
+    """Writes the time series as a compressed columnar .npz and returns its path."""
+    return write_columns(simulation_id, *to_columns(ts))
+
+def write_columns(simulation_id: int, fields: list[str], columns: dict, extra: dict) -> str:
+    """
+    Writes already split columns as the .npz artifact (the np.savez_compressed layout).
+    np.memmap columns are compressed straight from their backing file in blocks,
+    so they never have to be resident in memory.
+    """
+    members = {f"c{i}": columns[field] for i, field in enumerate(fields) if field in columns}
+    members[_FIELDS_MEMBER] = np.asarray(fields, dtype=np.str_)
+    members[_EXTRA_MEMBER] = np.asarray(json.dumps(extra))
+
+    path = artifact_path(simulation_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        for name, values in members.items():
+            with archive.open(f"{name}.npy", "w", force_zip64=True) as f:
+                if isinstance(values, np.memmap): _copy_memmap(f, values)
+                else: np.lib.format.write_array(f, np.asanyarray(values), allow_pickle=False)
+    os.replace(tmp_path, path)
+    return path
+
+def _copy_memmap(f, values: np.memmap, block_size: int = 1024 * 1024) -> None:
+    np.lib.format.write_array_header_1_0(f, np.lib.format.header_data_from_array_1_0(values))
+    remaining = values.nbytes
+    with open(values.filename, "rb") as src:
+        src.seek(values.offset)
+        while remaining > 0:
+            block = src.read(min(block_size, remaining))
+            if not block: break
+            f.write(block); remaining -= len(block)
+
+def load_timeseries(path: str, fields: Optional[Iterable[str]] = None) -> dict:
+    """
+    Loads the columnar time series from `path`. Only the requested `fields` are
+    decompressed; unknown field names are ignored. Returns {field: array-or-list}
+    in the engine's original field order.
+    """
+    with np.load(path, allow_pickle=False) as archive:
+        all_fields = archive[_FIELDS_MEMBER].tolist()
+        wanted = set(all_fields if fields is None else fields)
+        extra = None
+        data = {}
+        for i, field in enumerate(all_fields):
+            if field not in wanted: continue
+            member = f"c{i}"
+            if member in archive.files:
+                data[field] = archive[member]
+            else:
+                if extra is None: extra = json.loads(archive[_EXTRA_MEMBER].item())
+                data[field] = extra.get(field, [])
+    return data
+
+def to_list(values) -> list:
+    """Converts a column to a JSON-ready list (NaN -> None)."""
+    if not isinstance(values, np.ndarray): return list(values)
+    if values.dtype.kind == "f":
+        return [None if v != v else v for v in values.tolist()]
+    return values.tolist()
+
+def columns_to_records(columns: dict) -> list[dict]:
+    """Inverse of `to_columns`: rebuilds the engine's list-of-dicts layout (NaN -> None)."""
+    if not columns: return []
+    as_lists = {field: to_list(values) for field, values in columns.items()}
+    n = max(len(v) for v in as_lists.values())
+    return [{field: values[i] for field, values in as_lists.items()} for i in range(n)]
+
+METRIC_FIELDS = ("life_hours", "max_temp_C", "max_stress_MPa", "wear_microns")
+
+def column_max(values) -> float:
+    """Largest value of a column (one vectorized max; missing samples count as 0)."""
+    if values is None or len(values) == 0: return 0.0
+    try: values = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError): return 0.0
+    return float(np.nan_to_num(values, nan=0.0).max())
+
+def compute_metrics(summary: dict, columns: Optional[dict] = None, maxima: Optional[dict] = None) -> dict:
+    """Key result metrics, from the columns or from per-field maxima gathered while streaming."""
+    def col_max(field):
+        if maxima is not None: return maxima.get(field, 0.0)
+        return column_max(columns.get(field))
+
+    life = (summary.get("tool_life_prediction") or {}).get("predicted_hours", 0)
+    return {
+        "life_hours": float(life) if _is_number(life) else 0.0,
+        "max_temp_C": col_max("max_temperature_C"),
+        "max_stress_MPa": col_max("max_stress_MPa"),
+        "wear_microns": col_max("total_accumulated_wear_m") * 1e6
+    }
+
+def apply_metrics(db_simulation, metrics: dict) -> None:
+    for key in METRIC_FIELDS:
+        setattr(db_simulation, key, metrics[key])
+
+def stored_metrics(db_simulation) -> Optional[dict]:
+    if db_simulation.max_temp_C is None: return None
+    return {key: getattr(db_simulation, key) for key in METRIC_FIELDS}
+
+def save_results(db_simulation, results: dict) -> None:
+    """
+    Stores an engine output document for `db_simulation`: the time series goes to
+    the columnar artifact, key metrics go to their own columns and only the (small)
+    remaining summary is kept in the `results` column. The caller is responsible
+    for committing.
+    """
+    results = dict(results)
+    ts = results.pop(TIMESERIES_KEY, None) or []
+    fields, columns, extra = to_columns(ts)
+    apply_metrics(db_simulation, compute_metrics(results, columns))
+    # The records are split once, for the metrics and the artifact
+    db_simulation.timeseries_path = write_columns(db_simulation.id, fields, columns, extra) if ts else None
+    db_simulation.timeseries_points = len(ts)
+    db_simulation.results = json.dumps(results)
+
+def copy_results(source, db_simulation) -> None:
+    """Gives `db_simulation` the results of `source`; the time-series artifact is linked, not copied."""
+    db_simulation.results = source.results
+    db_simulation.timeseries_points = source.timeseries_points
+    apply_metrics(db_simulation, {key: getattr(source, key) for key in METRIC_FIELDS})
+    db_simulation.timeseries_path = None
+    if source.timeseries_path and os.path.exists(source.timeseries_path):
+        path = artifact_path(db_simulation.id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tool_storage.stage(source.timeseries_path, path)
+        db_simulation.timeseries_path = path
+
+def load_summary(db_simulation) -> Optional[dict]:
+    """Returns the parsed `results` column (legacy rows still carry their inline time series)."""
+    if not db_simulation.results: return None
+    return json.loads(db_simulation.results)
+
+def load_columns(db_simulation, fields: Optional[Iterable[str]] = None, summary: Optional[dict] = None) -> dict:
+    """Returns the time series as {field: array} for both artifact-backed and legacy rows."""
+    if db_simulation.timeseries_path:
+        if not os.path.exists(db_simulation.timeseries_path): return {}
+        return load_timeseries(db_simulation.timeseries_path, fields)
+
+    # Legacy row: the time series is still inline in the results blob.
+    if summary is None: summary = load_summary(db_simulation) or {}
+    ts = summary.get(TIMESERIES_KEY) or []
+    _, columns, extra = to_columns(ts)
+    columns.update(extra)
+    if fields is not None:
+        wanted = set(fields)
+        columns = {k: v for k, v in columns.items() if k in wanted}
+    return columns
+
+def timeseries_fields(db_simulation) -> list[str]:
+    """Field names of the stored time series, without decompressing any column."""
+    if db_simulation.timeseries_path:
+        if not os.path.exists(db_simulation.timeseries_path): return []
+        with np.load(db_simulation.timeseries_path, allow_pickle=False) as archive:
+            return archive[_FIELDS_MEMBER].tolist()
+    return _field_order((load_summary(db_simulation) or {}).get(TIMESERIES_KEY) or [])
+
+def load_results(db_simulation) -> Optional[dict]:
+    """Rebuilds the full engine output document (summary + time series) for API responses."""
+    summary = load_summary(db_simulation)
+    if summary is None or not db_simulation.timeseries_path: return summary
+    summary[TIMESERIES_KEY] = columns_to_records(load_columns(db_simulation, summary=summary))
+    return summary
+
+def results_json(db_simulation) -> Optional[bytes]:
+    """
+    JSON bytes of the same document as `load_results`. The stored summary is passed through
+    without being parsed; for artifact-backed rows the time series is serialized and spliced in.
+    """
+    if not db_simulation.results: return None
+    raw = db_simulation.results.encode("utf-8")
+    if not db_simulation.timeseries_path: return raw
+    records = columns_to_records(load_columns(db_simulation))
+    return fast_json.splice(raw, TIMESERIES_KEY, fast_json.dumps(records))
+
+def delete_results(simulation_id: int) -> None:
+    result_dir = os.path.dirname(artifact_path(simulation_id))
+    if os.path.exists(result_dir):
+        shutil.rmtree(result_dir, ignore_errors=True)
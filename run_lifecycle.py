@@ -0,0 +1,222 @@
+import datetime, json, os, shutil, zipfile
+from typing import Iterator, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+import models
+from engine_pool import RUNS_BASE_DIR
+
+load_dotenv()
+
+# --- Run-directory lifecycle policy ---
+# Completed runs are packed into one zip per run after RUN_ARCHIVE_AFTER_HOURS, failed runs are
+# removed after RUN_FAILED_RETENTION_HOURS. Results themselves live in results_store and are
+# never touched here. USER_DISK_QUOTA_MB (0 = unlimited) caps run dirs + archives per user.
+RUN_ARCHIVE_DIR = os.getenv("RUN_ARCHIVE_DIR", "simulation_archives")
+RUN_ARCHIVE_AFTER_HOURS = float(os.getenv("RUN_ARCHIVE_AFTER_HOURS", 24))
+RUN_FAILED_RETENTION_HOURS = float(os.getenv("RUN_FAILED_RETENTION_HOURS", 72))
+USER_DISK_QUOTA_MB = float(os.getenv("USER_DISK_QUOTA_MB", 0))
+RUN_SWEEP_INTERVAL_SECONDS = float(os.getenv("RUN_SWEEP_INTERVAL_SECONDS", 900))
+CHUNK_SIZE = 1024 * 1024
+
+
+def run_dir(simulation_id: int) -> str:
+    return os.path.join(RUNS_BASE_DIR, f"sim_{simulation_id}")
+
+def archive_path(simulation_id: int) -> str:
+    return os.path.join(RUN_ARCHIVE_DIR, f"sim_{simulation_id}.zip")
+
+def dir_size(path: str) -> int:
+    """Bytes used by a run directory; hardlinked files (staged tool blobs) are shared and not counted."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: st = os.stat(os.path.join(root, name))
+            except OSError: continue
+            if st.st_nlink <= 1: total += st.st_size
+    return total
+
+def _tool_filename(path: str) -> Optional[str]:
+    # The staged tool is a link into the content-addressed tool store; archives leave it out
+    try:
+        with open(os.path.join(path, "input.json"), "r") as f:
+            return json.load(f).get("file_paths", {}).get("tool_geometry")
+    except (OSError, ValueError):
+        return None
+
+def _age_hours(db_sim, path: str, now: datetime.datetime) -> float:
+    finished = db_sim.finished_at
+    if finished is None:
+        # Runs from before finished_at was recorded: fall back to the directory's mtime
+        try: finished = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+        except OSError: return 0.0
+    return (now - finished).total_seconds() / 3600
+
+def archive_run(db_sim) -> int:
+    """Packs the run directory into a single zip, removes the directory and returns the archive size."""
+    source = run_dir(db_sim.id)
+    skip = _tool_filename(source)
+    target = archive_path(db_sim.id)
+    os.makedirs(RUN_ARCHIVE_DIR, exist_ok=True)
+    tmp_path = target + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        for root, _, files in os.walk(source):
+            for name in files:
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, source).replace(os.sep, "/")
+                if rel == skip: continue
+                archive.write(full, rel)
+    os.replace(tmp_path, target)
+    shutil.rmtree(source, ignore_errors=True)
+    db_sim.run_archive_path = target
+    db_sim.run_disk_bytes = os.path.getsize(target)
+    return db_sim.run_disk_bytes
+
+def remove_run(db_sim) -> None:
+    """Deletes the run directory and archive."""
+    delete_run_files(db_sim.id)
+    db_sim.run_archive_path = None
+    db_sim.run_disk_bytes = 0
+
+def delete_run_files(simulation_id: int) -> None:
+    shutil.rmtree(run_dir(simulation_id), ignore_errors=True)
+    if os.path.exists(archive_path(simulation_id)): os.remove(archive_path(simulation_id))
+
+def _on_disk(query):
+    # run_disk_bytes == 0 marks runs whose files are already gone
+    return query.filter(
+        models.Simulation.reused_from_id.is_(None),
+        or_(models.Simulation.run_disk_bytes.is_(None), models.Simulation.run_disk_bytes > 0),
+    )
+
+def usage_by_user(db: Session) -> dict[int, int]:
+    rows = db.query(models.Simulation.owner_id, func.sum(models.Simulation.run_disk_bytes)).filter(
+        models.Simulation.run_disk_bytes > 0
+    ).group_by(models.Simulation.owner_id).all()
+    return {owner_id: int(total or 0) for owner_id, total in rows}
+
+def enforce_quota(db: Session, owner_id: int, used: int, quota: int) -> dict:
+    """
+    Frees the user's run storage until it fits the quota: failed run dirs first,
+    then completed runs are archived early, then archives are dropped oldest first.
+    """
+    report = {"removed": 0, "archived": 0}
+    base = _on_disk(db.query(models.Simulation)).filter(models.Simulation.owner_id == owner_id)
+    steps = [
+        (base.filter(models.Simulation.status == "FAILED"), False),
+        (base.filter(models.Simulation.status == "COMPLETED", models.Simulation.run_archive_path.is_(None)), True),
+        (base.filter(models.Simulation.status == "COMPLETED", models.Simulation.run_archive_path.isnot(None)), False),
+    ]
+    for query, archive in steps:
+        for db_sim in query.order_by(models.Simulation.id).all():
+            if used <= quota: return report
+            before = db_sim.run_disk_bytes or 0
+            if archive:
+                if not os.path.exists(run_dir(db_sim.id)): continue
+                used -= before - archive_run(db_sim); report["archived"] += 1
+            else:
+                remove_run(db_sim); used -= before; report["removed"] += 1
+            db.commit()
+    return report
+
+def sweep(db: Session, now: Optional[datetime.datetime] = None) -> dict:
+    """One pass of the lifecycle policy over all runs. Returns what was done."""
+    now = now or datetime.datetime.now()
+    report = {"archived": 0, "removed": 0, "orphans_removed": 0, "quota_users": 0, "errors": 0}
+    terminal = _on_disk(db.query(models.Simulation)).filter(
+        models.Simulation.status.in_(("COMPLETED", "FAILED")), models.Simulation.run_archive_path.is_(None)
+    )
+    for db_sim in terminal.order_by(models.Simulation.id).all():
+        path = run_dir(db_sim.id)
+        try:
+            if not os.path.exists(path):
+                db_sim.run_disk_bytes = 0
+            elif db_sim.status == "COMPLETED" and _age_hours(db_sim, path, now) >= RUN_ARCHIVE_AFTER_HOURS:
+                archive_run(db_sim); report["archived"] += 1
+            elif db_sim.status == "FAILED" and _age_hours(db_sim, path, now) >= RUN_FAILED_RETENTION_HOURS:
+                remove_run(db_sim); report["removed"] += 1
+            elif db_sim.run_disk_bytes is None:
+                db_sim.run_disk_bytes = dir_size(path)
+            db.commit()
+        except Exception as e:
+            db.rollback(); report["errors"] += 1
+            print(f"Run lifecycle: failed to process simulation {db_sim.id}: {e}")
+
+    # Directories of deleted simulations
+    if os.path.isdir(RUNS_BASE_DIR):
+        ids = {int(name[4:]) for name in os.listdir(RUNS_BASE_DIR) if name.startswith("sim_") and name[4:].isdigit()}
+        known = {row.id for row in db.query(models.Simulation.id).filter(models.Simulation.id.in_(ids))} if ids else set()
+        for simulation_id in ids - known:
+            path = run_dir(simulation_id)
+            if (now - datetime.datetime.fromtimestamp(os.path.getmtime(path))).total_seconds() / 3600 >= RUN_FAILED_RETENTION_HOURS:
+                shutil.rmtree(path, ignore_errors=True); report["orphans_removed"] += 1
+
+    if USER_DISK_QUOTA_MB > 0:
+        quota = int(USER_DISK_QUOTA_MB * 1024 * 1024)
+        for owner_id, used in usage_by_user(db).items():
+            if used <= quota: continue
+            freed = enforce_quota(db, owner_id, used, quota)
+            report["quota_users"] += 1
+            report["removed"] += freed["removed"]; report["archived"] += freed["archived"]
+    return report
+
+def disk_stats(db: Session) -> dict:
+    """Run storage overview for admins, from the sizes recorded on each simulation."""
+    rows = db.query(
+        models.Simulation.run_archive_path.isnot(None), func.count(models.Simulation.id), func.sum(models.Simulation.run_disk_bytes)
+    ).filter(models.Simulation.run_disk_bytes > 0).group_by(models.Simulation.run_archive_path.isnot(None)).all()
+    totals = {"directories": {"count": 0, "bytes": 0}, "archives": {"count": 0, "bytes": 0}}
+    for archived, count, total in rows:
+        totals["archives" if archived else "directories"] = {"count": count, "bytes": int(total or 0)}
+    quota = int(USER_DISK_QUOTA_MB * 1024 * 1024) or None
+    users = sorted(usage_by_user(db).items(), key=lambda item: -item[1])
+    os.makedirs(RUNS_BASE_DIR, exist_ok=True)
+    volume = shutil.disk_usage(RUNS_BASE_DIR)
+    return {
+        **totals,
+        "users": [{"owner_id": owner_id, "bytes": used, "quota_bytes": quota, "over_quota": bool(quota and used > quota)} for owner_id, used in users],
+        "volume": {"total": volume.total, "used": volume.used, "free": volume.free},
+        "policy": {
+            "archive_after_hours": RUN_ARCHIVE_AFTER_HOURS,
+            "failed_retention_hours": RUN_FAILED_RETENTION_HOURS,
+            "user_quota_mb": USER_DISK_QUOTA_MB or None,
+        },
+    }
+
+# --- Artifact access (live run directory or archive) ---
+
+def list_artifacts(simulation_id: int) -> Optional[list[dict]]:
+    """Files of a run, or None when neither its directory nor its archive exists."""
+    source = run_dir(simulation_id)
+    if os.path.isdir(source):
+        files = []
+        for root, _, names in os.walk(source):
+            for name in names:
+                full = os.path.join(root, name)
+                files.append({"name": os.path.relpath(full, source).replace(os.sep, "/"), "size": os.path.getsize(full), "archived": False})
+        return sorted(files, key=lambda f: f["name"])
+    if os.path.exists(archive_path(simulation_id)):
+        with zipfile.ZipFile(archive_path(simulation_id)) as archive:
+            return [{"name": info.filename, "size": info.file_size, "archived": True} for info in archive.infolist() if not info.is_dir()]
+    return None
+
+def artifact_file(simulation_id: int, name: str) -> Optional[str]:
+    """Path of an artifact in the live run directory (None if not there or outside the directory)."""
+    source = os.path.realpath(run_dir(simulation_id))
+    path = os.path.realpath(os.path.join(source, name))
+    if not path.startswith(source + os.sep) or not os.path.isfile(path): return None
+    return path
+
+def archived_artifact(simulation_id: int, name: str) -> Optional[Iterator[bytes]]:
+    """Chunks of one archived file, decompressed on the fly (None if not archived)."""
+    path = archive_path(simulation_id)
+    if not os.path.exists(path): return None
+    archive = zipfile.ZipFile(path)
+    if name not in archive.namelist():
+        archive.close(); return None
+
+    def chunks():
+        with archive, archive.open(name) as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                yield chunk
+    return chunks()
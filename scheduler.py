@@ -0,0 +1,112 @@
+import datetime, math, os
+from typing import Optional
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+import models
+
+load_dotenv()
+
+# --- Queues ---
+# admin: anything submitted by an admin; interactive: single runs from the UI; batch: sweeps.
+# Workers consume them in this order (see worker.py), so a batch backlog never delays an interactive run.
+QUEUE_ADMIN, QUEUE_INTERACTIVE, QUEUE_BATCH = "admin", "interactive", "batch"
+QUEUES = (QUEUE_ADMIN, QUEUE_INTERACTIVE, QUEUE_BATCH)
+
+# --- Fair share ---
+# The Redis broker keeps one list per priority level and serves level 0 first. A job's level is
+# the number of jobs its owner already has waiting in the same queue, so users are interleaved:
+# a 40-point sweep takes levels 0..9 and another user's single run still lands on level 0.
+PRIORITY_LEVELS = 10
+
+# Engine runs per worker process pool; defaults to one per CPU core
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 0)) or os.cpu_count() or 1
+# Engine runs across all workers serving a queue; only used for start-time estimates
+SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", 0)) or WORKER_CONCURRENCY
+# Assumed run time until a queue has finished runs to average over
+DEFAULT_RUN_SECONDS = float(os.getenv("DEFAULT_RUN_SECONDS", 900))
+RUNTIME_SAMPLE_SIZE = 50
+
+
+def choose_queue(is_admin: bool, batch: bool = False) -> str:
+    if is_admin: return QUEUE_ADMIN
+    return QUEUE_BATCH if batch else QUEUE_INTERACTIVE
+
+def _waiting(db: Session, queue: str):
+    # Jobs that hold a broker message and have not started; joined copies never run themselves
+    return db.query(models.Simulation).filter(
+        models.Simulation.queue == queue,
+        models.Simulation.status == "PENDING",
+        models.Simulation.reused_from_id.is_(None),
+    )
+
+def fair_share_priorities(db: Session, owner_id: int, queue: str, count: int = 1) -> list[int]:
+    """Priority levels for the owner's next `count` jobs in `queue` (0 is served first)."""
+    backlog = _waiting(db, queue).filter(models.Simulation.owner_id == owner_id).count()
+    return [min(PRIORITY_LEVELS - 1, backlog + i) for i in range(count)]
+
+def mark_queued(db_simulation, queue: str, priority: int) -> None:
+    db_simulation.queue = queue
+    db_simulation.queue_priority = priority
+    db_simulation.queued_at = datetime.datetime.now()
+
+def average_run_seconds(db: Session, queue: str) -> float:
+    rows = db.query(models.Simulation.started_at, models.Simulation.finished_at).filter(
+        models.Simulation.queue == queue,
+        models.Simulation.status == "COMPLETED",
+        models.Simulation.started_at.isnot(None),
+        models.Simulation.finished_at.isnot(None),
+    ).order_by(models.Simulation.id.desc()).limit(RUNTIME_SAMPLE_SIZE).all()
+    durations = [(finished - started).total_seconds() for started, finished in rows]
+    return sum(durations) / len(durations) if durations else DEFAULT_RUN_SECONDS
+
+def queue_position(db: Session, db_simulation) -> Optional[dict]:
+    """
+    Position of a waiting run in its queue and an estimated start time, or None once it started.
+    Runs that joined an identical in-flight run report that run's position.
+    """
+    if db_simulation.status != "PENDING": return None
+    job = db_simulation
+    if job.reused_from_id:
+        job = db.query(models.Simulation).filter(models.Simulation.id == job.reused_from_id).first()
+        if job is None or job.status != "PENDING": return None
+    if not job.queue: return None
+
+    priority = job.queue_priority or 0
+    ahead = _waiting(db, job.queue).filter(or_(
+        models.Simulation.queue_priority < priority,
+        and_(models.Simulation.queue_priority == priority, models.Simulation.id < job.id),
+    )).count()
+    running = db.query(func.count(models.Simulation.id)).filter(
+        models.Simulation.queue == job.queue, models.Simulation.status == "RUNNING"
+    ).scalar()
+    # Whole "waves" of SCHEDULER_SLOTS runs that must finish before a slot frees up for this job
+    waves = max(0, math.ceil((running + ahead + 1 - SCHEDULER_SLOTS) / SCHEDULER_SLOTS))
+    wait = waves * average_run_seconds(db, job.queue)
+    return {
+        "simulation_id": db_simulation.id,
+        "queue": job.queue,
+        "priority": priority,
+        "position": ahead + 1,
+        "jobs_ahead": ahead,
+        "running": running,
+        "estimated_wait_seconds": round(wait, 1),
+        "estimated_start": datetime.datetime.now() + datetime.timedelta(seconds=wait),
+    }
+
+def queue_stats(db: Session) -> list[dict]:
+    """Waiting and running jobs per queue and user, for admins."""
+    rows = db.query(
+        models.Simulation.queue, models.Simulation.owner_id, models.Simulation.status, func.count(models.Simulation.id)
+    ).filter(
+        models.Simulation.queue.isnot(None),
+        models.Simulation.status.in_(("PENDING", "RUNNING")),
+        models.Simulation.reused_from_id.is_(None),
+    ).group_by(models.Simulation.queue, models.Simulation.owner_id, models.Simulation.status).all()
+    stats = {q: {"queue": q, "waiting": 0, "running": 0, "users": {}} for q in QUEUES}
+    for queue, owner_id, status, count in rows:
+        entry = stats.setdefault(queue, {"queue": queue, "waiting": 0, "running": 0, "users": {}})
+        key = "waiting" if status == "PENDING" else "running"
+        entry[key] += count
+        entry["users"].setdefault(owner_id, {"waiting": 0, "running": 0})[key] += count
+    return list(stats.values())
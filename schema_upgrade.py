@@ -0,0 +1,88 @@
+"""
+Brings an existing database up to the current models. create_all only creates missing tables;
+this also adds the columns and indexes that were added to existing tables since the database
+was created, and drops unique constraints the models no longer have (tools.file_path: stored
+tool files are shared between tools since they are deduplicated by content hash).
+Idempotent: run it as often as you like, it only changes what differs.
+
+    python schema_upgrade.py          (uses DATABASE_URL, like the API)
+
+The API runs it at startup as well. Columns are added as nullable, with the model's constant
+default (if any) filling existing rows; no data is dropped.
+"""
+from sqlalchemy import UniqueConstraint, inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+import models
+from database import engine as default_engine
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = str(CreateColumn(column).compile(dialect=dialect)).replace(" NOT NULL", "")
+    default = column.default
+    if column.server_default is None and default is not None and default.is_scalar:
+        literal = column.type.literal_processor(dialect)
+        ddl += f" DEFAULT {literal(default.arg) if literal else default.arg}"
+    for fk in column.foreign_keys:
+        ddl += f" REFERENCES {fk.column.table.name} ({fk.column.name})"
+        if fk.ondelete: ddl += f" ON DELETE {fk.ondelete}"
+    return ddl
+
+def _model_unique_sets(table) -> set:
+    sets = {frozenset([c.name]) for c in table.columns if c.unique or c.primary_key}
+    sets |= {frozenset(c.name for c in constraint.columns) for constraint in table.constraints if isinstance(constraint, UniqueConstraint)}
+    sets |= {frozenset(c.name for c in index.columns) for index in table.indexes if index.unique}
+    return sets
+
+def _rebuild_sqlite_table(table, dialect) -> list[str]:
+    # SQLite cannot drop a constraint: copy the rows into a table created from the model instead
+    # (https://www.sqlite.org/lang_altertable.html#otheralter). References to the table keep
+    # working because the new table ends up under the same name.
+    columns = ", ".join(c.name for c in table.columns)
+    create = str(CreateTable(table).compile(dialect=dialect)).strip().replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {table.name}__new ", 1)
+    return [
+        create,
+        f"INSERT INTO {table.name}__new ({columns}) SELECT {columns} FROM {table.name}",
+        f"DROP TABLE {table.name}",
+        f"ALTER TABLE {table.name}__new RENAME TO {table.name}",
+    ]
+
+def _run(connection, statements: list[str], done: list[str]) -> None:
+    for statement in statements:
+        print(f"Schema upgrade: {statement.splitlines()[0]}")
+        connection.execute(text(statement))
+        done.append(statement)
+
+def upgrade(engine=default_engine) -> list[str]:
+    """Adds missing columns, drops stale unique constraints, adds missing indexes and tables. Returns the statements run."""
+    done = []
+    dialect = engine.dialect
+    tables = [t for t in models.Base.metadata.sorted_tables if inspect(engine).has_table(t.name)]
+    with engine.begin() as connection:
+        # 1. Columns
+        inspector = inspect(connection)
+        for table in tables:
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            _run(connection, [f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(c, dialect)}" for c in table.columns if c.name not in columns], done)
+
+        # 2. Unique constraints the models dropped
+        for table in tables:
+            stale = [u for u in inspect(connection).get_unique_constraints(table.name) if frozenset(u["column_names"]) not in _model_unique_sets(table)]
+            if not stale: continue
+            if dialect.name == "sqlite": _run(connection, _rebuild_sqlite_table(table, dialect), done)
+            else: _run(connection, [f"ALTER TABLE {table.name} DROP CONSTRAINT {u['name']}" for u in stale], done)
+
+        # 3. Indexes (after 2: a rebuilt table has none); dialect-specific ones (ddl_if) only on their dialect
+        inspector = inspect(connection)
+        for table in tables:
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            creates = [CreateIndex(index) for index in table.indexes if index.name not in indexes]
+            _run(connection, [str(c.compile(dialect=dialect)) for c in creates if c._should_execute(c.element, connection)], done)
+
+    # 4. New tables
+    models.Base.metadata.create_all(bind=engine)
+    return done
+
+
+if __name__ == "__main__":
+    applied = upgrade()
+    print(f"Schema upgrade: {len(applied)} statement(s) applied." if applied else "Schema upgrade: database is up to date.")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, Any
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, Any, Dict, List, Literal
 import datetime
 
 # --- Tool Schemas ---
@@ -13,6 +13,11 @@ class ToolCreate(ToolBase):
 class Tool(ToolBase):
     id: int
     file_path: str
+    content_hash: Optional[str] = None
+    file_size: Optional[int] = None
+    triangle_count: Optional[int] = None
+    is_watertight: Optional[bool] = None
+    mesh_info: Optional[str] = None
     owner_id: int
 
     class Config:
@@ -28,7 +33,8 @@ class MaterialCreate(MaterialBase):
 
 class Material(MaterialBase):
     id: int
-    owner_id: int
+    # None for entries of the shared global catalog
+    owner_id: Optional[int] = None
     properties: str 
 
     class Config:
@@ -48,11 +54,94 @@ class Simulation(SimulationBase):
     tool_id: Optional[int] = None
     status: str
     results: Optional[str] = None
+    timeseries_points: Optional[int] = None
+    life_hours: Optional[float] = None
+    max_temp_C: Optional[float] = None
+    max_stress_MPa: Optional[float] = None
+    wear_microns: Optional[float] = None
+    reused_from_id: Optional[int] = None
+    material_properties: Optional[str] = None
+    queue: Optional[str] = None
+    queued_at: Optional[datetime.datetime] = None
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+    analysis_status: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# Projection of a Simulation for listings; only the selected fields are set.
+class SimulationListItem(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[str] = None
+    owner_id: Optional[int] = None
+    tool_id: Optional[int] = None
+    timeseries_points: Optional[int] = None
+    life_hours: Optional[float] = None
+    max_temp_C: Optional[float] = None
+    max_stress_MPa: Optional[float] = None
+    wear_microns: Optional[float] = None
+    results: Optional[str] = None
     material_properties: Optional[str] = None
 
+# --- Sweep Schemas ---
+class SweepCreate(BaseModel):
+    name: str
+    description: Optional[str] = None
+    tool_id: int
+    simulation_parameters: Dict[str, Any] = {}
+    physics_parameters: Dict[str, Any] = {}
+    material_properties: Dict[str, Any] = {}
+    cfd_parameters: Dict[str, Any] = {}
+    # Dotted path -> values, e.g. {"simulation_parameters.feed_rate_mm_rev": [0.1, 0.2]}
+    grid: Dict[str, List[Any]]
+    force_rerun: bool = False
+
+class Sweep(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    owner_id: int
+    tool_id: Optional[int] = None
+    total_points: int
+    created_at: datetime.datetime
+
     class Config:
         from_attributes = True
 
+class SweepStatus(Sweep):
+    status_counts: Dict[str, int]
+    progress_percentage: float
+
+# Where a waiting run stands in its Celery queue (see scheduler.queue_position)
+class QueuePosition(BaseModel):
+    simulation_id: int
+    queue: str
+    priority: int
+    position: int
+    jobs_ahead: int
+    running: int
+    estimated_wait_seconds: float
+    estimated_start: datetime.datetime
+
+class QueueStats(BaseModel):
+    queue: str
+    waiting: int
+    running: int
+    users: Dict[int, Dict[str, int]]
+
+class SweepPoint(BaseModel):
+    simulation_id: int
+    status: str
+    params: Dict[str, Any]
+    reused_from_id: Optional[int] = None
+    life_hours: Optional[float] = None
+    max_temp_C: Optional[float] = None
+    max_stress_MPa: Optional[float] = None
+    wear_microns: Optional[float] = None
+
 # --- User Schemas ---
 class UserBase(BaseModel):
     email: EmailStr
@@ -60,10 +149,15 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
-class User(UserBase):
+class UserProfile(UserBase):
     id: int
     is_admin: bool
     subscription_expiry: Optional[datetime.datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class User(UserProfile):
     simulations: list[Simulation] = []
     materials: list[Material] = []
     tools: list[Tool] = []
@@ -85,6 +179,72 @@ class AdminUserUpdate(BaseModel):
 class AdminUserPasswordReset(BaseModel):
     new_password: str
 
+class AdminUserOverview(BaseModel):
+    id: int
+    email: str
+    is_admin: bool
+    subscription_expiry: Optional[datetime.datetime] = None
+    # admin, unlimited, active, expiring or expired
+    subscription_status: str
+    simulations: int
+    simulations_by_status: Dict[str, int]
+    active_jobs: int
+    run_disk_bytes: int
+    last_submitted_at: Optional[datetime.datetime] = None
+    materials: int
+    tools: int
+
+class BulkAccessRequestApproval(BaseModel):
+    request_ids: List[int]
+    # None: no expiry (unlimited)
+    subscription_days: Optional[int] = Field(30, ge=1)
+    # Queue the "request approved" email for each approved request
+    notify: bool = True
+
+class AccessRequestApprovalResult(BaseModel):
+    request_id: int
+    # created, user_exists, duplicate, already_approved or not_found
+    status: str
+    email: Optional[str] = None
+    user_id: Optional[int] = None
+    # Only for created users; hand it to the user, it is not stored anywhere
+    temporary_password: Optional[str] = None
+
+class BulkSubscriptionUpdate(BaseModel):
+    # extend: +days from the later of now and the current expiry; expire: now; set: `expiry`
+    action: Literal["extend", "expire", "set"]
+    days: Optional[int] = None
+    expiry: Optional[datetime.datetime] = None
+    # Filters (combined); at least one is required unless all_users is set
+    user_ids: Optional[List[int]] = None
+    email_prefix: Optional[str] = None
+    subscription: Optional[Literal["unlimited", "active", "expiring", "expired"]] = None
+    all_users: bool = False
+
+class SubscriptionUpdateResult(BaseModel):
+    user_id: int
+    # updated, skipped_admin, skipped_unlimited or not_found
+    status: str
+    email: Optional[str] = None
+    previous_expiry: Optional[datetime.datetime] = None
+    subscription_expiry: Optional[datetime.datetime] = None
+
+class BulkSubscriptionResult(BaseModel):
+    # Users per outcome
+    updated: int
+    skipped_admin: int
+    skipped_unlimited: int
+    not_found: int
+    # Per user, only when the call listed user_ids (filter-based calls can match every user)
+    results: Optional[List[SubscriptionUpdateResult]] = None
+
+class AdminOverview(BaseModel):
+    # Users matching the filters (all pages)
+    total: int
+    users: List[AdminUserOverview]
+    # Site-wide figures, sent with the first page only
+    totals: Optional[Dict[str, Any]] = None
+
 # --- NEW: Access Request Schemas ---
 class AccessRequestCreate(BaseModel):
     email: EmailStr
@@ -0,0 +1,103 @@
+"""
+Minimal local SMTP server for development and tests: accepts every message, keeps it in
+memory and optionally writes it to a directory as .eml. No TLS, no authentication.
+
+    python smtp_stub.py [--port 1025] [--dir mail_stub] [--fail-first N]
+
+Point the backend at it with MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_STARTTLS=false and
+MAIL_USERNAME unset. --fail-first answers the first N messages with a temporary 451 error
+to exercise the outbox retry path.
+"""
+import argparse, os, socketserver, threading, time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self) -> None:
+        stub: "SMTPStub" = self.server.stub
+        stub.connections += 1
+        sender, recipients = None, []
+        self.reply("220 smtp-stub ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw: return
+            command, _, argument = raw.decode("utf-8", "replace").strip().partition(" ")
+            command = command.upper()
+            if command == "EHLO": self.reply("250-smtp-stub"); self.reply("250 8BITMIME")
+            elif command == "HELO": self.reply("250 smtp-stub")
+            elif command == "MAIL": sender, recipients = argument.partition(":")[2].strip(" <>"), []; self.reply("250 OK")
+            elif command == "RCPT": recipients.append(argument.partition(":")[2].strip(" <>")); self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"): break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                if stub.take_failure(): self.reply("451 Temporary failure (smtp-stub)")
+                else:
+                    stub.store(sender, recipients, b"".join(lines)); self.reply("250 Queued")
+                sender, recipients = None, []
+            elif command == "RSET": sender, recipients = None, []; self.reply("250 OK")
+            elif command == "NOOP": self.reply("250 OK")
+            elif command == "QUIT": self.reply("221 Bye"); return
+            else: self.reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStub:
+    """The stub server; also usable in-process: `with SMTPStub(port=0) as stub: ... stub.messages`."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025, directory: str = None, fail_first: int = 0):
+        self.server = _Server((host, port), _Handler)
+        self.server.stub = self
+        self.host, self.port = self.server.server_address
+        self.directory, self.failures_left = directory, fail_first
+        self.messages: list[dict] = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        if directory: os.makedirs(directory, exist_ok=True)
+
+    def take_failure(self) -> bool:
+        with self._lock:
+            if self.failures_left <= 0: return False
+            self.failures_left -= 1
+            return True
+
+    def store(self, sender: str, recipients: list, data: bytes) -> None:
+        with self._lock:
+            self.messages.append({"from": sender, "to": recipients, "data": data})
+            count = len(self.messages)
+        print(f"smtp-stub: message {count} from {sender} to {', '.join(recipients)} ({len(data)} bytes)")
+        if self.directory:
+            with open(os.path.join(self.directory, f"{int(time.time() * 1000)}-{count}.eml"), "wb") as f: f.write(data)
+
+    def start(self) -> "SMTPStub":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown(); self.server.server_close()
+
+    def __enter__(self): return self.start()
+
+    def __exit__(self, *exc): self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--dir", default=None, help="write received messages here as .eml")
+    parser.add_argument("--fail-first", type=int, default=0, help="answer the first N messages with 451")
+    args = parser.parse_args()
+    stub = SMTPStub(args.host, args.port, args.dir, args.fail_first)
+    print(f"smtp-stub listening on {stub.host}:{stub.port}")
+    try: stub.server.serve_forever()
+    except KeyboardInterrupt: stub.stop()
@@ -0,0 +1,41 @@
+import copy, itertools
+from typing import Any, Iterator
+
+# Sections of the engine input a sweep may vary; grid keys are dotted paths into them,
+# e.g. "simulation_parameters.cutting_speed_m_min"
+SWEEP_SECTIONS = ("simulation_parameters", "physics_parameters", "material_properties", "cfd_parameters")
+SWEEP_MAX_POINTS = 500
+
+
+def validate_grid(grid: dict[str, list[Any]], max_points: int = SWEEP_MAX_POINTS) -> int:
+    """Raises ValueError for an unusable grid, otherwise returns the number of points."""
+    if not grid: raise ValueError("Grid must contain at least one parameter.")
+    total = 1
+    for path, values in grid.items():
+        section, _, rest = path.partition(".")
+        if section not in SWEEP_SECTIONS or not rest:
+            raise ValueError(f"Grid key '{path}' must look like '<section>.<parameter>' with section one of {', '.join(SWEEP_SECTIONS)}.")
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Grid key '{path}' needs a non-empty list of values.")
+        total *= len(values)
+    if total > max_points:
+        raise ValueError(f"Grid expands to {total} points (limit {max_points}).")
+    return total
+
+def set_path(config: dict, path: str, value: Any) -> None:
+    keys = path.split(".")
+    node = config
+    for key in keys[:-1]:
+        if not isinstance(node.get(key), dict): node[key] = {}
+        node = node[key]
+    node[keys[-1]] = value
+
+def expand(base: dict, grid: dict[str, list[Any]]) -> Iterator[tuple[dict, dict]]:
+    """Yields (point, config) for the cartesian product of the grid, in a stable order."""
+    paths = list(grid)
+    for values in itertools.product(*(grid[p] for p in paths)):
+        point = dict(zip(paths, values))
+        config = copy.deepcopy(base)
+        for path, value in point.items():
+            set_path(config, path, value)
+        yield point, config
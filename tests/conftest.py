@@ -0,0 +1,60 @@
+import os, sys, tempfile
+
+# Every module reads its settings at import time: point the database and the storage
+# directories at a scratch directory before anything from the backend is imported.
+_workdir = tempfile.mkdtemp(prefix="edgepredict_tests_")
+os.chdir(_workdir)
+os.environ["DATABASE_URL"] = f"sqlite:///{_workdir}/test.db"
+os.environ["EMAIL_SENDER_ENABLED"] = "false"
+os.environ.pop("MAIL_SERVER", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import datetime
+import pytest
+import models, security
+from database import SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def make_user(db):
+    def make(email: str, is_admin: bool = False, password: str = "pw", days: int = 30):
+        salt = security.get_random_salt()
+        user = models.User(email=email, hashed_password=security.hash_password(password, salt), salt=salt, is_admin=is_admin,
+                           subscription_expiry=datetime.datetime.now() + datetime.timedelta(days=days))
+        db.add(user); db.commit(); db.refresh(user)
+        return user
+    return make
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    import main, principal_cache
+    principal_cache.cache.clear()
+    return TestClient(main.app)
+
+@pytest.fixture
+def auth(client):
+    """Authorization headers for an existing user."""
+    def headers(email: str, password: str = "pw") -> dict:
+        token = client.post("/token", data={"username": email, "password": password}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return headers
+
+@pytest.fixture
+def make_simulation(db):
+    def make(owner, **columns):
+        columns.setdefault("status", "COMPLETED")
+        sim = models.Simulation(name="sim", description="", owner_id=owner.id, **columns)
+        db.add(sim); db.commit(); db.refresh(sim)
+        return sim
+    return make
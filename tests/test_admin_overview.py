@@ -0,0 +1,32 @@
+from sqlalchemy import create_mock_engine
+from sqlalchemy.orm import Session
+import crud, models
+
+
+def matches(db, prefix):
+    return sorted(email for (email,) in crud._email_prefix(db.query(models.User.email), prefix))
+
+
+def test_email_prefix_is_literal_and_case_sensitive(db, make_user):
+    for email in ("a_b@x.com", "axb@x.com", "a%c@x.com", "A@x.com", "b@x.com"):
+        make_user(email)
+    assert matches(db, "a") == ["a%c@x.com", "a_b@x.com", "axb@x.com"]
+    assert matches(db, "a_") == ["a_b@x.com"]
+    assert matches(db, "a%") == ["a%c@x.com"]
+    assert matches(db, "A") == ["A@x.com"]
+    assert matches(db, "") == ["A@x.com", "a%c@x.com", "a_b@x.com", "axb@x.com", "b@x.com"]
+
+def test_postgres_prefix_search_does_not_rely_on_byte_order():
+    # Under a locale collation U+10FFFF sorts before letters, so a range bound would miss rows
+    engine = create_mock_engine("postgresql://", lambda *args, **kwargs: None)
+    query = crud._email_prefix(Session(bind=engine).query(models.User.email), "ab")
+    sql = str(query.statement.compile(dialect=engine.dialect))
+    assert "LIKE" in sql and "ESCAPE" in sql and ">=" not in sql
+    index = next(i for i in models.User.__table__.indexes if i.name == "ix_users_email_pattern")
+    assert index.dialect_options["postgresql"]["ops"] == {"email": "text_pattern_ops"}
+
+def test_overview_prefix_filter(client, auth, make_user):
+    make_user("admin@x.com", is_admin=True)
+    for email in ("ab@x.com", "a_c@x.com", "b@x.com"): make_user(email)
+    body = client.get("/admin/overview", params={"email": "a_"}, headers=auth("admin@x.com")).json()
+    assert [u["email"] for u in body["users"]] == ["a_c@x.com"] and body["total"] == 1
@@ -0,0 +1,64 @@
+import asyncio, datetime, os
+import ai_analysis, results_store
+from database import AsyncSessionLocal, async_engine
+
+
+def run(make_simulation, owner, temps, **columns):
+    sim = make_simulation(owner, **columns)
+    results_store.save_results(sim, {"tool_life_prediction": {"predicted_hours": 2.0},
+                                     "time_series_data": [{"time_s": i * 0.1, "max_temperature_C": t} for i, t in enumerate(temps)]})
+    return sim
+
+def test_identical_results_share_a_hash_without_a_fingerprint(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    first, second = run(make_simulation, alice, [20.0, 30.0, 40.0]), run(make_simulation, alice, [20.0, 30.0, 40.0])
+    # Separately written artifacts: the container bytes may differ, the data does not
+    assert ai_analysis.results_hash(first, results_store.load_summary(first)) == ai_analysis.results_hash(second, results_store.load_summary(second))
+    third = run(make_simulation, alice, [20.0, 30.0, 41.0])
+    assert ai_analysis.results_hash(third, results_store.load_summary(third)) != ai_analysis.results_hash(first, results_store.load_summary(first))
+
+def test_fingerprinted_runs_are_keyed_without_reading_the_artifact(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    first = run(make_simulation, alice, [20.0, 30.0], input_fingerprint="fp")
+    summary = results_store.load_summary(first)
+    before = ai_analysis.results_hash(first, summary)
+    os.remove(first.timeseries_path)
+    assert ai_analysis.results_hash(first, summary) == before
+    first.input_fingerprint = "other"
+    assert ai_analysis.results_hash(first, summary) != before
+
+def test_stored_analysis_does_not_change_the_hash(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    sim = run(make_simulation, alice, [20.0], input_fingerprint="fp")
+    summary = results_store.load_summary(sim)
+    assert ai_analysis.results_hash(sim, {**summary, ai_analysis.ANALYSIS_KEY: "text"}) == ai_analysis.results_hash(sim, summary)
+
+
+def claim(simulation_id):
+    async def go():
+        try:
+            async with AsyncSessionLocal() as db: return await ai_analysis.claim(db, simulation_id)
+        finally:
+            await async_engine.dispose()  # aiosqlite connections belong to this event loop
+    return asyncio.run(go())
+
+def test_only_one_process_claims_an_analysis(db, make_user, make_simulation):
+    sim = make_simulation(make_user("alice@x.com"))
+    assert claim(sim.id) is True
+    assert claim(sim.id) is False
+    db.refresh(sim)
+    assert sim.analysis_status == "PENDING" and ai_analysis.in_progress(sim)
+
+def test_stale_claims_are_taken_over_and_reset(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    old = datetime.datetime.now() - datetime.timedelta(seconds=ai_analysis.AI_JOB_STALE_SECONDS + 60)
+    stale = make_simulation(alice, analysis_status="RUNNING", analysis_started_at=old)
+    live = make_simulation(alice, analysis_status="RUNNING", analysis_started_at=datetime.datetime.now())
+    legacy = make_simulation(alice, analysis_status="PENDING")
+    done = make_simulation(alice, analysis_status="COMPLETED", analysis_started_at=old)
+    assert not ai_analysis.in_progress(stale) and ai_analysis.in_progress(live)
+
+    assert ai_analysis.reset_stale() == 2
+    db.expire_all()
+    assert [s.analysis_status for s in (stale, live, legacy, done)] == [None, "RUNNING", None, "COMPLETED"]
+    assert claim(stale.id) is True and claim(live.id) is False and claim(done.id) is True
@@ -0,0 +1,122 @@
+import datetime
+import pytest
+from sqlalchemy import event
+import crud, models, security
+from database import engine
+
+
+def access_request(db, email, status="PENDING"):
+    request = models.AccessRequest(email=email, name="Name", company="Co", status=status)
+    db.add(request); db.commit(); db.refresh(request)
+    return request
+
+def expiry(db, user):
+    db.expire_all()
+    return db.get(models.User, user.id).subscription_expiry
+
+
+# --- Access request approval ---
+
+def test_bulk_approve_outcomes(db, make_user):
+    make_user("taken@x.com")
+    new, twin, taken, done = (access_request(db, e) for e in ("new@x.com", "new@x.com", "taken@x.com", "done@x.com"))
+    done.status = "APPROVED"; db.commit()
+
+    results = crud.bulk_approve_access_requests(db, [new.id, twin.id, taken.id, done.id, new.id, 999], subscription_days=10)
+    assert [(r["request_id"], r["status"]) for r in results] == [
+        (new.id, "created"), (twin.id, "duplicate"), (taken.id, "user_exists"), (done.id, "already_approved"), (999, "not_found"),
+    ]
+    created = db.get(models.User, results[0]["user_id"])
+    assert created.email == "new@x.com" and not created.is_admin
+    assert security.verify_password(results[0]["temporary_password"], created.hashed_password, created.salt)
+    assert datetime.timedelta(days=9) < created.subscription_expiry - datetime.datetime.now() <= datetime.timedelta(days=10)
+    db.expire_all()
+    assert {r.id: r.status for r in db.query(models.AccessRequest)} == dict.fromkeys((new.id, twin.id, taken.id, done.id), "APPROVED")
+    # One "approved" email per request approved by this call, none for the one approved before
+    assert sorted(row.recipient for row in db.query(models.EmailOutbox)) == ["new@x.com", "new@x.com", "taken@x.com"]
+
+def test_bulk_approve_without_notify_queues_nothing(db):
+    request = access_request(db, "quiet@x.com")
+    assert crud.bulk_approve_access_requests(db, [request.id], notify=False)[0]["status"] == "created"
+    assert db.query(models.EmailOutbox).count() == 0
+
+def test_bulk_approve_endpoint_limits_and_admin_only(client, auth, make_user, monkeypatch):
+    import main
+    make_user("admin@x.com", is_admin=True); make_user("user@x.com")
+    monkeypatch.setattr(main, "BULK_MAX_ITEMS", 2)
+    assert client.post("/admin/access-requests/approve", json={"request_ids": [1]}, headers=auth("user@x.com")).status_code == 403
+    response = client.post("/admin/access-requests/approve", json={"request_ids": [1, 2, 3]}, headers=auth("admin@x.com"))
+    assert response.status_code == 400
+    # 0 or negative days would mean an unlimited or an already expired account
+    for days in (0, -5):
+        response = client.post("/admin/access-requests/approve", json={"request_ids": [1], "subscription_days": days}, headers=auth("admin@x.com"))
+        assert response.status_code == 422
+
+def test_bulk_approve_without_expiry(db):
+    request = access_request(db, "forever@x.com")
+    result = crud.bulk_approve_access_requests(db, [request.id], subscription_days=None, notify=False)[0]
+    assert db.get(models.User, result["user_id"]).subscription_expiry is None
+
+
+# --- Subscription updates ---
+
+def test_extend_by_ids_reports_per_user(db, make_user):
+    admin, active, expired, unlimited = make_user("a@x.com", is_admin=True), make_user("b@x.com", days=5), make_user("c@x.com", days=-5), make_user("d@x.com")
+    unlimited.subscription_expiry = None; db.commit()
+    previous = expiry(db, active)
+
+    result = crud.bulk_update_subscriptions(db, "extend", days=10, user_ids=[admin.id, active.id, expired.id, unlimited.id, 999])
+    assert {k: v for k, v in result.items() if k != "results"} == {"updated": 2, "skipped_admin": 1, "skipped_unlimited": 1, "not_found": 1}
+    assert {r["user_id"]: r["status"] for r in result["results"]} == {
+        admin.id: "skipped_admin", active.id: "updated", expired.id: "updated", unlimited.id: "skipped_unlimited", 999: "not_found",
+    }
+    # From the current expiry while it lies ahead, from now once it has passed
+    assert abs(expiry(db, active) - (previous + datetime.timedelta(days=10))) < datetime.timedelta(seconds=1)
+    assert datetime.timedelta(days=9) < expiry(db, expired) - datetime.datetime.now() <= datetime.timedelta(days=10)
+    assert expiry(db, unlimited) is None
+
+def test_filter_update_pages_and_returns_counts_only(db, make_user, monkeypatch):
+    monkeypatch.setattr(crud, "SUBSCRIPTION_UPDATE_PAGE", 2)
+    make_user("admin@x.com", is_admin=True)
+    users = [make_user(f"user{i}@x.com", days=-1) for i in range(5)]
+    result = crud.bulk_update_subscriptions(db, "extend", days=30, subscription="expired")
+    assert result == {"updated": 5, "skipped_admin": 0, "skipped_unlimited": 0, "not_found": 0, "results": None}
+    # Updated users no longer match "expired"; keyset paging must not skip the ones after them
+    assert all(expiry(db, user) > datetime.datetime.now() for user in users)
+
+def test_failure_on_a_later_page_changes_nobody(db, make_user, monkeypatch):
+    monkeypatch.setattr(crud, "SUBSCRIPTION_UPDATE_PAGE", 2)
+    users = [make_user(f"user{i}@x.com") for i in range(5)]
+    before = [expiry(db, user) for user in users]
+    updates = []
+    def fail_second_update(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("UPDATE"):
+            updates.append(statement)
+            if len(updates) == 2: raise RuntimeError("database went away")
+    event.listen(engine, "before_cursor_execute", fail_second_update)
+    try:
+        with pytest.raises(RuntimeError): crud.bulk_update_subscriptions(db, "expire", email_prefix="user")
+    finally:
+        event.remove(engine, "before_cursor_execute", fail_second_update)
+    db.rollback()
+    assert [expiry(db, user) for user in users] == before
+
+def test_all_users_expire_skips_admins(db, make_user, monkeypatch):
+    monkeypatch.setattr(crud, "SUBSCRIPTION_UPDATE_PAGE", 2)
+    admin = make_user("admin@x.com", is_admin=True)
+    users = [make_user(f"user{i}@x.com") for i in range(3)]
+    result = crud.bulk_update_subscriptions(db, "expire")
+    assert (result["updated"], result["skipped_admin"], result["results"]) == (3, 1, None)
+    assert all(expiry(db, user) <= datetime.datetime.now() for user in users)
+    assert expiry(db, admin) > datetime.datetime.now()
+
+def test_subscription_endpoint(client, auth, make_user):
+    make_user("admin@x.com", is_admin=True); user = make_user("user@x.com")
+    headers = auth("admin@x.com")
+    assert client.post("/admin/users/subscriptions", json={"action": "expire"}, headers=headers).status_code == 400
+    response = client.post("/admin/users/subscriptions", json={"action": "set", "expiry": "2030-01-01T00:00:00", "email_prefix": "user"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"updated": 1, "skipped_admin": 0, "skipped_unlimited": 0, "not_found": 0, "results": None}
+    response = client.post("/admin/users/subscriptions", json={"action": "extend", "days": 1, "user_ids": [user.id]}, headers=headers)
+    assert [r["status"] for r in response.json()["results"]] == ["updated"]
+    assert response.json()["results"][0]["subscription_expiry"].startswith("2030-01-02")
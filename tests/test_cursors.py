@@ -0,0 +1,115 @@
+import pytest
+import crud
+
+
+def walk(client, headers, **params):
+    """Every page of GET /simulations/, following X-Next-Cursor. Returns the rows and the page count."""
+    rows, pages, cursor = [], 0, None
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/simulations/", params=query, headers=headers)
+        assert response.status_code == 200, response.text
+        rows += response.json(); pages += 1
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor: return rows, pages
+
+
+def test_cursor_round_trip():
+    for values, kinds in (([42], [int]), ([812.5, 7], [float, int]), ([812, 7], [float, int]), (["a@x.com"], [str])):
+        cursor = crud.encode_cursor(values)
+        assert "=" not in cursor
+        assert crud.decode_cursor(cursor, *kinds) == values
+
+@pytest.mark.parametrize("cursor", ["not base64 !", crud.encode_cursor([]), "eyJhIjogMX0", crud.encode_cursor([1, 2])])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        crud.decode_cursor(cursor, int)
+
+@pytest.mark.parametrize("values", [[None], [{}], ["7"], [True], [1.5], [2 ** 70]])
+def test_cursor_of_the_wrong_type_is_rejected(values):
+    with pytest.raises(ValueError):
+        crud.decode_cursor(crud.encode_cursor(values), int)
+
+@pytest.mark.parametrize("values", [[None, 1], ["x", 1], [1.0, 1.5], [10 ** 30, 1]])
+def test_metric_cursor_of_the_wrong_type_is_rejected(values):
+    with pytest.raises(ValueError):
+        crud.decode_cursor(crud.encode_cursor(values), float, int)
+
+def test_pages_by_id(client, auth, make_user, make_simulation):
+    owner, other = make_user("owner@x.com"), make_user("other@x.com")
+    ids = [make_simulation(owner).id for _ in range(7)]
+    make_simulation(other)
+    headers = auth("owner@x.com")
+
+    rows, pages = walk(client, headers, limit=3, fields="id,name")
+    assert [r["id"] for r in rows] == ids and pages == 3
+    assert set(rows[0]) == {"id", "name"}
+    rows, _ = walk(client, headers, limit=3, order_by="-id")
+    assert [r["id"] for r in rows] == ids[::-1]
+
+def test_pages_by_metric_with_ties(client, auth, make_user, make_simulation):
+    owner = make_user("owner@x.com")
+    temps = [700.0, 650.0, 700.0, None, 800.0, 650.0, 700.0]
+    sims = [make_simulation(owner, max_temp_C=t) for t in temps]
+    headers = auth("owner@x.com")
+
+    # Ties on the metric are broken by id, so no row is repeated or skipped at a page edge
+    expected = sorted((s for s in sims if s.max_temp_C is not None), key=lambda s: (s.max_temp_C, s.id))
+    rows, _ = walk(client, headers, limit=2, order_by="max_temp_C", fields="id,max_temp_C")
+    assert [r["id"] for r in rows] == [s.id for s in expected]
+    rows, _ = walk(client, headers, limit=2, order_by="-max_temp_C", fields="id,max_temp_C")
+    assert [r["id"] for r in rows] == [s.id for s in sorted(expected, key=lambda s: (-s.max_temp_C, -s.id))]
+    rows, _ = walk(client, headers, limit=2, order_by="max_temp_C", min_max_temp_C=690, fields="id")
+    assert [r["id"] for r in rows] == [s.id for s in expected if s.max_temp_C >= 690]
+
+def test_bad_cursor_and_order_are_400(client, auth, make_user, make_simulation):
+    owner = make_user("owner@x.com")
+    for _ in range(3): make_simulation(owner, max_temp_C=500.0)
+    headers = auth("owner@x.com")
+    id_cursor = client.get("/simulations/", params={"limit": 1}, headers=headers).headers["x-next-cursor"]
+    assert client.get("/simulations/", params={"cursor": "garbage!"}, headers=headers).status_code == 400
+    assert client.get("/simulations/", params={"order_by": "max_temp_C", "cursor": id_cursor}, headers=headers).status_code == 400
+    assert client.get("/simulations/", params={"order_by": "name"}, headers=headers).status_code == 400
+    # Crafted cursors of the right shape but the wrong types
+    for values in ([None], [{}], [2 ** 70]):
+        assert client.get("/simulations/", params={"cursor": crud.encode_cursor(values)}, headers=headers).status_code == 400
+    make_user("admin@x.com", is_admin=True)
+    assert client.get("/admin/overview", params={"cursor": crud.encode_cursor([5])}, headers=auth("admin@x.com")).status_code == 400
+
+
+def test_nested_simulations_load_in_one_query(client, auth, make_user, make_simulation):
+    from sqlalchemy import event
+    from database import engine
+    owner = make_user("owner@x.com")
+    headers = auth("owner@x.com")
+    def count_selects(path):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try: body = client.get(path, headers=headers).json()
+        finally: event.remove(engine, "before_cursor_execute", listener)
+        return body, len(statements)
+
+    make_simulation(owner, results='{"a": 1}', material_properties='{"density": 1}')
+    _, one = count_selects("/users/me/")
+    for _ in range(4): make_simulation(owner, results='{"a": 1}')
+    body, five = count_selects("/users/me/")
+    assert len(body["simulations"]) == 5 and body["simulations"][0]["results"] == '{"a": 1}'
+    assert body["simulations"][0]["material_properties"] == '{"density": 1}'
+    assert five == one
+
+
+
+@pytest.mark.parametrize("order_by", ["life_hours", "max_temp_C", "max_stress_MPa", "wear_microns"])
+def test_metric_pages_use_the_owner_index(db, order_by):
+    from sqlalchemy import event
+    bind = db.get_bind()
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+    event.listen(bind, "before_cursor_execute", listener)
+    try: crud.get_simulations_page(db, 1, [], limit=10, cursor=crud.encode_cursor([1.5, 3]), order_by=order_by)
+    finally: event.remove(bind, "before_cursor_execute", listener)
+    statement, parameters = statements[-1]
+    with bind.connect() as conn:
+        plan = " ".join(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+    assert f"ix_simulations_owner_{order_by.lower()}_id" in plan
@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+import database
+
+
+@pytest.mark.parametrize("url", ["sqlite://", "sqlite:///:memory:", "sqlite+pysqlite://"])
+def test_in_memory_sqlite_gets_no_pool_sizing(url):
+    kwargs = database._engine_kwargs(url)
+    assert "pool_size" not in kwargs and "max_overflow" not in kwargs
+    engine = create_engine(url, **kwargs)
+    with engine.connect() as conn: assert conn.execute(text("SELECT 1")).scalar() == 1
+    engine.dispose()
+    create_async_engine(database._async_url(url), **database._engine_kwargs(database._async_url(url))).sync_engine.dispose()
+
+@pytest.mark.parametrize("url", ["sqlite:///./edgepredict.db", "postgresql://user@host/edgepredict", "postgresql://user@host"])
+def test_server_and_file_databases_get_pool_sizing(url):
+    kwargs = database._engine_kwargs(url)
+    assert kwargs["pool_size"] == database.DB_POOL_SIZE and kwargs["max_overflow"] == database.DB_MAX_OVERFLOW
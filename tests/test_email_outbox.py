@@ -0,0 +1,122 @@
+import smtplib
+import pytest
+import email_outbox, email_service, models
+from email_outbox import FAILED, PENDING, SENT
+from smtp_stub import SMTPStub
+
+
+class FakeConnection:
+    """Stands in for SMTPConnection: raises the error mapped to a recipient, records the rest."""
+
+    def __init__(self, errors=None):
+        self.errors, self.sent, self.closed = errors or {}, [], 0
+
+    def send(self, message):
+        error = self.errors.get(message["To"])
+        if error is not None: raise error
+        self.sent.append(message["To"])
+
+    def close(self):
+        self.closed += 1
+
+
+def queue(db, *recipients):
+    return email_outbox.enqueue(db, "test", recipients, "Subject", "<p>body</p>")
+
+def statuses(db):
+    db.expire_all()
+    return {row.recipient: (row.status, row.attempts) for row in db.query(models.EmailOutbox)}
+
+
+def test_all_rows_sent(db):
+    queue(db, "a@x.com", "b@x.com")
+    connection = FakeConnection()
+    assert email_outbox.deliver_batch(db, connection) == 2
+    assert statuses(db) == {"a@x.com": (SENT, 1), "b@x.com": (SENT, 1)}
+    assert connection.closed == 0
+
+def test_unbuildable_row_fails_alone(db):
+    rows = queue(db, "a@x.com", "b@x.com", "c@x.com")
+    rows[1].subject = "broken\r\nBcc: everyone@x.com"  # written around enqueue, which would flatten it
+    db.commit()
+    connection = FakeConnection()
+    assert email_outbox.deliver_batch(db, connection) == 2
+    assert statuses(db) == {"a@x.com": (SENT, 1), "b@x.com": (FAILED, 1), "c@x.com": (SENT, 1)}
+    assert connection.closed == 0
+
+def test_connection_error_hands_back_the_batch(db):
+    queue(db, "a@x.com", "b@x.com", "c@x.com")
+    connection = FakeConnection({"b@x.com": smtplib.SMTPServerDisconnected("gone")})
+    assert email_outbox.deliver_batch(db, connection) == 1
+    assert statuses(db) == {"a@x.com": (SENT, 1), "b@x.com": (PENDING, 1), "c@x.com": (PENDING, 0)}
+    assert connection.closed == 1
+    db.expire_all()
+    assert all(row.claim_token is None for row in db.query(models.EmailOutbox))
+
+def test_temporary_refusal_retries_only_that_row(db):
+    queue(db, "a@x.com", "b@x.com", "c@x.com")
+    connection = FakeConnection({"b@x.com": smtplib.SMTPDataError(451, b"try later")})
+    assert email_outbox.deliver_batch(db, connection) == 2
+    assert statuses(db) == {"a@x.com": (SENT, 1), "b@x.com": (PENDING, 1), "c@x.com": (SENT, 1)}
+    assert connection.closed == 0
+    # Not due again until the retry delay has passed
+    assert email_outbox.claim_batch(db) == []
+
+def test_permanent_refusal_fails(db):
+    queue(db, "a@x.com", "b@x.com")
+    refused = smtplib.SMTPRecipientsRefused({"a@x.com": (550, b"no such user")})
+    assert email_outbox.deliver_batch(db, FakeConnection({"a@x.com": refused})) == 1
+    assert statuses(db) == {"a@x.com": (FAILED, 1), "b@x.com": (SENT, 1)}
+
+def test_gives_up_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_MAX_ATTEMPTS", 2)
+    rows = queue(db, "a@x.com")
+    rows[0].attempts = 1
+    db.commit()
+    email_outbox.deliver_batch(db, FakeConnection({"a@x.com": smtplib.SMTPDataError(451, b"try later")}))
+    assert statuses(db) == {"a@x.com": (FAILED, 2)}
+
+@pytest.mark.parametrize("error, connection_level", [
+    (smtplib.SMTPServerDisconnected("gone"), True),
+    (TimeoutError("timed out"), True),
+    (smtplib.SMTPAuthenticationError(535, b"bad login"), True),
+    (smtplib.SMTPDataError(451, b"later"), False),
+    (smtplib.SMTPSenderRefused(550, b"no", "noreply@x.com"), False),
+    (UnicodeEncodeError("ascii", "é", 0, 1, "bad"), False),
+])
+def test_connection_error_classification(error, connection_level):
+    assert email_outbox._connection_error(error) is connection_level
+
+def test_smtp_stub_temporary_failure_is_retried(db, monkeypatch):
+    with SMTPStub(port=0, fail_first=1) as stub:
+        monkeypatch.setattr(email_outbox, "MAIL_SERVER", stub.host)
+        monkeypatch.setattr(email_outbox, "MAIL_PORT", stub.port)
+        monkeypatch.setattr(email_outbox, "MAIL_STARTTLS", False)
+        monkeypatch.setattr(email_outbox, "MAIL_USERNAME", None)
+        monkeypatch.setattr(email_outbox, "EMAIL_RETRY_BASE_SECONDS", 0)
+        queue(db, "a@x.com", "b@x.com")
+        connection = email_outbox.SMTPConnection()
+        assert email_outbox.deliver_batch(db, connection) == 1
+        assert email_outbox.deliver_batch(db, connection) == 1
+        connection.close()
+        assert sorted(m["to"][0] for m in stub.messages) == ["a@x.com", "b@x.com"]
+        assert stub.connections == 1
+
+
+def test_enqueue_flattens_subject(db):
+    row = email_outbox.enqueue(db, "test", ["a@x.com"], "Hello\r\nBcc: x@y.com", "<p></p>")[0]
+    assert row.subject == "Hello Bcc: x@y.com"
+    email_outbox.build_message(row)
+
+def test_access_request_fields_are_escaped(db):
+    request = models.AccessRequest(email="evil@x.com", name='<a href="http://x">Eve</a>\r\nX', company="<b>Acme</b>")
+    db.add(request); db.commit()
+    email_service.ACCESS_REQUEST_NOTIFY.append("admin@x.com")
+    try:
+        row = email_service.notify_access_request(db, request)[0]
+    finally:
+        email_service.ACCESS_REQUEST_NOTIFY.remove("admin@x.com")
+    assert "http://x\">Eve" not in row.body and "&lt;a href=&quot;http://x&quot;&gt;Eve" in row.body
+    assert "<b>Acme</b>" not in row.body
+    assert "\n" not in row.subject and "\r" not in row.subject
+    email_outbox.build_message(row)
@@ -0,0 +1,95 @@
+import pytest
+import engine_logs
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    # Small files so a few hundred lines rotate several times
+    monkeypatch.setattr(engine_logs, "ENGINE_LOG_MAX_BYTES", 1000)
+    monkeypatch.setattr(engine_logs, "ENGINE_LOG_BACKUPS", 2)
+    return str(tmp_path)
+
+class Writer:
+    def __init__(self, run_dir):
+        self.log, self.count = engine_logs.open_log(run_dir), 0
+
+    def write(self, n: int) -> None:
+        for _ in range(n):
+            engine_logs.write_line(self.log, f"line-{self.count:05d}")
+            self.count += 1
+
+def lines(data: bytes) -> list[str]:
+    return data.decode().splitlines()
+
+def drain(run_dir, position, limit=1024 * 1024):
+    out = []
+    while True:
+        data, position = engine_logs.read_new(run_dir, position, limit)
+        if not data: return out, position
+        out += lines(data)
+
+def expected(start: int, stop: int) -> list[str]:
+    return [f"line-{i:05d}" for i in range(start, stop)]
+
+
+def test_reads_appended_lines(run_dir):
+    writer = Writer(run_dir)
+    writer.write(5)
+    text, position = engine_logs.tail(run_dir, 3)
+    assert lines(text.encode()) == expected(2, 5)
+    writer.write(4)
+    data, position = engine_logs.read_new(run_dir, position)
+    assert lines(data) == expected(5, 9)
+    assert engine_logs.read_new(run_dir, position) == (b"", position)
+
+def test_partial_line_is_held_back(run_dir):
+    writer = Writer(run_dir)
+    writer.write(2)
+    _, position = engine_logs.tail(run_dir, 10)
+    with open(engine_logs.log_path(run_dir), "ab") as f: f.write(b"half a li")
+    assert engine_logs.read_new(run_dir, position) == (b"", position)
+    with open(engine_logs.log_path(run_dir), "ab") as f: f.write(b"ne\n")
+    assert engine_logs.read_new(run_dir, position)[0] == b"half a line\n"
+
+def test_rotation_with_new_file_larger_than_offset(run_dir):
+    # The old size-only check missed this: the new engine.log already exceeds the old offset
+    writer = Writer(run_dir)
+    writer.write(20)
+    _, position = engine_logs.tail(run_dir, 1)
+    writer.write(100)  # rotates once; the new current file is larger than `position`'s offset
+    out, _ = drain(run_dir, position)
+    assert out == expected(20, 120)
+
+def test_rotated_remainder_larger_than_limit_is_not_lost(run_dir):
+    writer = Writer(run_dir)
+    writer.write(1)
+    _, position = engine_logs.tail(run_dir, 1)
+    writer.write(85)  # fills engine.log, rotates, continues in a new one
+    out, _ = drain(run_dir, position, limit=100)
+    assert out == expected(1, 86)
+
+def test_several_rotations_between_reads(run_dir):
+    writer = Writer(run_dir)
+    writer.write(10)
+    _, position = engine_logs.tail(run_dir, 1)
+    writer.write(120)  # our file is now engine.log.2
+    out, _ = drain(run_dir, position)
+    assert out == expected(10, 130)
+
+def test_rotated_past_the_backups_starts_at_the_oldest_file(run_dir):
+    writer = Writer(run_dir)
+    writer.write(10)
+    _, position = engine_logs.tail(run_dir, 1)
+    writer.write(400)
+    out, _ = drain(run_dir, position)
+    oldest = int(out[0].split("-")[1])
+    assert oldest > 10 and out == expected(oldest, 410)
+
+def test_no_log_yet(run_dir):
+    text, position = engine_logs.tail(run_dir, 10)
+    assert text == "" and position == (None, 0)
+    assert engine_logs.read_new(run_dir, position) == (b"", position)
+    writer = Writer(run_dir)
+    writer.write(3)
+    out, _ = drain(run_dir, position)
+    assert out == expected(0, 3)
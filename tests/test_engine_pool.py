@@ -0,0 +1,102 @@
+import json, os, subprocess, sys, threading
+import pytest
+import engine_pool
+
+FAKE_ENGINE = f"{sys.executable} {os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fake_engine.py')}"
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """A pool of fake-engine processes; `pool.started` lists every slot it created."""
+    monkeypatch.setenv("FAKE_ENGINE_STEPS", "20")
+    monkeypatch.setenv("FAKE_ENGINE_DELAY", "0")
+    pools = []
+    def make(size=1, max_jobs=50):
+        started = []
+        def factory():
+            slot = engine_pool.LocalProcessSlot(FAKE_ENGINE)
+            started.append(slot); return slot
+        p = engine_pool.EnginePool(factory, size=size, max_jobs=max_jobs)
+        p.started = started; pools.append(p)
+        return p
+    yield make
+    for p in pools: p.shutdown()
+
+@pytest.fixture
+def run_dir(tmp_path):
+    count = iter(range(1000))
+    def make():
+        path = tmp_path / f"sim_{next(count)}"
+        path.mkdir()
+        (path / "input.json").write_text(json.dumps({"simulation_parameters": {"cutting_speed_m_min": 100}, "file_paths": {"output_results": "output.json"}}))
+        return str(path)
+    return make
+
+
+def test_slot_is_reused(pool, run_dir):
+    p = pool()
+    dirs = [run_dir() for _ in range(3)]
+    results = [p.run(d, timeout=30) for d in dirs]
+    assert [r.returncode for r in results] == [0, 0, 0]
+    assert all(os.path.exists(os.path.join(d, "output.json")) for d in dirs)
+    assert len(p.started) == 1 and p.started[0].jobs == 3 and p.started[0].healthy()
+
+def test_slot_is_recycled_after_max_jobs(pool, run_dir):
+    p = pool(max_jobs=2)
+    for _ in range(3): assert p.run(run_dir(), timeout=30).returncode == 0
+    assert len(p.started) == 2
+    first, second = p.started
+    assert first.jobs == 2 and not first.healthy()
+    assert second.jobs == 1 and second.healthy()
+
+def test_crashed_slot_is_replaced(pool, run_dir):
+    p = pool()
+    assert p.run(run_dir(), timeout=30).returncode == 0
+    p.started[0].process.kill(); p.started[0].process.wait()
+    assert p.run(run_dir(), timeout=30).returncode == 0
+    assert len(p.started) == 2
+
+def test_engine_crash_during_a_job_is_reported(pool, run_dir, monkeypatch):
+    monkeypatch.setenv("FAKE_ENGINE_DELAY", "0.2")
+    p = pool()
+    p.run(run_dir(), timeout=30)
+    crash = threading.Timer(0.3, p.started[0].process.kill); crash.start()
+    result = p.run(run_dir(), timeout=30)
+    crash.join()
+    assert result.returncode != 0 and "exited" in result.stderr
+    monkeypatch.setenv("FAKE_ENGINE_DELAY", "0")
+    assert p.run(run_dir(), timeout=30).returncode == 0
+    assert len(p.started) == 2
+
+def test_timeout_kills_the_slot_and_the_pool_recovers(pool, run_dir, monkeypatch):
+    monkeypatch.setenv("FAKE_ENGINE_DELAY", "1")
+    p = pool()
+    with pytest.raises(subprocess.TimeoutExpired):
+        p.run(run_dir(), timeout=0.5)
+    slow = p.started[0]
+    slow.process.wait(5)
+    assert not slow.healthy()
+    monkeypatch.setenv("FAKE_ENGINE_DELAY", "0")
+    assert p.run(run_dir(), timeout=30).returncode == 0
+    assert len(p.started) == 2
+
+def test_failed_start_keeps_the_pool_usable(run_dir):
+    attempts = []
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1: raise RuntimeError("engine image missing")
+        return engine_pool.LocalProcessSlot(FAKE_ENGINE)
+    p = engine_pool.EnginePool(factory, size=1)
+    try:
+        with pytest.raises(RuntimeError): p.run(run_dir(), timeout=30)
+        assert p.run(run_dir(), timeout=30).returncode == 0
+    finally:
+        p.shutdown()
+
+def test_engine_failure_is_returned_not_raised(pool, run_dir, monkeypatch):
+    monkeypatch.setenv("FAKE_ENGINE_FAIL", "1")
+    p = pool()
+    result = p.run(run_dir(), timeout=30)
+    assert result.returncode == 1 and "failing on request" in result.stderr
+    # A failed job leaves the engine process usable
+    assert p.started[0].healthy()
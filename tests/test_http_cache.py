@@ -0,0 +1,62 @@
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+import http_cache
+
+BIG = [{"id": i, "name": f"item {i}"} for i in range(200)]
+
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+    app.add_middleware(http_cache.CompressionMiddleware)
+
+    @app.get("/big")
+    def big(request: Request):
+        return http_cache.json_response(request, BIG)
+
+    @app.get("/small")
+    def small(request: Request):
+        return http_cache.json_response(request, {"ok": True})
+
+    @app.get("/row")
+    def row(request: Request):
+        # Like GET /simulations/{id}: the 304 is decided before the body exists
+        etag = http_cache.make_etag("row", 1)
+        if http_cache.not_modified(request, etag): return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=b'{"value": "' + b"x" * 4096 + b'"}', media_type="application/json", headers={"ETag": etag})
+
+    return TestClient(app)
+
+def get(client, path, encoding, etag=None):
+    headers = {"Accept-Encoding": encoding}
+    if etag: headers["If-None-Match"] = etag
+    return client.get(path, headers=headers)
+
+
+@pytest.mark.parametrize("path", ["/big", "/row"])
+def test_not_modified_repeats_the_compressed_etag(app_client, path):
+    first = get(app_client, path, "gzip")
+    assert first.headers["content-encoding"] == "gzip" and first.headers["etag"].endswith('-gzip"')
+    again = get(app_client, path, "gzip", first.headers["etag"])
+    assert again.status_code == 304
+    assert again.headers["etag"] == first.headers["etag"]
+    assert "accept-encoding" in again.headers["vary"].lower()
+
+def test_not_modified_follows_this_requests_encoding(app_client):
+    compressed = get(app_client, "/big", "gzip").headers["etag"]
+    plain = get(app_client, "/big", "identity")
+    assert "content-encoding" not in plain.headers
+    # A client holding the gzip copy that no longer accepts gzip gets the identity validator
+    again = get(app_client, "/big", "identity", compressed)
+    assert again.status_code == 304 and again.headers["etag"] == plain.headers["etag"]
+
+def test_uncompressed_etag_is_left_alone(app_client):
+    first = get(app_client, "/small", "gzip")
+    assert "content-encoding" not in first.headers and not first.headers["etag"].endswith('-gzip"')
+    again = get(app_client, "/small", "gzip", first.headers["etag"])
+    assert again.status_code == 304 and again.headers["etag"] == first.headers["etag"]
+
+def test_changed_content_is_sent_again(app_client):
+    response = get(app_client, "/big", "gzip", '"0000-gzip"')
+    assert response.status_code == 200 and response.json() == BIG
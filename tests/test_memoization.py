@@ -0,0 +1,113 @@
+import os
+import memoization, models, results_store
+
+
+INPUT = {"material": "Ti-6Al-4V", "cutting_speed": 120, "file_paths": {"tool": "a.stl"}}
+
+def finished(make_simulation, owner, fingerprint, **columns):
+    sim = make_simulation(owner, input_fingerprint=fingerprint, **columns)
+    results_store.save_results(sim, {"tool_life_prediction": {"predicted_hours": 2.0},
+                                     "time_series_data": [{"time_s": i * 0.1, "max_temperature_C": 20.0 + i} for i in range(10)]})
+    return sim
+
+
+def test_fingerprint_ignores_file_names_and_key_order():
+    base = memoization.input_fingerprint(INPUT, "toolhash", "engine:1")
+    reordered = {"file_paths": {"tool": "b.stl"}, "cutting_speed": 120, "material": "Ti-6Al-4V"}
+    assert memoization.input_fingerprint(reordered, "toolhash", "engine:1") == base
+
+def test_fingerprint_covers_parameters_tool_and_engine():
+    base = memoization.input_fingerprint(INPUT, "toolhash", "engine:1")
+    assert memoization.input_fingerprint({**INPUT, "cutting_speed": 121}, "toolhash", "engine:1") != base
+    assert memoization.input_fingerprint(INPUT, "otherhash", "engine:1") != base
+    assert memoization.input_fingerprint(INPUT, "toolhash", "engine:2") != base
+
+def test_find_reusable_prefers_completed_runs_of_the_same_owner(db, make_user, make_simulation):
+    alice, bob = make_user("alice@x.com"), make_user("bob@x.com")
+    done = finished(make_simulation, alice, "fp")
+    make_simulation(alice, input_fingerprint="fp", status="RUNNING")
+    assert memoization.find_reusable(db, "fp", alice.id).id == done.id
+    assert memoization.find_reusable(db, "fp", bob.id) is None
+    assert memoization.find_reusable(db, "other", alice.id) is None
+
+def test_find_reusable_skips_completed_runs_whose_results_are_gone(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    done = finished(make_simulation, alice, "fp")
+    db.commit()
+    os.remove(done.timeseries_path)
+    assert memoization.find_reusable(db, "fp", alice.id) is None
+
+def test_find_reusable_joins_only_runs_that_execute(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    running = make_simulation(alice, input_fingerprint="fp", status="RUNNING")
+    make_simulation(alice, input_fingerprint="fp", status="PENDING", reused_from_id=running.id)
+    assert memoization.find_reusable(db, "fp", alice.id).id == running.id
+    assert memoization.find_reusable(db, "fp", alice.id, exclude_id=running.id) is None
+
+def test_adopt_completed_run_links_results(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    source = finished(make_simulation, alice, "fp")
+    db.commit()
+    copy = make_simulation(alice, input_fingerprint="fp", status="PENDING")
+    memoization.adopt(copy, source)
+    db.commit()
+    assert copy.status == "COMPLETED" and copy.reused_from_id == source.id
+    assert os.path.samefile(copy.timeseries_path, source.timeseries_path)
+    assert results_store.load_results(copy) == results_store.load_results(source)
+
+def test_finish_and_fail_joined(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    source = finished(make_simulation, alice, "fp", status="RUNNING")
+    joined = make_simulation(alice, input_fingerprint="fp", status="RUNNING", reused_from_id=source.id)
+    source.status = "COMPLETED"; db.commit()
+    assert [s.id for s in memoization.finish_joined(db, source)] == [joined.id]
+    assert joined.status == "COMPLETED" and joined.timeseries_points == source.timeseries_points
+
+    waiting = make_simulation(alice, input_fingerprint="fp", status="PENDING", reused_from_id=source.id)
+    assert [s.id for s in memoization.fail_joined(db, source.id, "gone")] == [waiting.id]
+    assert waiting.status == "FAILED"
+
+def test_detached_copies_fall_back_to_their_own_id(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    source = finished(make_simulation, alice, "fp")
+    copy = make_simulation(alice, input_fingerprint="fp", reused_from_id=source.id)
+    assert memoization.run_source_id(db, copy) == source.id
+    assert memoization.detach_copies(db, source.id) == 1
+    db.refresh(copy)
+    assert copy.reused_from_id is None and memoization.run_source_id(db, copy) == copy.id
+
+def test_dangling_or_reused_source_id_falls_back(db, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    copy = make_simulation(alice, input_fingerprint="fp", reused_from_id=999)
+    assert memoization.run_source_id(db, copy) == copy.id
+    # An unrelated run that took over the id (SQLite rowid reuse)
+    other = make_simulation(alice, input_fingerprint="different")
+    copy.reused_from_id = other.id; db.commit()
+    assert memoization.run_source_id(db, copy) == copy.id
+
+def test_deleting_a_reused_source_keeps_its_copies(db, client, auth, make_user, make_simulation):
+    alice = make_user("alice@x.com")
+    source = finished(make_simulation, alice, "fp")
+    copy = make_simulation(alice, input_fingerprint="fp")
+    memoization.adopt(copy, source); db.commit()
+    headers = auth("alice@x.com")
+    assert client.delete(f"/simulations/{source.id}", headers=headers).status_code == 204
+    db.expire_all()
+    copy = db.get(models.Simulation, copy.id)
+    assert copy.reused_from_id is None
+    body = client.get(f"/simulations/{copy.id}?results_format=object", headers=headers).json()
+    assert body["status"] == "COMPLETED" and len(body["results"]["time_series_data"]) == 10
+    assert client.get(f"/simulations/{copy.id}/artifacts", headers=headers).status_code == 404
+
+def test_failed_submission_fails_its_joiners(db, make_user, make_simulation, monkeypatch):
+    import main, progress_bus
+    published = []
+    monkeypatch.setattr(progress_bus, "publish", lambda sim_id, owner_id, status, progress=None: published.append((sim_id, status)))
+    alice = make_user("alice@x.com")
+    source = make_simulation(alice, input_fingerprint="fp", status="PENDING")
+    joined = make_simulation(alice, input_fingerprint="fp", status="PENDING", reused_from_id=source.id)
+    main._mark_failed(db, source.id, alice.id, "staging failed")
+    db.expire_all()
+    assert db.get(models.Simulation, joined.id).status == "FAILED"
+    assert "staging failed" in db.get(models.Simulation, joined.id).results
+    assert published == [(source.id, "FAILED"), (joined.id, "FAILED")]
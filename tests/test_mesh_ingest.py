@@ -0,0 +1,44 @@
+import struct
+import numpy as np
+import pytest
+import mesh_ingest
+
+# Unit cube, outward-facing triangles
+CUBE_FACES = [
+    (0, 2, 1), (0, 3, 2), (4, 5, 6), (4, 6, 7), (0, 1, 5), (0, 5, 4),
+    (1, 2, 6), (1, 6, 5), (2, 3, 7), (2, 7, 6), (3, 0, 4), (3, 4, 7),
+]
+CUBE_CORNERS = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0), (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)]
+
+def cube(signed_zero_faces=()):
+    triangles = np.array([[CUBE_CORNERS[i] for i in face] for face in CUBE_FACES], dtype=np.float32)
+    # Some exporters write the same corner as -0.0 in one facet and 0.0 in the next
+    for face in signed_zero_faces: triangles[face][triangles[face] == 0] = -0.0
+    return triangles
+
+def write_binary_stl(path, triangles):
+    with open(path, "wb") as f:
+        f.write(b"\0" * 80 + struct.pack("<I", len(triangles)))
+        for triangle in triangles:
+            f.write(struct.pack("<3f", 0, 0, 0) + triangle.astype("<f4").tobytes() + b"\0\0")
+
+
+def test_closed_cube():
+    info, vertices, faces = mesh_ingest.analyze(cube())
+    assert (info["vertex_count"], info["open_edges"], info["is_watertight"]) == (8, 0, True)
+    assert info["volume"] == pytest.approx(1.0) and info["surface_area"] == pytest.approx(6.0)
+
+def test_signed_zero_vertices_are_welded(tmp_path):
+    triangles = cube(signed_zero_faces=(0, 4, 11))
+    assert np.signbit(triangles).any()
+    info, _, _ = mesh_ingest.analyze(triangles)
+    assert (info["vertex_count"], info["open_edges"], info["is_watertight"]) == (8, 0, True)
+    path = tmp_path / "cube.stl"
+    write_binary_stl(path, triangles)
+    assert mesh_ingest.ingest(str(path))["is_watertight"]
+
+def test_open_mesh_is_rejected(tmp_path):
+    path = tmp_path / "open.stl"
+    write_binary_stl(path, cube()[:-1])
+    with pytest.raises(mesh_ingest.MeshError, match="not watertight"):
+        mesh_ingest.ingest(str(path))
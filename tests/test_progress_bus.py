@@ -0,0 +1,31 @@
+import json
+import progress_bus
+
+
+def test_watcher_never_publishes_terminal_status(tmp_path, monkeypatch):
+    published = []
+    monkeypatch.setattr(progress_bus, "publish", lambda sim_id, owner_id, status, progress=None: published.append((status, progress)))
+    progress_file = tmp_path / "progress.json"
+    watcher = progress_bus.ProgressWatcher(7, 1, str(progress_file))
+
+    progress_file.write_text(json.dumps({"status": "RUNNING", "progress_percentage": 40}))
+    watcher.poll()
+    progress_file.write_text(json.dumps({"status": "COMPLETED", "progress_percentage": 100, "step": 9}))
+    watcher._last_mtime = None  # same mtime granularity on fast filesystems
+    watcher.poll()
+
+    assert [status for status, _ in published] == ["RUNNING", "RUNNING"]
+    assert published[1][1] == {"engine_status": "COMPLETED", "progress_percentage": 100, "step": 9}
+    assert not progress_bus._is_final({"simulation_id": 7, "status": published[1][0]}, stop_after=7)
+
+def test_progress_fallback_reads_the_configured_runs_dir(db, client, auth, make_user, make_simulation, tmp_path, monkeypatch):
+    import run_lifecycle
+    monkeypatch.setattr(run_lifecycle, "RUNS_BASE_DIR", str(tmp_path / "runs"))
+    monkeypatch.setattr(progress_bus, "get_snapshot", lambda simulation_id: None)
+    alice = make_user("alice@x.com")
+    sim = make_simulation(alice, status="RUNNING")
+    run_dir = tmp_path / "runs" / f"sim_{sim.id}"
+    run_dir.mkdir(parents=True)
+    (run_dir / "progress.json").write_text(json.dumps({"status": "COMPLETED", "progress_percentage": 100}))
+    body = client.get(f"/simulations/{sim.id}/progress", headers=auth("alice@x.com")).json()
+    assert body == {"status": "RUNNING", "engine_status": "COMPLETED", "progress_percentage": 100}
@@ -0,0 +1,69 @@
+import datetime
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+import models, schema_upgrade
+
+# Schema of a database created before the time-series, reuse, queue, lifecycle, catalog and outbox columns
+LEGACY_SCHEMA = """
+CREATE TABLE access_requests (id INTEGER NOT NULL, email VARCHAR, name VARCHAR, company VARCHAR, status VARCHAR, request_date DATETIME, PRIMARY KEY (id));
+CREATE INDEX ix_access_requests_id ON access_requests (id);
+CREATE INDEX ix_access_requests_email ON access_requests (email);
+CREATE TABLE users (id INTEGER NOT NULL, email VARCHAR, hashed_password VARCHAR, salt VARCHAR, is_admin BOOLEAN, subscription_expiry DATETIME, PRIMARY KEY (id));
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE TABLE materials (id INTEGER NOT NULL, name VARCHAR, properties VARCHAR, owner_id INTEGER, PRIMARY KEY (id), FOREIGN KEY(owner_id) REFERENCES users (id));
+CREATE INDEX ix_materials_name ON materials (name);
+CREATE INDEX ix_materials_id ON materials (id);
+CREATE TABLE tools (id INTEGER NOT NULL, name VARCHAR, tool_type VARCHAR, file_path VARCHAR, owner_id INTEGER, PRIMARY KEY (id), UNIQUE (file_path), FOREIGN KEY(owner_id) REFERENCES users (id));
+CREATE INDEX ix_tools_id ON tools (id);
+CREATE INDEX ix_tools_name ON tools (name);
+CREATE TABLE simulations (id INTEGER NOT NULL, name VARCHAR, description VARCHAR, status VARCHAR, results VARCHAR, material_properties VARCHAR, owner_id INTEGER, tool_id INTEGER, PRIMARY KEY (id), FOREIGN KEY(owner_id) REFERENCES users (id), FOREIGN KEY(tool_id) REFERENCES tools (id));
+CREATE INDEX ix_simulations_id ON simulations (id);
+CREATE INDEX ix_simulations_name ON simulations (name);
+INSERT INTO users (id, email, is_admin) VALUES (1, 'old@x.com', 0);
+INSERT INTO tools (id, name, tool_type, file_path, owner_id) VALUES (1, 'drill', 'Other', 'tool_library_files/a.stl', 1);
+INSERT INTO simulations (id, name, description, status, results, owner_id, tool_id) VALUES (1, 'old', '', 'COMPLETED', '{"time_series_data": []}', 1, 1);
+INSERT INTO materials (id, name, properties, owner_id) VALUES (1, 'steel', '{"density": 7850}', 1);
+"""
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with engine.begin() as connection:
+        for statement in filter(str.strip, LEGACY_SCHEMA.split(";")): connection.execute(text(statement))
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_adds_missing_columns_indexes_and_tables(legacy_engine):
+    applied = schema_upgrade.upgrade(legacy_engine)
+    assert any("ADD COLUMN timeseries_path" in s for s in applied)
+    inspector = inspect(legacy_engine)
+    for table in models.Base.metadata.sorted_tables:
+        assert {c.name for c in table.columns} <= {c["name"] for c in inspector.get_columns(table.name)}, table.name
+        # Indexes limited to another dialect (ddl_if) are skipped
+        indexes = {i.name for i in table.indexes if i._ddl_if is None or i._ddl_if.dialect == "sqlite"}
+        assert indexes <= {i["name"] for i in inspector.get_indexes(table.name)}, table.name
+        assert "ix_users_email_pattern" not in {i["name"] for i in inspector.get_indexes("users")}
+
+def test_upgrade_is_idempotent(legacy_engine):
+    assert schema_upgrade.upgrade(legacy_engine)
+    assert schema_upgrade.upgrade(legacy_engine) == []
+
+def test_existing_rows_work_with_the_current_models(legacy_engine):
+    schema_upgrade.upgrade(legacy_engine)
+    db = sessionmaker(bind=legacy_engine)()
+    try:
+        sim = db.get(models.Simulation, 1)
+        assert sim.status == "COMPLETED" and sim.timeseries_path is None and sim.reused_from_id is None
+        sim.queued_at = datetime.datetime.now()
+        # Deduplicated tool files are shared, which the old unique constraint forbade
+        db.add(models.Tool(name="copy", tool_type="Other", file_path="tool_library_files/a.stl", owner_id=1))
+        db.add(models.EmailOutbox(kind="test", recipient="a@x.com", subject="s", body="b"))
+        db.commit()
+        assert db.query(models.Tool).filter_by(file_path="tool_library_files/a.stl").count() == 2
+        assert db.get(models.Material, 1).owner_id == 1
+        assert db.get(models.User, 1).email == "old@x.com"
+    finally:
+        db.close()
@@ -0,0 +1,43 @@
+import os
+import pytest
+import main, models, progress_bus
+
+
+@pytest.fixture
+def sweep_setup(db, client, auth, make_user, monkeypatch):
+    monkeypatch.setattr(progress_bus, "publish", lambda *args, **kwargs: None)
+    monkeypatch.setattr(progress_bus, "get_snapshots", lambda ids: {})
+    alice = make_user("alice@x.com")
+    tool = models.Tool(name="tool", tool_type="Other", file_path="tool.stl", owner_id=alice.id, content_hash="abc")
+    db.add(tool); db.commit()
+    # Two identical points: the second joins the first instead of running
+    payload = {"name": "sweep", "tool_id": tool.id, "grid": {"simulation_parameters.feed": [0.1, 0.1]}}
+    return client, auth("alice@x.com"), payload
+
+def statuses(db, sweep_id):
+    db.expire_all()
+    return [(s.status, s.reused_from_id is not None) for s in db.query(models.Simulation).filter(models.Simulation.sweep_id == sweep_id).order_by(models.Simulation.id)]
+
+
+def test_staging_failure_fails_the_joined_point(db, sweep_setup, monkeypatch):
+    client, headers, payload = sweep_setup
+    def fail(*args): raise RuntimeError("Tool copy failed: disk full")
+    monkeypatch.setattr(main, "_stage_run_dir", fail)
+    response = client.post("/sweeps/", json=payload, headers=headers)
+    assert response.status_code == 200
+    assert statuses(db, response.json()["id"]) == [("FAILED", False), ("FAILED", True)]
+    assert response.json()["status_counts"] == {"FAILED": 2}
+
+def test_enqueue_failure_removes_staged_dirs(db, sweep_setup, monkeypatch, tmp_path):
+    client, headers, payload = sweep_setup
+    staged = []
+    def stage(simulation_id, *args):
+        staged.append(str(tmp_path / f"sim_{simulation_id}")); os.makedirs(staged[-1]); return staged[-1]
+    class BrokenGroup:
+        def __init__(self, tasks): pass
+        def apply_async(self): raise ConnectionError("broker down")
+    monkeypatch.setattr(main, "_stage_run_dir", stage)
+    monkeypatch.setattr(main, "group", BrokenGroup)
+    response = client.post("/sweeps/", json=payload, headers=headers)
+    assert statuses(db, response.json()["id"]) == [("FAILED", False), ("FAILED", True)]
+    assert len(staged) == 1 and not os.path.exists(staged[0])
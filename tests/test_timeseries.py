@@ -0,0 +1,82 @@
+import math
+import numpy as np
+import pytest
+import results_store, timeseries
+
+N = 1000
+
+
+@pytest.fixture
+def run(db, client, auth, make_user, make_simulation):
+    """A completed run with N samples at time_s = 0..N-1; temperature has a gap of NaNs."""
+    owner = make_user("owner@x.com")
+    records = [{"time_s": float(i), "max_temperature_C": None if 400 <= i < 410 else 20.0 + math.sin(i / 20) * 100, "wear": i * 0.01}
+               for i in range(N)]
+    sim = make_simulation(owner)
+    results_store.save_results(sim, {"time_series_data": records})
+    db.commit()
+    headers = auth("owner@x.com")
+    return lambda **params: client.get(f"/simulations/{sim.id}/timeseries", params=params, headers=headers)
+
+
+def test_window_bounds_are_inclusive(run):
+    body = run(start=200, end=300, max_points=1000).json()
+    assert body["total_points"] == N and body["window_points"] == 101
+    assert body["time"][0] == 200.0 and body["time"][-1] == 300.0
+    assert run(start=N + 5).json()["window_points"] == 0
+    assert run(end=-1).json()["window_points"] == 0
+
+def test_window_helper():
+    t = np.array([0.0, 1.0, 1.0, 2.0, 3.0])
+    assert t[timeseries.window(t, 1.0, 2.0)].tolist() == [1.0, 1.0, 2.0]
+    assert timeseries.window(t, 2.5, 1.0) == slice(4, 4)
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+@pytest.mark.parametrize("fields", ["wear", "max_temperature_C,wear"])
+def test_point_budget(run, method, fields):
+    body = run(fields=fields, max_points=100, method=method).json()
+    assert body["window_points"] == N and 2 < body["returned_points"] <= 100
+    # The ends of the window are always kept and the shared axis stays ordered
+    assert body["time"][0] == 0.0 and body["time"][-1] == N - 1
+    assert body["time"] == sorted(body["time"])
+    assert all(len(values) == body["returned_points"] for values in body["fields"].values())
+
+def test_small_window_is_returned_whole(run):
+    body = run(start=10, end=19, max_points=100).json()
+    assert body["returned_points"] == 10 and body["fields"]["wear"][0] == pytest.approx(0.1)
+
+def test_nan_samples_are_sent_as_null(run):
+    body = run(fields="max_temperature_C", start=395, end=415, max_points=1000).json()
+    values = dict(zip(body["time"], body["fields"]["max_temperature_C"]))
+    assert values[400.0] is None and values[409.0] is None and values[410.0] is not None
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsampling_survives_nan(method):
+    x = np.arange(N, dtype=np.float64)
+    y = np.sin(x / 50)
+    y[100:300] = np.nan
+    idx = timeseries.downsample(x, {"y": y}, 50, method)
+    assert idx[0] == 0 and idx[-1] == N - 1 and len(idx) <= 50
+    if method == "minmax":
+        # Extremes come from the finite samples, so the peaks are kept
+        assert np.nanmax(y[idx]) == pytest.approx(np.nanmax(y), abs=1e-3)
+        assert np.nanmin(y[idx]) == pytest.approx(np.nanmin(y), abs=1e-3)
+
+def test_all_nan_column():
+    x = np.arange(50, dtype=np.float64)
+    for method in ("lttb", "minmax"):
+        idx = timeseries.downsample(x, {"y": np.full(50, np.nan)}, 10, method)
+        assert idx[0] == 0 and idx[-1] == 49
+
+def test_unknown_field_is_400(run):
+    assert run(fields="nope").status_code == 400
+
+
+def test_save_results_splits_the_records_once(db, make_user, make_simulation, monkeypatch):
+    calls = []
+    split = results_store.to_columns
+    monkeypatch.setattr(results_store, "to_columns", lambda ts: calls.append(ts) or split(ts))
+    sim = make_simulation(make_user("owner@x.com"))
+    results_store.save_results(sim, {"time_series_data": [{"time_s": 0.0, "max_temperature_C": 50.0}]})
+    assert len(calls) == 1
+    assert results_store.load_timeseries(sim.timeseries_path)["max_temperature_C"].tolist() == [50.0]
@@ -0,0 +1,48 @@
+import os, threading, time
+import tool_storage
+
+
+def upload(client, headers, filename, content=b"solid geometry"):
+    response = client.post("/tools/", data={"name": filename}, files={"file": (filename, content)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def blob(tool_id, db):
+    import models
+    db.expire_all()
+    return db.get(models.Tool, tool_id).file_path
+
+
+def test_same_content_under_two_extensions_is_released_per_file(db, client, auth, make_user):
+    make_user("alice@x.com")
+    headers = auth("alice@x.com")
+    step, iges, step_again = upload(client, headers, "a.step"), upload(client, headers, "a.iges"), upload(client, headers, "b.step")
+    step_path, iges_path = blob(step["id"], db), blob(iges["id"], db)
+    assert step_path != iges_path and blob(step_again["id"], db) == step_path
+
+    assert client.delete(f"/tools/{iges['id']}", headers=headers).status_code == 204
+    assert not os.path.exists(iges_path) and os.path.exists(step_path)
+    assert client.delete(f"/tools/{step['id']}", headers=headers).status_code == 204
+    assert os.path.exists(step_path)
+    assert client.delete(f"/tools/{step_again['id']}", headers=headers).status_code == 204
+    assert not os.path.exists(step_path)
+
+def test_removal_waits_for_uploads_in_progress():
+    events = []
+    def remove():
+        with tool_storage.blob_lock(exclusive=True): events.append("removed")
+    with tool_storage.blob_lock():
+        thread = threading.Thread(target=remove); thread.start()
+        time.sleep(0.2)
+        events.append("uploaded")
+    thread.join(5)
+    assert events == ["uploaded", "removed"]
+
+def test_uploads_do_not_wait_for_each_other():
+    entered = threading.Event()
+    def upload():
+        with tool_storage.blob_lock(): entered.set()
+    with tool_storage.blob_lock():
+        thread = threading.Thread(target=upload); thread.start()
+        assert entered.wait(5)
+    thread.join(5)
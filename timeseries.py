@@ -0,0 +1,213 @@
+import math, warnings
+from typing import Optional
+import numpy as np
+
+# Candidate names for the engine's time axis, in order of preference
+TIME_FIELD_CANDIDATES = ("time_s", "time", "simulation_time_s", "t")
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def find_time_field(fields) -> Optional[str]:
+    fields = list(fields)
+    for name in TIME_FIELD_CANDIDATES:
+        if name in fields: return name
+    return next((f for f in fields if f.lower().startswith("time")), None)
+
+def window(time: np.ndarray, start: Optional[float] = None, end: Optional[float] = None) -> slice:
+    """Returns the slice of a (non-decreasing) time axis inside [start, end]."""
+    lo = 0 if start is None else int(np.searchsorted(time, start, side="left"))
+    hi = len(time) if end is None else int(np.searchsorted(time, end, side="right"))
+    return slice(lo, max(lo, hi))
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Indices of the min and max sample of each of `n_buckets` equal-width buckets,
+    plus the first and last sample. Fully vectorized via a padded (buckets, width) view.
+    """
+    n = len(y)
+    if n_buckets <= 0 or n <= 2 * n_buckets: return np.arange(n)
+    width = math.ceil(n / n_buckets)
+    padded = np.full(n_buckets * width, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(n_buckets, width)
+    nan = np.isnan(grid)
+    offsets = np.arange(n_buckets) * width
+    lo = np.where(nan, np.inf, grid).argmin(axis=1) + offsets
+    hi = np.where(nan, -np.inf, grid).argmax(axis=1) + offsets
+    idx = np.concatenate(([0, n - 1], lo, hi))
+    return np.unique(idx[idx < n])
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets selection of `n_out` indices. The per-bucket area
+    search is vectorized; only the (at most n_out) bucket steps run in Python.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    y = np.nan_to_num(y, nan=0.0)
+    # Bucket i covers [edges[i], edges[i+1]); the first and last samples are always kept
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:nhi].mean(), y[hi:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return np.unique(selected)
+
+def downsample(x: np.ndarray, columns: dict, max_points: int, method: str = "lttb") -> np.ndarray:
+    """
+    Picks a shared set of indices for all `columns` so that every field keeps its
+    shape on a common x axis. The budget of `max_points` is split across fields.
+    """
+    n = len(x)
+    if n <= max_points or not columns: return np.arange(n)
+    per_field = max(max_points // len(columns), 3)
+    parts = []
+    for y in columns.values():
+        if method == "minmax":
+            parts.append(minmax_indices(y, max(per_field // 2 - 1, 1)))
+        else:
+            parts.append(lttb_indices(x, y, per_field))
+    return np.unique(np.concatenate(parts))
+
+# --- Summaries (compact statistical description of a run, e.g. for the AI analysis prompt) ---
+
+def _r(v) -> Optional[float]:
+    # 4 significant digits keep summaries short without losing the shape
+    return None if v is None or not np.isfinite(v) else float(f"{float(v):.4g}")
+
+def _segment_sums(y: np.ndarray, edges: np.ndarray):
+    """Per-segment sums over finite samples, for segments starting at `edges[:-1]` (all segments at once)."""
+    finite = np.isfinite(y)
+    starts = edges[:-1]
+    count = np.add.reduceat(finite.astype(np.float64), starts)
+    total = np.add.reduceat(np.where(finite, y, 0.0), starts)
+    return finite, count, total
+
+def trend_segments(x: np.ndarray, y: np.ndarray, n_segments: int = 6) -> list[dict]:
+    """
+    Least-squares slope of y over x in `n_segments` equal-count segments, solved for
+    all segments at once from per-segment sums. `direction` is flat when the fitted
+    change over a segment is under 2% of the field's overall range.
+    """
+    n = len(y)
+    if n < 2: return []
+    edges = np.unique(np.linspace(0, n, min(n_segments, n // 2) + 1).astype(np.int64))
+    finite, c, sy = _segment_sums(y, edges)
+    xf = np.where(finite, x, 0.0)
+    sx = np.add.reduceat(xf, edges[:-1])
+    sxx = np.add.reduceat(xf * xf, edges[:-1])
+    sxy = np.add.reduceat(xf * np.where(finite, y, 0.0), edges[:-1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (c * sxy - sx * sy) / (c * sxx - sx * sx)
+        mean = sy / c
+    span = np.nanmax(y) - np.nanmin(y) if finite.any() else 0.0
+    segments = []
+    for i in range(len(edges) - 1):
+        lo, hi = edges[i], edges[i + 1] - 1
+        change = slope[i] * (x[hi] - x[lo]) if np.isfinite(slope[i]) else 0.0
+        direction = "flat" if not span or abs(change) < 0.02 * span else ("rising" if change > 0 else "falling")
+        segments.append({"start": _r(x[lo]), "end": _r(x[hi]), "mean": _r(mean[i]), "slope": _r(slope[i]), "direction": direction})
+    return segments
+
+def change_points(x: np.ndarray, y: np.ndarray, n_windows: int = 50, max_points: int = 3, threshold: float = 4.0, min_fraction: float = 0.05) -> list[dict]:
+    """
+    Abrupt level shifts: jumps between consecutive window means that stand out from
+    the typical jump by more than `threshold` robust deviations (median absolute deviation)
+    and move the level by at least `min_fraction` of the field's range.
+    """
+    n = len(y)
+    if n < 8: return []
+    edges = np.unique(np.linspace(0, n, min(n_windows, n // 4) + 1).astype(np.int64))
+    _, count, total = _segment_sums(y, edges)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = total / count
+    jumps = np.diff(means)
+    valid = np.isfinite(jumps)
+    if valid.sum() < 3: return []
+    typical = np.median(jumps[valid])
+    scale = 1.4826 * np.median(np.abs(jumps[valid] - typical)) or np.std(jumps[valid])
+    if not scale: return []
+    score = np.where(valid, np.abs(jumps - typical) / scale, 0.0)
+    score[np.abs(np.nan_to_num(jumps)) < min_fraction * (np.nanmax(y) - np.nanmin(y))] = 0.0
+    picks = [i for i in np.argsort(score)[::-1][:max_points] if score[i] > threshold]
+    return [
+        {"time": _r(x[edges[i + 1]]), "before": _r(means[i]), "after": _r(means[i + 1]), "score": _r(score[i])}
+        for i in sorted(picks)
+    ]
+
+def summarize(x: np.ndarray, columns: dict, time_field: Optional[str] = None) -> dict:
+    """Vectorized statistics, trend segments and change points for every numeric column."""
+    fields = {}
+    for name, y in columns.items():
+        y = np.asarray(y, dtype=np.float64)
+        finite = np.isfinite(y)
+        if not finite.any():
+            fields[name] = {"samples": 0}; continue
+        p05, p50, p95 = np.nanpercentile(y, [5, 50, 95])
+        first, last = y[finite][[0, -1]]
+        fields[name] = {
+            "min": _r(np.nanmin(y)), "max": _r(np.nanmax(y)), "mean": _r(np.nanmean(y)), "std": _r(np.nanstd(y)),
+            "p05": _r(p05), "p50": _r(p50), "p95": _r(p95), "first": _r(first), "last": _r(last),
+            "time_of_min": _r(x[np.nanargmin(y)]), "time_of_max": _r(x[np.nanargmax(y)]),
+            "trend": trend_segments(x, y),
+            "change_points": change_points(x, y),
+        }
+    return {
+        "points": int(len(x)),
+        "time": {"field": time_field, "start": _r(x[0]) if len(x) else None, "end": _r(x[-1]) if len(x) else None},
+        "fields": fields,
+    }
+
+# --- Alignment of several runs on a common time grid ---
+
+def common_grid(axes: list[np.ndarray], points: int, mode: str = "overlap") -> np.ndarray:
+    """Evenly spaced grid over the time range all runs share (overlap) or any run covers (union)."""
+    starts = [float(np.nanmin(x)) for x in axes if len(x)]
+    ends = [float(np.nanmax(x)) for x in axes if len(x)]
+    if not starts: return np.empty(0)
+    lo, hi = (max(starts), min(ends)) if mode == "overlap" else (min(starts), max(ends))
+    if hi < lo: return np.empty(0)
+    return np.linspace(lo, hi, points if hi > lo else 1)
+
+def resample(x: np.ndarray, y: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Linear interpolation of y(x) onto `grid`; NaN outside the run's own time range."""
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    if len(x) == 0: return np.full(len(grid), np.nan)
+    if np.any(np.diff(x) < 0):
+        order = np.argsort(x, kind="stable")
+        x, y = x[order], y[order]
+    return np.interp(grid, x, y, left=np.nan, right=np.nan)
+
+def compare_stats(matrix: np.ndarray, baseline: int = 0) -> dict:
+    """
+    Per-run statistics of an aligned (runs, points) matrix and of each run's delta to the
+    baseline run, all computed along axis 1 in one pass.
+    """
+    deltas = matrix - matrix[baseline]
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows just yield None
+        # Last finite value of each row (runs may end before the grid does)
+        finite = np.isfinite(matrix)
+        last_index = matrix.shape[1] - 1 - np.argmax(finite[:, ::-1], axis=1)
+        final = np.where(finite.any(axis=1), matrix[np.arange(len(matrix)), last_index], np.nan)
+        stats = {
+            "mean": np.nanmean(matrix, axis=1), "min": np.nanmin(matrix, axis=1),
+            "max": np.nanmax(matrix, axis=1), "final": final,
+        }
+        delta_stats = {
+            "mean": np.nanmean(deltas, axis=1), "mean_abs": np.nanmean(np.abs(deltas), axis=1),
+            "max_abs": np.nanmax(np.abs(deltas), axis=1), "rmse": np.sqrt(np.nanmean(deltas ** 2, axis=1)),
+        }
+    return {
+        "stats": [{k: _r(v[i]) for k, v in stats.items()} for i in range(len(matrix))],
+        "delta_stats": [{k: _r(v[i]) for k, v in delta_stats.items()} for i in range(len(matrix))],
+        "deltas": deltas,
+    }
@@ -0,0 +1,107 @@
+import hashlib, os, shutil, sys, uuid
+from contextlib import contextmanager
+from typing import BinaryIO
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: uploads and blob removal are not serialized
+    fcntl = None
+
+load_dotenv()
+
+# Content-addressed blob store: one file per distinct (SHA-256, extension), shared by all Tool rows
+TOOL_LIBRARY_DIR = os.getenv("TOOL_LIBRARY_DIR", "tool_library_files")
+TOOL_BLOB_DIR = os.path.join(TOOL_LIBRARY_DIR, "blobs")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _extension(filename: str) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if ext.replace(".", "").isalnum() else ""
+
+def blob_path(content_hash: str, filename: str) -> str:
+    return os.path.join(TOOL_BLOB_DIR, content_hash[:2], f"{content_hash}{_extension(filename)}")
+
+def store_upload(fileobj: BinaryIO, filename: str) -> tuple[str, str, int]:
+    """
+    Streams an upload to disk in chunks while hashing it, then moves it into the
+    blob store. If the same content is already stored the new copy is discarded.
+    Returns (file_path, sha256 hex digest, size in bytes).
+    """
+    os.makedirs(TOOL_BLOB_DIR, exist_ok=True)
+    tmp_path = os.path.join(TOOL_BLOB_DIR, f".upload-{uuid.uuid4().hex}")
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = fileobj.read(UPLOAD_CHUNK_SIZE)
+                if not chunk: break
+                digest.update(chunk); size += len(chunk)
+                out.write(chunk)
+        content_hash = digest.hexdigest()
+        path = blob_path(content_hash, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return path, content_hash, size
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copy-on-write clone (Linux FICLONE: btrfs, XFS, ...). Returns False when unsupported."""
+    if not sys.platform.startswith("linux"): return False
+    import fcntl
+    FICLONE = 0x40049409
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst): os.remove(dst)
+        return False
+
+def stage(src: str, dst: str) -> str:
+    """
+    Places a stored tool file into a run directory without copying its bytes when
+    possible: hardlink, then reflink, then a plain copy. Returns the method used.
+    The engine only reads the geometry, so sharing the inode is safe.
+    """
+    if os.path.exists(dst): os.remove(dst)
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if _reflink(src, dst): return "reflink"
+    shutil.copyfile(src, dst)
+    return "copy"
+
+@contextmanager
+def blob_lock(exclusive: bool = False):
+    """
+    Host-wide lock on the blob store (flock, so it covers threads and worker processes alike).
+    Uploads hold it shared from storing their blob until their Tool row is committed; removal
+    holds it exclusively from the reference count to the delete, so a blob an upload has just
+    found in the store is never removed under it. Never take it exclusively while holding it shared.
+    """
+    if fcntl is None:
+        yield; return
+    os.makedirs(TOOL_BLOB_DIR, exist_ok=True)
+    with open(os.path.join(TOOL_BLOB_DIR, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield  # closing the file releases the lock
+
+def remove_blob(path: str) -> None:
+    if path and os.path.exists(path):
+        os.remove(path)
@@ -1,7 +1,8 @@
-import subprocess, json, os, shutil
+import subprocess, json, os, shutil, datetime, time
 from celery import Celery
-from database import SessionLocal
-import models
+from database import SessionLocal, engine
+import models, progress_bus, memoization, engine_pool, engine_logs, scheduler, results_ingest, run_lifecycle, metrics
+from celery.signals import worker_init, worker_process_shutdown
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -21,9 +22,42 @@ celery = Celery(
 celery.conf.update(
     task_serializer='json',
     result_serializer='json',
-    accept_content=['json']
+    accept_content=['json'],
+    # --- Scheduling (see scheduler.py) ---
+    # Start with: celery -A worker.celery worker -Q admin,interactive,batch
+    task_default_queue=scheduler.QUEUE_INTERACTIVE,
+    broker_transport_options={
+        # Per-message priorities 0..9 (0 first) used for per-user fair share
+        "priority_steps": list(range(scheduler.PRIORITY_LEVELS)),
+        "sep": ":",
+        # Consume queues strictly in the -Q order instead of round-robin
+        "queue_order_strategy": "priority",
+        # Must exceed the engine timeout, or late-acked runs would be redelivered mid-run
+        "visibility_timeout": 2 * 3600,
+    },
+    worker_concurrency=scheduler.WORKER_CONCURRENCY,
+    # Hour-long runs: reserve one message at a time and acknowledge it when done,
+    # so a busy worker process never sits on queued jobs that an idle one could start
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
 )
 
+# Query timings of the worker's own database work (see metrics.py for how worker metrics are exported)
+metrics.instrument_engine(engine)
+
+@worker_init.connect
+def _label_worker_metrics(**kwargs):
+    # Runs in the worker's main process before the pool forks, so every worker process reports as "worker"
+    metrics.set_component("worker")
+
+# Engine image; part of every input fingerprint so an engine upgrade never reuses old results
+ENGINE_IMAGE = engine_pool.ENGINE_IMAGE
+
+@worker_process_shutdown.connect
+def _shutdown_engine_pool(**kwargs):
+    # Remove warm engine containers/processes owned by this worker process
+    engine_pool.shutdown_pool()
+
 @celery.task
 def run_simulation_task(simulation_id, run_dir):
     """
@@ -31,6 +65,8 @@ def run_simulation_task(simulation_id, run_dir):
     """
     # Create a new, independent database session for the worker
     db = SessionLocal()
+    db_simulation = None
+    task_start = time.perf_counter()
     
     try:
         # --- 1. Get Simulation & Update Status ---
@@ -40,27 +76,17 @@ def run_simulation_task(simulation_id, run_dir):
             return
 
         db_simulation.status = "RUNNING"
+        db_simulation.started_at = datetime.datetime.now()
         db.commit()
+        if db_simulation.queued_at:
+            metrics.WORKER_QUEUE_WAIT.labels(db_simulation.queue or "unknown").observe((db_simulation.started_at - db_simulation.queued_at).total_seconds())
+        progress_bus.publish(simulation_id, db_simulation.owner_id, "RUNNING")
 
-        # --- 2. Run Docker Container ---
-        docker_command = [
-            "docker", "run", "--rm",
-            "-v", f"{os.path.abspath(run_dir)}:/data",
-            "edgepredict-engine-v3", # Uses your latest engine
-            "/data/input.json"
-        ]
-
-        print(f"Running command: {' '.join(docker_command)}")
-        
-        process = subprocess.run(
-            docker_command, 
-            capture_output=True, 
-            text=True,
-            encoding='utf-8', 
-            errors='ignore',
-            cwd=os.path.abspath(run_dir),
-            timeout=3600
-        )
+        # --- 2. Run Engine (fresh container, warm container pool or local process; see engine_pool, which times it) ---
+        # Publish each new progress.json written by the engine while it runs
+        progress_file = os.path.join(run_dir, "progress.json")
+        with progress_bus.ProgressWatcher(simulation_id, db_simulation.owner_id, progress_file):
+            process = engine_pool.run_engine(run_dir, timeout=3600)
 
         # --- 3. Process Results ---
         if process.returncode == 0:
@@ -68,12 +94,11 @@ def run_simulation_task(simulation_id, run_dir):
             output_file_path = os.path.join(run_dir, "output.json")
             
             if os.path.exists(output_file_path):
-                with open(output_file_path, 'r') as f:
-                    results_json_string = f.read()
-                
-                db_simulation.status = "COMPLETED"
-                db_simulation.results = results_json_string
-                db.commit()
+                # Streamed: time series -> compressed columnar artifact in chunks, summary -> results column
+                with metrics.stage("result_ingest"):
+                    results_ingest.save_results_file(db_simulation, output_file_path)
+                    db_simulation.status = "COMPLETED"
+                    db.commit()
             else:
                 print(f"Error: output.json not found for simulation {simulation_id}.")
                 db_simulation.status = "FAILED"
@@ -85,11 +110,13 @@ def run_simulation_task(simulation_id, run_dir):
             print(f"STDOUT: {process.stdout}")
             print(f"STDERR: {process.stderr}")
             db_simulation.status = "FAILED"
+            # stdout/stderr are short excerpts; the full output is in the run's engine.log
             db_simulation.results = json.dumps({
                 "error": "Simulation engine failed to run.",
                 "returncode": process.returncode,
                 "stdout": process.stdout,
-                "stderr": process.stderr
+                "stderr": process.stderr,
+                "log": engine_logs.LOG_NAME
             })
             db.commit()
 
@@ -109,17 +136,50 @@ def run_simulation_task(simulation_id, run_dir):
             db.rollback()
             
     finally:
-        # --- 4. Clean up Run Directory (DISABLED FOR DEBUGGING) ---
-        if os.path.exists(run_dir):
-             db.refresh(db_simulation)
-             if db_simulation.status == "COMPLETED":
-                 # try:
-                 #     shutil.rmtree(run_dir)
-                 #     print(f"Cleaned up {run_dir}")
-                 # except Exception as e:
-                 #     print(f"Error cleaning up directory {run_dir}: {e}")
-                 print(f"DEBUG MODE: Keeping run directory {run_dir} for inspection.")
-             else:
-                 print(f"Keeping run directory {run_dir} for debugging (Status: {db_simulation.status})")
-        
+        if db_simulation is not None:
+            try:
+                db.refresh(db_simulation)
+                db_simulation.finished_at = datetime.datetime.now()
+                db.commit()
+                progress_bus.publish(simulation_id, db_simulation.owner_id, db_simulation.status)
+                # Settle identical submissions that joined this run instead of starting their own
+                for joined in memoization.finish_joined(db, db_simulation):
+                    progress_bus.publish(joined.id, joined.owner_id, joined.status)
+            except Exception as e:
+                print(f"Failed to publish final status for simulation {simulation_id}: {e}")
+
+        # --- 4. Record the run directory's size; run_lifecycle archives or removes it later ---
+        if db_simulation is not None and os.path.exists(run_dir):
+            try:
+                db_simulation.run_disk_bytes = run_lifecycle.dir_size(run_dir)
+                db.commit()
+                print(f"Keeping run directory {run_dir} until the lifecycle sweep (Status: {db_simulation.status})")
+            except Exception as e:
+                print(f"Failed to record run directory size for simulation {simulation_id}: {e}")
+                db.rollback()
+
+        if db_simulation is not None:
+            metrics.WORKER_STAGE_DURATION.labels("task").observe(time.perf_counter() - task_start)
+            metrics.WORKER_TASKS.labels(db_simulation.status or "UNKNOWN").inc()
+            metrics.push_worker_metrics()
+        db.close()
+
+# --- Run directory lifecycle (periodic; needs celery beat, e.g. `celery -A worker.celery worker -B`) ---
+celery.conf.beat_schedule = {
+    "sweep-run-directories": {
+        "task": "worker.sweep_run_directories",
+        "schedule": run_lifecycle.RUN_SWEEP_INTERVAL_SECONDS,
+        "options": {"queue": scheduler.QUEUE_ADMIN},
+    }
+}
+
+@celery.task
+def sweep_run_directories():
+    """Archives, removes and quota-checks run directories (see run_lifecycle)."""
+    db = SessionLocal()
+    try:
+        report = run_lifecycle.sweep(db)
+        print(f"Run lifecycle sweep: {report}")
+        return report
+    finally:
         db.close()